@@ -8,4 +8,5 @@ from __future__ import division, print_function, absolute_import
 from .transformers import *
 from .interpolators import *
 from .utils import dvf_show, dvf_opts
+from .samplers import AffineSampler, BSplineSampler, ElasticSampler
 from .config import DTYPE
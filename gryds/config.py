@@ -5,3 +5,16 @@
 
 import numpy
 DTYPE = numpy.float32
+
+# Default number of threads used for resampling and transforming points.
+WORKERS = 1
+
+
+def working_dtype(dtype):
+    """Returns the data type that data of the given type is processed in.
+    scipy.ndimage does not support half precision, so half-precision data is
+    stored as is, but interpolated in single precision."""
+    dtype = numpy.dtype(dtype)
+    if dtype.kind == 'f' and dtype.itemsize < 4:
+        return numpy.dtype(numpy.float32)
+    return dtype
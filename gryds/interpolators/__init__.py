@@ -5,10 +5,17 @@
 
 from __future__ import division, print_function, absolute_import
 
-from .grid import Grid
+from .grid import Grid, TransformedGrid
 from .bspline import BSplineInterpolator
 from .linear import LinearInterpolator
 from .color import MultiChannelInterpolator
+from .batch import BatchInterpolator
+from .plan import SamplingPlan
+
+try:
+	from .shared import SharedBatchInterpolator
+except ImportError:
+	pass
 
 try:
 	from .cuda import BSplineInterpolatorCuda
@@ -5,8 +5,12 @@
 
 from __future__ import division, print_function, absolute_import
 
-from .grid import Grid
-from ..config import DTYPE
+import numpy as np
+from .grid import Grid, TransformedGrid, chunk_regions, \
+    memory_chunk_shape, parallel_chunk_shape
+from ..config import DTYPE, working_dtype
+from .. import config
+from ..parallel import parallel_map
 
 
 class Interpolator(object):
@@ -16,15 +20,28 @@ class Interpolator(object):
     Attributes:
         self.image (np.ndarray): The wrapped ND image.
         self.grid (Grid): The image's default sampling grid.
+        self.dtype (type): The default data type of resampled images.
     """
 
-    def __init__(self, image):
+    # The default maximum number of bytes used for a chunk when transforming
+    # a memory-mapped image, or into a memory-mapped output.
+    memmap_memory = 2 ** 28
+
+    # The default maximum number of bytes used for a tile when resampling at
+    # a lazy TransformedGrid.
+    lazy_memory = 2 ** 26
+
+    def __init__(self, image, dtype=DTYPE):
         """
         Args:
             image (np.ndarray): An ND image array.
+            dtype (type): The default data type of resampled images. The
+                sampling grid has the same precision, except for half
+                precision output, which is sampled on a single-precision grid.
         """
         self.image = image
-        self.grid = Grid(shape=self.image.shape)
+        self.dtype = dtype
+        self.grid = Grid(shape=self.image.shape, dtype=working_dtype(dtype))
 
     def __repr__(self):
         return '{}({}D)'.format(self.__class__.__name__, self.image.ndim)
@@ -39,7 +56,118 @@ class Interpolator(object):
     def resample(self, points, **kwargs):
         raise NotImplementedError()
 
+    def plan(self, *transforms, **kwargs):
+        raise NotImplementedError()
+
+    def _resample_to(self, grid, out, **kwargs):
+        """Resamples the image at a grid and writes the result to out.
+        Interpolators that can sample into an existing array override this
+        method to avoid a temporary copy."""
+        out[...] = self.resample(grid, **kwargs)
+        return out
+
+    def _resample_lazy(self, grid, **kwargs):
+        """
+        Resamples the image at a lazy TransformedGrid one tile at a time: the
+        points of a tile are computed, sampled, and released before the next
+        tile, so the transformed grid is never held in memory at once.
+
+        Args:
+            grid (TransformedGrid): The lazy grid.
+            workers (int): The number of threads that process tiles in
+                parallel. Default is config.WORKERS.
+            out (np.array): An array of the grid's shape the result is
+                written to. By default a new array is allocated.
+            dtype (type): The data type of the resampled image if out is not
+                given. Default is self.dtype.
+            **kwargs (dict): Redirected to the resample() method.
+        Returns:
+            np.array: The resampled image at the grid.
+        """
+        workers = kwargs.pop('workers', None)
+        out = kwargs.pop('out', None)
+        dtype = kwargs.pop('dtype', None)
+        if workers is None:
+            workers = config.WORKERS
+        if out is None:
+            out = np.empty(grid.shape, dtype=dtype or self.dtype)
+        chunk_shape = memory_chunk_shape(
+            grid.shape, self.lazy_memory, self._bytes_per_point())
+
+        def resample_region(region):
+            self._resample_to(Grid._wrap(grid.points(region)), out[region],
+                              **kwargs)
+
+        parallel_map(resample_region, chunk_regions(grid.shape, chunk_shape),
+                     workers=workers)
+        return out
+
+    def _bytes_per_point(self):
+        """Estimate of the peak number of bytes used per output point while
+        transforming: the grid's points, the transformed and rescaled points,
+        and the sampled values."""
+        return 4 * self.image.ndim * np.dtype(self.grid.dtype).itemsize + 12
+
     def transform(self, *transforms, **kwargs):
-        transformed_grid = self.grid.transform(*transforms)
-        new_image = self.resample(transformed_grid, **kwargs)
-        return new_image.astype(DTYPE)
+        """
+        Transforms the image by transforming the original image's grid and
+        resampling the image at the transformed grid.
+
+        Args:
+            *transforms (list): A list of Transform objects.
+            chunk_shape (iterable): If given, the output is generated,
+                transformed, and sampled one chunk of this shape at a time.
+            max_memory (int): If given (and chunk_shape is not), chunks are
+                chosen such that roughly at most this number of bytes is used
+                for a chunk. Default is self.memmap_memory if the image or out
+                is a np.memmap, so volumes larger than memory are transformed
+                one tile at a time.
+            workers (int): The number of threads that process chunks in
+                parallel. Default is config.WORKERS. If more than one worker
+                is used and no chunks are defined, the first axis is split
+                into chunks.
+            out (np.array): An array of the grid's shape the result is
+                written to. By default a new array is allocated.
+            dtype (type): The data type of the transformed image, and (except
+                for half precision) of the transformed grid. Default is the
+                data type of out if it is given, and self.dtype otherwise.
+            **kwargs (dict): Redirected to the resample() method.
+        Returns:
+            np.array: The transformed image.
+        """
+        chunk_shape = kwargs.pop('chunk_shape', None)
+        max_memory = kwargs.pop('max_memory', None)
+        workers = kwargs.pop('workers', None)
+        out = kwargs.pop('out', None)
+        dtype = kwargs.pop('dtype', None)
+        if dtype is None:
+            dtype = self.dtype if out is None else out.dtype
+        grid = self.grid.astype(working_dtype(dtype))
+        if workers is None:
+            workers = config.WORKERS
+        if chunk_shape is None and max_memory is None and (
+                isinstance(self.image, np.memmap) or
+                isinstance(out, np.memmap)):
+            max_memory = self.memmap_memory
+        if chunk_shape is None and max_memory is not None:
+            chunk_shape = memory_chunk_shape(
+                grid.shape, max_memory, self._bytes_per_point())
+        if chunk_shape is None and workers > 1:
+            chunk_shape = parallel_chunk_shape(grid.shape, workers)
+
+        new_image = out
+        if new_image is None:
+            new_image = np.empty(grid.shape, dtype=dtype)
+
+        if chunk_shape is None:
+            transformed_grid = grid.transform(*transforms)
+            return self._resample_to(transformed_grid, new_image, **kwargs)
+
+        def transform_region(region):
+            transformed_grid = grid.region(region).transform(*transforms)
+            self._resample_to(transformed_grid, new_image[region], **kwargs)
+
+        parallel_map(transform_region,
+                     chunk_regions(grid.shape, chunk_shape),
+                     workers=workers)
+        return new_image
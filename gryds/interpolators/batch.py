@@ -0,0 +1,112 @@
+#! /usr/bin/env python
+#
+# Transform a batch of images, each with its own transformation, in one call
+
+
+from __future__ import division, print_function, absolute_import
+
+import numpy as np
+from ..config import DTYPE, working_dtype
+from ..parallel import parallel_map
+from .grid import Grid
+from .bspline import BSplineInterpolator, voxel_matrix, _chain_matrix
+
+
+class BatchInterpolator(object):
+    """Wrapper for an interpolator that is applied to each image in a batch
+    of images of the same shape. All images share one sampling grid, and the
+    matrices of affine transformations are converted to voxel coordinates for
+    the whole batch at once.
+
+    Attributes:
+        images (np.ndarray): The wrapped B x N1 x ... x Nndim image batch.
+        grid (Grid): The images' default sampling grid.
+        interpolators (list): An interpolator for every image.
+        dtype (type): The default data type of the transformed images.
+    """
+
+    def __init__(self, images, interpolator=BSplineInterpolator, **kwargs):
+        """
+        Args:
+            images (np.array): A B x N1 x ... x Nndim array of B images.
+            interpolator (Interpolator): The interpolator that will be applied.
+            **kwargs (dict): Options for the wrapped Interpolator class.
+        """
+        self.images = images
+        self.interpolators = [interpolator(image, **kwargs)
+                              for image in images]
+        self.dtype = kwargs.get('dtype', DTYPE)
+        self.grid = Grid(shape=self.images.shape[1:],
+                         dtype=working_dtype(self.dtype))
+        for x in self.interpolators:
+            x.grid = self.grid
+
+    def __repr__(self):
+        return '{}({}D, {})'.format(
+            self.__class__.__name__, self.images.ndim - 1, len(self))
+
+    def __len__(self):
+        return len(self.interpolators)
+
+    @property
+    def shape(self):
+        return self.images.shape
+
+    def transform(self, transformations, **kwargs):
+        """
+        Transforms every image in the batch with its own transformation.
+
+        Args:
+            transformations (list): A list of B Transform objects, or of B
+                lists of Transform objects that are applied in sequence.
+            workers (int): The number of threads that process images in
+                parallel. Default is config.WORKERS.
+            dtype (type): The data type of the transformed images. Default is
+                the data type of the wrapped interpolators.
+            **kwargs (dict): Redirected to the wrapped Interpolator's
+                transform() method.
+        Raises:
+            ValueError: If the number of transformations does not match the
+                number of images.
+        Returns:
+            np.array: The B x N1 x ... x Nndim batch of transformed images.
+        """
+        if len(transformations) != len(self):
+            raise ValueError(
+                'Number of transformations ({}) does not match the number of '
+                'images ({}).'.format(len(transformations), len(self)))
+        workers = kwargs.pop('workers', None)
+        dtype = kwargs.pop('dtype', None) or self.dtype
+        chains = [tuple(x) if isinstance(x, (list, tuple)) else (x,)
+                  for x in transformations]
+
+        # Convert the matrices of all affine chains to voxel coordinates at
+        # once.
+        ndim = self.images.ndim - 1
+        matrices = [_chain_matrix(chain, ndim) for chain in chains]
+        affine = [i for i, (matrix, interpolator) in enumerate(
+            zip(matrices, self.interpolators))
+            if matrix is not None and
+            getattr(interpolator, '_affine_fast_path', False) and
+            not isinstance(interpolator.image, np.memmap)]
+        voxel_matrices = {}
+        if affine:
+            stacked = voxel_matrix(np.array([matrices[i] for i in affine]),
+                                   self.grid.shape)
+            voxel_matrices = dict(zip(affine, stacked))
+
+        new_images = np.empty(self.images.shape, dtype=dtype)
+        sampling_options = dict(
+            (x, kwargs[x]) for x in ('mode', 'order', 'cval') if x in kwargs)
+
+        def transform_image(i):
+            if i in voxel_matrices:
+                self.interpolators[i]._transform_affine(
+                    voxel_matrices[i], workers=1, out=new_images[i],
+                    **sampling_options)
+            else:
+                self.interpolators[i].transform(
+                    *chains[i], workers=1, out=new_images[i], **kwargs)
+
+        parallel_map(transform_image, range(len(self)), workers=workers)
+        return new_images
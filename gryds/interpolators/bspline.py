@@ -5,10 +5,15 @@
 
 from __future__ import division, print_function, absolute_import
 
+import numpy as np
 import scipy.ndimage as nd
-from ..config import DTYPE
-from .grid import Grid
+from ..config import DTYPE, working_dtype
+from .. import config
+from .. import timing
+from ..parallel import parallel_map
+from .grid import Grid, TransformedGrid, chunk_regions, parallel_chunk_shape
 from .base import Interpolator
+from .plan import SamplingPlan
 
 
 class BSplineInterpolator(Interpolator):
@@ -21,9 +26,31 @@ class BSplineInterpolator(Interpolator):
         default_mode (str): Determines how edges are treated.
         default_order (int): B-Spline order.
         default_cval (numeric): Constant value for mode='constant'.
+        dtype (type): The default data type of resampled images.
     """
 
-    def __init__(self, image, mode='constant', order=3, cval=0):
+    # Modes for which scipy pads the image before spline filtering, and the
+    # amount of padding it uses. See scipy.ndimage.map_coordinates.
+    _padded_modes = ('nearest', 'grid-constant')
+    _npad = 12
+
+    # Whether transform() may use scipy.ndimage.affine_transform when all
+    # transformations are affine.
+    _affine_fast_path = True
+
+    # Modes for which points outside the image can sample any voxel along an
+    # axis, so the whole axis is read from memory-mapped images.
+    _wrapping_modes = ('mirror', 'reflect', 'wrap', 'grid-mirror',
+                       'grid-wrap')
+
+    # The number of voxels a region read from a memory-mapped image extends
+    # beyond the points sampled in it. The influence of voxels on the
+    # B-spline coefficients decays exponentially with their distance, by at
+    # most a factor 0.43 per voxel up to order 5, so the coefficients of a
+    # region match those of the whole image to single precision.
+    _region_margin = 20
+
+    def __init__(self, image, mode='constant', order=3, cval=0, dtype=DTYPE):
         """
         Args:
             image (np.array): An image array.
@@ -36,15 +63,83 @@ class BSplineInterpolator(Interpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'.
+            dtype (type): The default data type of resampled images. Use
+                np.float16 to halve the memory of large outputs, or np.float64
+                to sample on a double-precision grid.
         """
         super(BSplineInterpolator, self).__init__(
-            image
+            image, dtype=dtype
         )
         self.default_mode = mode
         self.default_order = order
         self.default_cval = cval
+        self._coefficients = {}
+
+    def __getstate__(self):
+        # The cached coefficients are as large as the image, and are
+        # recomputed after unpickling.
+        state = self.__dict__.copy()
+        state['_coefficients'] = {}
+        return state
+
+    def clear_cache(self):
+        """Removes the cached B-spline coefficients. Call this method after
+        modifying the wrapped image in place."""
+        self._coefficients = {}
+
+    def _options(self, mode, order, cval):
+        """Returns the sampling options, replacing unset options by the
+        interpolator's defaults."""
+        new_mode = mode if mode else self.default_mode
+        new_order = order if order else self.default_order
+        new_cval = cval if cval else self.default_cval
+        return new_mode, new_order, new_cval
+
+    def _spline_coefficients(self, order, mode, cval):
+        """
+        Returns the prefiltered B-spline coefficients of the image for the
+        given order and mode, computing them once and caching them on the
+        interpolator. For orders 0 and 1, the image itself is returned.
 
-    def sample(self, points, mode=None, order=None, cval=None):
+        Args:
+            order (int): The order of the B-spline.
+            mode (str): How edges of image domain should be treated.
+            cval (numeric): Constant value for mode='grid-constant'.
+        Returns:
+            tuple: The coefficient array and the padding (in voxels) that was
+                added to every side of the image before filtering.
+        """
+        # Orders 0 and 1 need no prefilter, so the image is sampled as is,
+        # without keeping a copy. scipy.ndimage cannot read half precision,
+        # so those images are converted on every call instead.
+        if order <= 1:
+            return self.image.astype(working_dtype(self.image.dtype),
+                                     copy=False), 0
+
+        key = (order, mode, cval) if mode == 'grid-constant' else (order, mode)
+        if key not in self._coefficients:
+            npad = self._npad if mode in self._padded_modes else 0
+            padded_size = int(np.prod([x + 2 * npad
+                                       for x in self.image.shape]))
+            with timing.stage('prefilter', points=padded_size,
+                              nbytes=padded_size * 8):
+                # Half-precision images are interpolated in single precision.
+                image = self.image.astype(working_dtype(self.image.dtype),
+                                          copy=False)
+                if npad and mode == 'grid-constant':
+                    padded = np.pad(image, npad, mode='constant',
+                                    constant_values=cval)
+                elif npad:
+                    padded = np.pad(image, npad, mode='edge')
+                else:
+                    padded = image
+                coefficients = nd.spline_filter(
+                    padded, order=order, output=np.float64, mode=mode)
+            self._coefficients[key] = (coefficients, npad)
+        return self._coefficients[key]
+
+    def sample(self, points, mode=None, order=None, cval=None, out=None,
+               dtype=None):
         """
         Samples the image at given points.
 
@@ -59,24 +154,97 @@ class BSplineInterpolator(Interpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            out (np.array): An array the intensities are written to. By
+                default a new array is allocated.
+            dtype (type): The data type of the intensities if out is not
+                given. Default is self.dtype.
         Returns:
             np.array: N-shaped array of intensities at the points.
         """
-        new_mode = mode if mode else self.default_mode
-        new_order = order if order else self.default_order
-        new_cval = cval if cval else self.default_cval
+        new_mode, new_order, new_cval = self._options(mode, order, cval)
+        if isinstance(self.image, np.memmap):
+            return self._sample_region(points, new_mode, new_order, new_cval,
+                                       out=out, dtype=dtype)
+
+        coefficients, npad = self._spline_coefficients(
+            new_order, new_mode, new_cval)
+        points = np.asarray(points)
+        points = points.astype(working_dtype(points.dtype), copy=False)
+        if npad:
+            points = points + npad
+        if out is None:
+            out = np.empty(points.shape[1:], dtype=dtype or self.dtype)
+
+        # scipy.ndimage cannot write half precision, so those samples are
+        # converted afterwards.
+        output = out if out.dtype == working_dtype(out.dtype) else \
+            working_dtype(out.dtype)
+        with timing.stage('map_coordinates', points=out.size,
+                          nbytes=0 if output is out else
+                          out.size * np.dtype(output).itemsize):
+            sample = nd.map_coordinates(input=coefficients,
+                                        coordinates=points,
+                                        output=output,
+                                        mode=new_mode,
+                                        order=new_order,
+                                        cval=new_cval,
+                                        prefilter=False)
+        if sample is not out:
+            with timing.stage('cast', points=out.size, nbytes=0):
+                out[...] = sample
+        return out
+
+    def _sample_region(self, points, mode, order, cval, out=None, dtype=None):
+        """
+        Samples a memory-mapped image at given points, reading only the
+        region of the image around the points instead of the whole image.
+
+        Args:
+            points (np.array): An ndim x N1 x ... array of points.
+            mode (str): How edges of image domain should be treated.
+            order (int): The order of the B-spline.
+            cval (numeric): Constant value for mode='constant'.
+            out (np.array): An array the intensities are written to. By
+                default a new array is allocated.
+            dtype (type): The data type of the intensities if out is not
+                given. Default is self.dtype.
+        Returns:
+            np.array: The intensities at the points.
+        """
+        points = np.asarray(points)
+        points = points.astype(working_dtype(points.dtype), copy=False)
+        margin = self._region_margin if order > 1 else 1
+        flat = points.reshape(len(points), -1)
+
+        region = []
+        for coordinates, size in zip(flat, self.image.shape):
+            low = np.floor(coordinates.min()) if coordinates.size else 0
+            high = np.ceil(coordinates.max()) if coordinates.size else 0
+            if mode in self._wrapping_modes and (low < 0 or high > size - 1):
+                region.append(slice(0, size))
+                continue
+            start = int(min(max(low - margin, 0), size - 1))
+            stop = int(max(min(high + margin + 1, size), start + 1))
+            region.append(slice(start, stop))
+        region = tuple(region)
 
-        sample = nd.map_coordinates(input=self.image,
-                           coordinates=points,
-                           mode=new_mode,
-                           order=new_order,
-                           cval=new_cval)
-        return sample.astype(DTYPE)
+        origin = np.array([x.start for x in region], dtype=points.dtype)
+        local = BSplineInterpolator(np.asarray(self.image[region]), mode=mode,
+                                    order=order, cval=cval, dtype=self.dtype)
+        return local.sample(
+            points - origin.reshape((-1,) + (1,) * (points.ndim - 1)),
+            out=out, dtype=dtype)
 
-    def resample(self, grid, mode=None, order=None, cval=None):
+    def resample(self, grid, mode=None, order=None, cval=None, out=None,
+                 dtype=None, workers=None):
         """
         Reamples the image at a given grid.
 
+        A lazy TransformedGrid is evaluated only here: if it is an affine
+        transform of the image's own grid, the coordinates are computed on
+        the fly by the affine path of transform(), otherwise the grid is
+        evaluated and sampled one tile at a time.
+
         Args:
             grid (Grid): The new grid.
             order (int): The order of the B-spline. Default is 3. Use 0 for
@@ -88,15 +256,84 @@ class BSplineInterpolator(Interpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            out (np.array): An array of the grid's shape the result is written
+                to. By default a new array is allocated.
+            dtype (type): The data type of the resampled image if out is not
+                given. Default is self.dtype.
+            workers (int): The number of threads that process tiles of a lazy
+                grid in parallel. Default is config.WORKERS.
         Returns:
             np.array: The resampled image at the new grid.
         """
+        if isinstance(grid, TransformedGrid) and grid._grid is None:
+            return self._resample_lazy(grid, mode=mode, order=order,
+                                       cval=cval, out=out, dtype=dtype,
+                                       workers=workers)
         rescaled_grid = grid.scaled_to(self.image.shape)
-        new_image = self.sample(rescaled_grid.grid,
-                                mode=mode,
-                                order=order,
-                                cval=cval)
-        return new_image.astype(DTYPE)
+        return self.sample(rescaled_grid.grid,
+                           mode=mode,
+                           order=order,
+                           cval=cval,
+                           out=out,
+                           dtype=dtype)
+
+    def _resample_to(self, grid, out, **kwargs):
+        return self.resample(grid, out=out, **kwargs)
+
+    def _resample_lazy(self, grid, **kwargs):
+        mapped = isinstance(self.image, np.memmap)
+        source = grid.source
+        if self._affine_fast_path and not mapped and \
+                source._grid is None and source.shape == self.image.shape and \
+                all(np.array_equal(x, y)
+                    for x, y in zip(source.axes, self.grid.axes)):
+            matrix = _chain_matrix(grid.transforms, self.image.ndim)
+            if matrix is not None:
+                return self._transform_affine(
+                    voxel_matrix(matrix, self.image.shape),
+                    mode=kwargs.get('mode'), order=kwargs.get('order'),
+                    cval=kwargs.get('cval'), workers=kwargs.get('workers'),
+                    out=kwargs.get('out'), dtype=kwargs.get('dtype'))
+
+        # Compute the coefficients before any tiles are processed in
+        # parallel.
+        if not mapped:
+            new_mode, new_order, new_cval = self._options(
+                kwargs.get('mode'), kwargs.get('order'), kwargs.get('cval'))
+            self._spline_coefficients(new_order, new_mode, new_cval)
+        return super(BSplineInterpolator, self)._resample_lazy(grid, **kwargs)
+
+    def _bytes_per_point(self):
+        # Memory-mapped images are read and filtered region by region, which
+        # adds the region and its coefficients in double precision.
+        nbytes = super(BSplineInterpolator, self)._bytes_per_point()
+        if isinstance(self.image, np.memmap):
+            nbytes += 8 + 2 * self.image.dtype.itemsize
+        return nbytes
+
+    def plan(self, *transforms, **kwargs):
+        """
+        Precomputes the interpolation indices and weights for transforming
+        images of this image's shape, e.g. an image's label map or mask.
+
+        Args:
+            *transforms (list): A list of Transform objects.
+            order (int): The order of the B-spline. Default is 3. Use 0 for
+                binary images. Use 1 for normal linear interpolation.
+            mode (str): How edges of image domain should be treated when
+                transformed. One of BSplineStencil.supported_modes.
+            cval (numeric): Constant value for mode='constant'
+        Raises:
+            ValueError: If the mode is not supported by sampling plans.
+        Returns:
+            SamplingPlan: A plan that transforms an image with apply().
+        """
+        mode, order, cval = self._options(
+            kwargs.get('mode'), kwargs.get('order'), kwargs.get('cval'))
+        transformed_grid = self.grid.transform(*transforms)
+        points = transformed_grid.scaled_to(self.image.shape).grid
+        return SamplingPlan(points, self.image.shape, order=order, mode=mode,
+                            cval=cval, dtype=self.dtype)
 
     def transform(self, *transforms, **kwargs):
         """
@@ -114,14 +351,152 @@ class BSplineInterpolator(Interpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            chunk_shape (iterable): If given, the output is generated,
+                transformed, and sampled one chunk of this shape at a time.
+            max_memory (int): If given (and chunk_shape is not), chunks are
+                chosen such that roughly at most this number of bytes is used
+                for a chunk.
+            workers (int): The number of threads that process chunks in
+                parallel. Default is config.WORKERS.
+            out (np.array): An array of the image's shape the result is
+                written to. By default a new array is allocated.
+            dtype (type): The data type of the transformed image. Default is
+                the data type of out if it is given, and self.dtype otherwise.
         Returns:
             np.array: The transformed image.
         """
         mode = kwargs['mode'] if 'mode' in kwargs else None
         order = kwargs['order'] if 'order' in kwargs else None
         cval = kwargs['cval'] if 'cval' in kwargs else None
+        workers = kwargs['workers'] if 'workers' in kwargs else None
+        out = kwargs['out'] if 'out' in kwargs else None
+        dtype = kwargs['dtype'] if 'dtype' in kwargs else None
 
-        transformed_grid = self.grid.transform(*transforms)
-        new_grid = self.resample(transformed_grid,
-                                 mode=mode, order=order, cval=cval)
-        return new_grid.astype(DTYPE)
+        # The affine path computes coordinates on the fly and only allocates
+        # the output, so it does not need chunking.
+        # Memory-mapped images are sampled region by region instead.
+        mapped = isinstance(self.image, np.memmap)
+        matrix = _chain_matrix(transforms, self.image.ndim)
+        if matrix is not None and self._affine_fast_path and not mapped:
+            matrix = voxel_matrix(matrix, self.image.shape)
+            return self._transform_affine(matrix, mode=mode, order=order,
+                                          cval=cval, workers=workers, out=out,
+                                          dtype=dtype)
+
+        # Compute the coefficients before any chunks are processed in
+        # parallel.
+        new_mode, new_order, new_cval = self._options(mode, order, cval)
+        if not mapped:
+            self._spline_coefficients(new_order, new_mode, new_cval)
+        return super(BSplineInterpolator, self).transform(
+            *transforms, mode=mode, order=order, cval=cval,
+            chunk_shape=kwargs.get('chunk_shape'),
+            max_memory=kwargs.get('max_memory'), workers=workers, out=out,
+            dtype=dtype)
+
+    def _transform_affine(self, matrix, mode=None, order=None, cval=None,
+                          workers=None, out=None, dtype=None):
+        """
+        Transforms the image with an affine transformation, computing the
+        sampling coordinates on the fly with scipy.ndimage.affine_transform.
+
+        Args:
+            matrix (np.array): An (ndim + 1) x (ndim + 1) augmented matrix in
+                voxel coordinates (see voxel_matrix()).
+            order (int): The order of the B-spline.
+            mode (str): How edges of image domain should be treated.
+            cval (numeric): Constant value for mode='constant'
+            workers (int): The number of threads that process slabs of the
+                output in parallel. Default is config.WORKERS.
+            out (np.array): An array of the image's shape the result is
+                written to. By default a new array is allocated.
+            dtype (type): The data type of the transformed image if out is
+                not given. Default is self.dtype.
+        Returns:
+            np.array: The transformed image.
+        """
+        new_mode, new_order, new_cval = self._options(mode, order, cval)
+        coefficients, npad = self._spline_coefficients(
+            new_order, new_mode, new_cval)
+        if workers is None:
+            workers = config.WORKERS
+
+        voxel_matrix = np.array(matrix, dtype=np.float64)
+        voxel_matrix[:-1, -1] += npad
+
+        if out is None:
+            out = np.empty(self.image.shape, dtype=dtype or self.dtype)
+        new_image = out
+        output_dtype = working_dtype(new_image.dtype)
+
+        def transform_slab(region):
+            # Shift the matrix such that the slab's first voxel maps to the
+            # right input coordinate.
+            start = np.array([x.start for x in region] + [1.])
+            slab_matrix = voxel_matrix.copy()
+            slab_matrix[:-1, -1] = np.dot(voxel_matrix[:-1], start)
+            # scipy.ndimage cannot write half precision, so those slabs are
+            # converted afterwards.
+            output = new_image[region]
+            converted = output.dtype != output_dtype
+            if converted:
+                output = np.empty(output.shape, dtype=output_dtype)
+            with timing.stage('affine_transform', points=output.size,
+                              nbytes=output.nbytes if converted else 0):
+                nd.affine_transform(coefficients, slab_matrix,
+                                    output=output,
+                                    mode=new_mode,
+                                    order=new_order,
+                                    cval=new_cval,
+                                    prefilter=False)
+            if converted:
+                with timing.stage('cast', points=output.size, nbytes=0):
+                    new_image[region] = output
+
+        parallel_map(transform_slab,
+                     chunk_regions(self.image.shape, parallel_chunk_shape(
+                         self.image.shape, workers)),
+                     workers=workers)
+        return new_image
+
+
+def _chain_matrix(transforms, ndim):
+    """
+    Multiplies the augmented matrices of a chain of transformations.
+
+    Args:
+        transforms (list): A list of Transform objects, in the order they
+            are applied to a grid.
+        ndim (int): The number of dimensions of the grid.
+    Returns:
+        np.array: The (ndim + 1) x (ndim + 1) augmented matrix of the chain,
+            or None if any transformation in the chain is not affine.
+    """
+    if not transforms:
+        return None
+    matrix = np.eye(ndim + 1)
+    for transform in transforms:
+        if transform.ndim != ndim:
+            return None
+        transform_matrix = transform.augmented_matrix()
+        if transform_matrix is None:
+            return None
+        matrix = np.dot(transform_matrix, matrix)
+    return matrix
+
+
+def voxel_matrix(matrix, shape):
+    """
+    Converts augmented matrices in relative coordinates to voxel coordinates.
+    The grid's relative coordinates are voxel coordinates divided by the
+    image shape, so the matrices are conjugated with the scaling.
+
+    Args:
+        matrix (np.array): An (ndim + 1) x (ndim + 1) augmented matrix, or a
+            stack of them with shape B x (ndim + 1) x (ndim + 1).
+        shape (iterable): The shape of the image.
+    Returns:
+        np.array: The matrix or matrices in voxel coordinates.
+    """
+    scaling = np.append(np.array(shape, dtype=np.float64), 1.)
+    return np.asarray(matrix) * scaling[:, None] / scaling[None, :]
@@ -6,9 +6,14 @@
 from __future__ import division, print_function, absolute_import
 
 import numpy as np
-from ..config import DTYPE
-from .grid import Grid
+import scipy.ndimage as nd
+from ..config import working_dtype
+from .. import config
+from ..parallel import parallel_map
+from ..stencil import BSplineStencil, interpolate
+from .grid import Grid, TransformedGrid, chunk_regions, memory_chunk_shape
 from .bspline import BSplineInterpolator
+from .. import timing
 
 
 class MultiChannelInterpolator:
@@ -23,6 +28,10 @@ class MultiChannelInterpolator:
         default_cval (numeric): Constant value for mode='constant'.
     """
 
+    # The default maximum number of bytes used for a tile when resampling at
+    # a lazy TransformedGrid.
+    lazy_memory = 2 ** 26
+
     def __init__(self, image, interpolator=BSplineInterpolator,
                  data_format='channels_last', cval=None, **kwargs):
         """
@@ -41,6 +50,7 @@ class MultiChannelInterpolator:
         """        
         self.image = image
         self.data_format = data_format
+        self._coefficients = {}
 
         self.nchan = image.shape[-1] if data_format == 'channels_last' \
             else image.shape[0]
@@ -84,9 +94,87 @@ class MultiChannelInterpolator:
     def shape(self):
         return self.image.shape
 
+    def clear_cache(self):
+        """Removes the cached B-spline coefficients. Call this method after
+        modifying the wrapped image in place."""
+        self._coefficients = {}
+        for x in self.interpolators:
+            if hasattr(x, 'clear_cache'):
+                x.clear_cache()
+
+    def _coefficient_table(self, order, mode):
+        """
+        Returns the prefiltered B-spline coefficients of all channels as one
+        M x nchan table, computing it once per order and mode. The table has
+        the wider of the image's and the samples' working data types, so
+        double-precision images are interpolated in double precision, like
+        BSplineInterpolator does.
+        """
+        key = (order, mode)
+        if key not in self._coefficients:
+            image = self.image
+            dtype = np.promote_types(
+                working_dtype(image.dtype),
+                working_dtype(self.interpolators[0].dtype))
+            with timing.stage('prefilter', points=image.size // self.nchan,
+                              nbytes=image.size * np.dtype(dtype).itemsize):
+                if self.data_format == 'channels_first':
+                    image = np.moveaxis(image, 0, -1)
+                if order > 1:
+                    for axis in range(image.ndim - 1):
+                        image = nd.spline_filter1d(
+                            image, order, axis=axis, output=np.float64,
+                            mode=mode)
+                self._coefficients[key] = np.ascontiguousarray(
+                    image.reshape(-1, self.nchan), dtype=dtype)
+        return self._coefficients[key]
+
+    def _sample_single_pass(self, points, cvals, mode=None, order=None):
+        """
+        Samples all channels of the image at given points with a single
+        B-spline stencil, if the wrapped interpolator and mode allow it.
+
+        Returns:
+            np.array: The samples, or None if the channels should be sampled
+                one by one.
+        """
+        if type(self.interpolators[0]) is not BSplineInterpolator:
+            return None
+        new_mode, new_order, _ = self.interpolators[0]._options(
+            mode, order, None)
+        if new_mode not in BSplineStencil.supported_modes:
+            return None
+        cvals = [cval if cval else x.default_cval
+                 for cval, x in zip(cvals, self.interpolators)]
+
+        points = np.asarray(points)
+        table = self._coefficient_table(new_order, new_mode)
+        npoints = points[0].size
+
+        # The samples are written into a buffer of the data format, which for
+        # channels_first is a transposed view of the N x nchan result.
+        if self.data_format == 'channels_first':
+            samples = np.empty((self.nchan,) + points.shape[1:],
+                               dtype=self.interpolators[0].dtype)
+            out = samples.reshape(self.nchan, -1).T
+        else:
+            samples = np.empty(points.shape[1:] + (self.nchan,),
+                               dtype=self.interpolators[0].dtype)
+            out = samples.reshape(-1, self.nchan)
+        with timing.stage('sample', points=npoints,
+                          nbytes=samples.nbytes):
+            interpolate(
+                table, self.interpolators[0].image.shape,
+                points.reshape(len(points), -1), order=new_order,
+                mode=new_mode, cval=np.array(cvals, dtype=table.dtype),
+                dtype=table.dtype, out=out)
+        return samples
+
     def sample(self, points, **kwargs):
         """
-        Samples the image at given points.
+        Samples the image at given points. For B-spline interpolation, all
+        channels are sampled in a single pass that shares the interpolation
+        indices and weights.
 
         Args:
             points (np.array): An N x ndims array of points.
@@ -96,6 +184,10 @@ class MultiChannelInterpolator:
                 at the points (depending on data_format).
         """
         cvals = kwargs.pop('cval', self.nchan * [0])
+        if set(kwargs) <= set(['mode', 'order']):
+            samples = self._sample_single_pass(points, cvals, **kwargs)
+            if samples is not None:
+                return samples
 
         if self.data_format == 'channels_last':
             return np.rollaxis(np.array([
@@ -108,18 +200,63 @@ class MultiChannelInterpolator:
 
     def resample(self, grid, **kwargs):
         """
-        Reamples the image at a given grid.
+        Reamples the image at a given grid. A lazy TransformedGrid is
+        evaluated and sampled one tile at a time.
 
         Args:
             grid (Grid): The new grid.
+            workers (int): The number of threads that process tiles of a lazy
+                grid in parallel. Default is config.WORKERS.
             **kwargs (dict): redirected to wrapped Interpolator's resample() method
         Returns:
             np.array: The resampled image at the new grid.
         """
+        if isinstance(grid, TransformedGrid) and grid._grid is None:
+            return self._resample_lazy(grid, **kwargs)
+        kwargs.pop('workers', None)
         rescaled_grid = grid.scaled_to(self.interpolators[0].image.shape)
         return self.sample(rescaled_grid.grid,
                            **kwargs)
 
+    def _resample_lazy(self, grid, **kwargs):
+        """
+        Resamples the image at a lazy TransformedGrid one tile at a time, like
+        Interpolator._resample_lazy() does for single-channel images.
+
+        Args:
+            grid (TransformedGrid): The lazy grid.
+            workers (int): The number of threads that process tiles in
+                parallel. Default is config.WORKERS.
+            **kwargs (dict): Redirected to the resample() method.
+        Returns:
+            np.array: The resampled image at the grid.
+        """
+        workers = kwargs.pop('workers', None)
+        if workers is None:
+            workers = config.WORKERS
+        dtype = self.interpolators[0].dtype
+        channels_last = self.data_format == 'channels_last'
+        shape = grid.shape + (self.nchan,) if channels_last else \
+            (self.nchan,) + grid.shape
+        out = np.empty(shape, dtype=dtype)
+
+        # Per point: the tile's points, their rescaled copy, and the samples
+        # of all channels in double and in the output precision.
+        bytes_per_point = 4 * grid.ndim * np.dtype(grid.dtype).itemsize + \
+            self.nchan * (8 + np.dtype(dtype).itemsize)
+        chunk_shape = memory_chunk_shape(grid.shape, self.lazy_memory,
+                                         bytes_per_point)
+
+        def resample_region(region):
+            index = tuple(region) + (slice(None),) if channels_last else \
+                (slice(None),) + tuple(region)
+            out[index] = self.resample(Grid._wrap(grid.points(region)),
+                                       **kwargs)
+
+        parallel_map(resample_region, chunk_regions(grid.shape, chunk_shape),
+                     workers=workers)
+        return out
+
     def transform(self, *transforms, **kwargs):
         """
         Transforms the image by transforming the original image's grid and
@@ -25,9 +25,13 @@ class BSplineInterpolatorCuda(BSplineInterpolator):
         default_order (int): B-Spline order. Currently, only 0 and 1 are
             supported.
         default_cval (numeric): Constant value for mode='constant'.
+        dtype (type): The default data type of resampled images.
     """
 
-    def __init__(self, image, mode='constant', order=1, cval=0):
+    # Sampling always happens on the GPU through sample().
+    _affine_fast_path = False
+
+    def __init__(self, image, mode='constant', order=1, cval=0, dtype=DTYPE):
         """
         Args:
             image (np.array): An image array.
@@ -40,12 +44,14 @@ class BSplineInterpolatorCuda(BSplineInterpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'.
+            dtype (type): The default data type of resampled images.
         """
         super(BSplineInterpolatorCuda, self).__init__(
-            image, mode=mode, order=order, cval=cval
+            image, mode=mode, order=order, cval=cval, dtype=dtype
         )
 
-    def sample(self, points, mode=None, order=None, cval=None):
+    def sample(self, points, mode=None, order=None, cval=None, out=None,
+               dtype=None):
         """
         Samples the image at given points.
 
@@ -60,6 +66,10 @@ class BSplineInterpolatorCuda(BSplineInterpolator):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            out (np.array): An array the intensities are written to. By
+                default a new array is allocated.
+            dtype (type): The data type of the intensities if out is not
+                given. Default is self.dtype.
         Returns:
             np.array: N-shaped array of intensities at the points.
         """
@@ -79,5 +89,8 @@ class BSplineInterpolatorCuda(BSplineInterpolator):
         # Convert back to CPU array and reshape to original shape
         sample_cpu = cp.asnumpy(sample_gpu)
         sample = sample_cpu.transpose().reshape(points.shape[1:])
-        return np.array(sample.astype(DTYPE))
+        if out is not None:
+            out[...] = sample
+            return out
+        return np.array(sample.astype(dtype or self.dtype))
 
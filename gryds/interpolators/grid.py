@@ -5,40 +5,156 @@
 
 from __future__ import division, print_function, absolute_import
 
+import itertools
 import numpy as np
 from ..config import DTYPE
+from ..parallel import parallel_map
+from .. import timing
+from ..transformers.composed import ComposedTransformation
+from ..transformers.linear import LinearTransformation
 
 
 class Grid(object):
     """Sampling grid that can be transformed.
 
+    A grid defined by its shape is regular, and is stored implicitly by the
+    coordinates along each of its axes. Its dense representation is only
+    built when the grid attribute is accessed.
+
     Attributes:
         self.grid (nd.array): The grid as an ndim x Ni x Nj x ... x Nndim array
+        self.axes (list): For a regular grid, the coordinates along each axis.
+            None for other grids.
+        self.dtype (type): The data type of the grid's points.
     """
 
-    def __init__(self, shape=None, grid=None):
+    # The default maximum number of bytes used for a chunk when computing
+    # Jacobian determinants.
+    jacobian_memory = 2 ** 26
+
+    def __init__(self, shape=None, grid=None, axes=None, dtype=DTYPE):
         """
         Args:
             shape (iterable): an interable of length ndim for the shape of the
                 grid.
             grid (np.ndarray): a pre-defined grid as an ndim x Ni x Nj x ... x Nndim array
+            axes (list): a pre-defined regular grid as a list of ndim 1D
+                arrays with the coordinates along each axis.
+            dtype (type): the data type of the grid's points. Transforming
+                the grid transforms its points in this precision.
 
         Raises:
-            ValueError: when neither the shape or the grid are defined.
-        """
-        if grid is not None and shape is None:
-            self.grid = grid.astype(DTYPE)
-        elif shape is not None and grid is None:
-            self.grid = np.array(np.meshgrid(
-                *[np.arange(d) / d for d in shape],
-                indexing='ij'
-            ), dtype=DTYPE)
-        else:
+            ValueError: when not exactly one of the shape, grid, or axes are
+                defined.
+        """
+        if sum(x is not None for x in (shape, grid, axes)) != 1:
             raise ValueError('Either the shape or the grid parameters should be defined')
 
+        self.dtype = dtype
+        if grid is not None:
+            self._grid = grid.astype(dtype)
+            self.axes = None
+        elif shape is not None:
+            self._grid = None
+            self.axes = [np.arange(d) / d for d in shape]
+        else:
+            self._grid = None
+            self.axes = [np.asarray(x) for x in axes]
+
+    @classmethod
+    def _wrap(cls, grid):
+        """Creates a grid that holds the given points without copying them."""
+        new_grid_instance = cls.__new__(cls)
+        new_grid_instance._grid = np.asarray(grid)
+        new_grid_instance.axes = None
+        new_grid_instance.dtype = new_grid_instance._grid.dtype.type
+        return new_grid_instance
+
+    def __getstate__(self):
+        # A materialized regular grid is rebuilt from its axes on demand, so
+        # the dense points are not pickled.
+        state = self.__dict__.copy()
+        if self.axes is not None:
+            state['_grid'] = None
+        return state
+
     def __repr__(self):
-        return '{}({}D, {})'.format(self.__class__.__name__, self.grid.shape[0],
-            'x'.join([str(x) for x in self.grid.shape[1:]]))
+        return '{}({}D, {})'.format(self.__class__.__name__, self.ndim,
+            'x'.join([str(x) for x in self.shape]))
+
+    @property
+    def grid(self):
+        if self._grid is None:
+            self._grid = self.points()
+        return self._grid
+
+    @property
+    def ndim(self):
+        if self.axes is not None:
+            return len(self.axes)
+        return self._grid.shape[0]
+
+    @property
+    def shape(self):
+        if self.axes is not None:
+            return tuple(len(x) for x in self.axes)
+        return self._grid.shape[1:]
+
+    def points(self, region=None):
+        """
+        Returns the coordinates of (a region of) the grid. For a regular grid
+        that has not been materialized, only the requested region is built.
+
+        Args:
+            region (tuple): A tuple of ndim slices. Default is the whole grid.
+        Returns:
+            np.array: An ndim x Ni x ... x Nndim array of the points in the
+                region.
+        """
+        if region is None:
+            region = self.ndim * (slice(None),)
+        if self._grid is not None:
+            return self._grid[(slice(None),) + tuple(region)]
+        axes = [x[r] for x, r in zip(self.axes, region)]
+        points = int(np.prod([len(x) for x in axes]))
+        with timing.stage('grid', points=points, nbytes=points * self.ndim *
+                          np.dtype(self.dtype).itemsize):
+            return np.array(np.meshgrid(*axes, indexing='ij'),
+                            dtype=self.dtype)
+
+    def region(self, region):
+        """
+        Returns a region of the grid as a new grid. A region of a regular grid
+        is again a regular grid, so no points are materialized.
+
+        Args:
+            region (tuple): A tuple of ndim slices.
+        Returns:
+            Grid: The points of the grid in the region.
+        """
+        if self._grid is None:
+            return Grid(axes=[x[r] for x, r in zip(self.axes, region)],
+                        dtype=self.dtype)
+        return Grid._wrap(self.points(region))
+
+    def astype(self, dtype):
+        """
+        Returns the grid with its points in another precision. A regular grid
+        that has not been materialized is converted without building it.
+
+        Args:
+            dtype (type): The data type of the new grid's points.
+        Returns:
+            Grid: The grid in the given precision, or the grid itself if it
+                already has this precision.
+        """
+        if np.dtype(dtype) == np.dtype(self.dtype):
+            return self
+        if self._grid is None:
+            return Grid(axes=self.axes, dtype=dtype)
+        with timing.stage('cast', points=self._grid[0].size,
+                          nbytes=self._grid.size * np.dtype(dtype).itemsize):
+            return Grid._wrap(self._grid.astype(dtype))
 
     def scaled_to(self, size):
         """
@@ -53,43 +169,208 @@ class Grid(object):
         Returns:
             Grid: A scaled version of the grid.
         """
-        if len(size) != len(self.grid):
+        if len(size) != self.ndim:
             raise ValueError(
                 'Number of dimensions in size ({}) and grid ({}), do not'
                 ' match'.format(
-                    len(size), len(self.grid))
+                    len(size), self.ndim)
             )
         size = np.array(size)
 
-        new_grid_instance = Grid(grid=np.array(
-            [x * y for x, y in zip(size, self.grid)], dtype=DTYPE
-        ))
-        return new_grid_instance
+        if self._grid is None:
+            return Grid(axes=[
+                np.array(x, dtype=self.dtype) * y
+                for x, y in zip(self.axes, size)
+            ], dtype=self.dtype)
 
-    def transform(self, *transforms):
+        scaling = np.array(size, dtype=self.dtype).reshape(
+            (self.ndim,) + self.ndim * (1,))
+        grid = self.grid
+        with timing.stage('scaled_to', points=grid[0].size,
+                          nbytes=grid.nbytes):
+            return Grid._wrap(np.multiply(grid, scaling))
+
+    def transform(self, *transforms, **kwargs):
         """
         Transform the grid with a one or multiple transforms.
 
         Args:
             transforms (*list): A list of Transform objects.
+            lazy (bool): If True, the transforms are not applied yet, but
+                recorded in a TransformedGrid, which is evaluated when its
+                points are needed. Resampling an image at a lazy grid
+                evaluates it one tile at a time. Default is False.
         Returns:
             Grid: a new grid instance with a transformed version of the points.
         """
-        org_shape = self.grid.shape
-        new_grid = self.grid.copy()
+        if kwargs.get('lazy', False):
+            return TransformedGrid(self, transforms)
+        if self.axes is not None and not transforms:
+            return Grid(axes=self.axes, dtype=self.dtype)
 
-        for transform in transforms:
-            rshp_grid = new_grid.reshape(self.grid.shape[0], -1)
-            new_grid = transform(rshp_grid)
+        org_shape = (self.ndim,) + self.shape
+        points = int(np.prod(self.shape))
 
-        new_grid_instance = Grid(grid=new_grid.reshape(org_shape))
+        with timing.stage('grid_transform', points=points, nbytes=points *
+                          self.ndim * np.dtype(self.dtype).itemsize *
+                          max(min(len(transforms), 2), 1)):
+            # On a regular grid, the first transform can exploit the grid's
+            # separable structure.
+            if self.axes is not None and transforms:
+                new_grid = transforms[0].transform_axes(self.axes,
+                                                        dtype=self.dtype)
+                transforms = transforms[1:]
+                owned = True
+            else:
+                new_grid = self.grid
+                owned = False
+            new_grid = new_grid.reshape(self.ndim, -1)
 
-        return new_grid_instance
+            # Every transform writes into the buffer that was read by the
+            # previous transform, so at most two buffers are allocated.
+            spare = None
+            for transform in transforms:
+                if spare is None:
+                    spare = np.empty(new_grid.shape, dtype=self.dtype)
+                new_grid, spare = transform(new_grid, out=spare), \
+                    (new_grid if owned else None)
+                owned = True
+
+            if not owned:
+                new_grid = new_grid.copy()
+        return Grid._wrap(new_grid.reshape(org_shape))
+
+    # The factors tried, from coarse to fine, when transform_coarse() is
+    # given an error tolerance.
+    coarse_factors = (16, 8, 4, 2)
+
+    def transform_coarse(self, *transforms, **kwargs):
+        """
+        Approximately transforms a regular grid: the transforms are evaluated
+        on a coarser grid, and the transformed points are upsampled with
+        linear interpolation. For smooth transformations this reduces the
+        cost of evaluating the chain by the product of the factors.
+
+        The approximation error is estimated at the centers of the coarse
+        grid's cells, where linear interpolation is least accurate, by
+        evaluating the transforms there as well. Along axes without gaps
+        between the coarse grid's points, the centers are taken at the
+        points themselves.
+
+        Args:
+            transforms (*list): A list of Transform objects.
+            factor (int or iterable): The coarse grid has every factor-th
+                point of the grid (and its last point) along every axis, or
+                along each axis for an iterable of ndim factors.
+            tol (float): If given (and factor is not), the largest factor
+                of self.coarse_factors with an estimated error of at most tol
+                voxels is used. If no factor is accurate enough, the grid is
+                transformed exactly.
+        Raises:
+            ValueError: If the grid is not regular, or if neither factor nor
+                tol is given.
+        Returns:
+            tuple: The transformed Grid, and the estimated maximum error in
+                voxels of the grid's shape.
+        """
+        factor = kwargs.pop('factor', None)
+        tol = kwargs.pop('tol', None)
+        if self.axes is None:
+            raise ValueError('Only regular grids can be transformed on a '
+                             'coarser grid.')
+        if factor is None and tol is None:
+            raise ValueError('Either the factor or tol should be defined.')
+        if factor is not None:
+            coarse, knots, error = self._coarse_transform(transforms, factor)
+        else:
+            # The error of linear interpolation grows quadratically with the
+            # factor, so factors that are predicted to be too coarse from an
+            # earlier estimate are skipped.
+            error = None
+            for factor in self.coarse_factors:
+                if error is not None and \
+                        error * (factor / previous) ** 2 > tol:
+                    continue
+                coarse, knots, error = self._coarse_transform(transforms,
+                                                              factor)
+                previous = factor
+                if error <= tol:
+                    break
+            else:
+                return self.transform(*transforms), 0.
+
+        new_grid = _upsample(coarse, knots, [np.arange(x) for x in self.shape])
+        return Grid._wrap(new_grid), error
+
+    def _coarse_transform(self, transforms, factor):
+        """Transforms the grid's points on a coarse grid with the given
+        factor. Returns the transformed coarse grid's points, the indices of
+        the coarse grid's points along every axis, and the estimated error of
+        upsampling them."""
+        factors = np.broadcast_to(np.asarray(factor, dtype=np.intp),
+                                  (self.ndim,))
+        knots = []
+        centers = []
+        for size, step in zip(self.shape, factors):
+            axis_knots = np.arange(0, size, max(step, 1))
+            if axis_knots[-1] != size - 1:
+                axis_knots = np.append(axis_knots, size - 1)
+            knots.append(axis_knots)
+            # The error is estimated between knots along axes that have gaps,
+            # and at the knots along axes that are sampled at every point
+            # (e.g. thin axes, or a factor of 1), where upsampling is exact.
+            gaps = np.diff(axis_knots) > 1
+            if gaps.any():
+                centers.append(
+                    (axis_knots[:-1][gaps] + axis_knots[1:][gaps]) // 2)
+            else:
+                centers.append(axis_knots)
+
+        coarse = Grid(axes=[x[k] for x, k in zip(self.axes, knots)],
+                      dtype=self.dtype).transform(*transforms).grid
+
+        exact = Grid(axes=[x[c] for x, c in zip(self.axes, centers)],
+                     dtype=self.dtype).transform(*transforms).grid
+        difference = np.abs(_upsample(coarse, knots, centers) - exact)
+        scaling = np.array(self.shape, dtype=np.float64).reshape(
+            (self.ndim,) + self.ndim * (1,))
+        error = float((difference * scaling).max())
+        return coarse, knots, error
+
+    def displacement(self, *transforms):
+        """
+        Evaluates a chain of transforms once into a dense displacement field
+        on the grid, in voxels of the grid's shape. Applying the field with a
+        DisplacementFieldTransformation costs one gather per point instead of
+        evaluating the whole chain again, e.g. for every modality of an image
+        or every epoch.
+
+        Args:
+            transforms (*list): A list of Transform objects.
+        Returns:
+            np.array: The ndim x Na x Nb x ... x ND array of displacements in
+                voxels.
+        """
+        displacement = self.transform(*transforms).grid
+        scaling = np.array(self.shape, dtype=displacement.dtype)
+        if self.axes is None:
+            displacement -= self.grid
+        for axis in range(self.ndim):
+            if self.axes is not None:
+                shape = [1] * self.ndim
+                shape[axis] = -1
+                displacement[axis] -= np.asarray(
+                    self.axes[axis], dtype=self.dtype).reshape(shape)
+            displacement[axis] *= scaling[axis]
+        return displacement
 
     def jacobian(self, *transforms):
         """
         Calculate the Jacobian for the points on the grid after the transforms
-        have been applied.
+        have been applied. The Jacobian is expressed in voxels of the grid's
+        shape. If all transforms have an analytic Jacobian it is evaluated
+        exactly, otherwise it is estimated with finite differences between
+        neighbouring grid points.
 
         Args:
             transforms (*list): A list of Transform objects.
@@ -97,35 +378,385 @@ class Grid(object):
             np.array: An array of the size of the grid with the Jacobian
                 vectors, (i.e. ndim x Na x Nb x ... x ND)
         """
-        diff_grid = self.transform(*transforms).scaled_to(self.grid.shape[1:]).grid
-        # scaled_grid = new_grid.scaled_to(self.grid.shape[1:])
+        jacobian = self._voxel_jacobian(transforms, self.shape)
+        if jacobian is not None:
+            return jacobian
+
+        diff_grid = self.transform(*transforms).scaled_to(self.shape).grid
+        # scaled_grid = new_grid.scaled_to(self.shape)
         jacobian = np.zeros(
-            (self.grid.shape[0], self.grid.shape[0]) + self.grid.shape[1:]
+            (self.ndim, self.ndim) + self.shape
         )
         for i in range(jacobian.shape[0]):
             for j in range(jacobian.shape[1]):
-                padding = self.grid.shape[0] * [(0, 0)]
+                padding = self.ndim * [(0, 0)]
                 padding[j] = (0, 1)
                 jacobian[i, j] = np.pad(
                     np.diff(diff_grid[i], axis=j),
                     padding, mode='edge')
 
-        return jacobian.astype(DTYPE)
+        return jacobian.astype(self.dtype)
+
+    def _voxel_jacobian(self, transforms, shape):
+        """Returns the analytic Jacobian of a chain of transforms on the grid
+        in voxels of the given shape, or None if it is not available."""
+        if not transforms:
+            return None
+        composed = ComposedTransformation(*transforms, dtype=self.dtype)
+        if self.axes is not None:
+            jacobian = composed.jacobian_axes(self.axes, dtype=self.dtype)
+        else:
+            jacobian = composed.jacobian(self.grid.reshape(self.ndim, -1),
+                                         dtype=self.dtype)
+        if jacobian is None:
+            return None
+        jacobian = jacobian.reshape((self.ndim, self.ndim) + self.shape)
+
+        # Convert from relative coordinates to voxels.
+        scaling = np.array(shape, dtype=np.float64)
+        scaling = (scaling[:, None] / scaling[None, :]).reshape(
+            (self.ndim, self.ndim) + self.ndim * (1,))
+        return np.multiply(jacobian, scaling.astype(self.dtype),
+                           dtype=self.dtype)
+
+    def _determinant_chunks(self, transforms, chunk_shape=None,
+                            max_memory=None):
+        """
+        Returns the regions in which the Jacobian determinant is computed,
+        and a function that computes it in a region. If a transform has no
+        analytic Jacobian, the whole grid is a single region, because finite
+        differences need the neighbouring grid points.
+        """
+        # A single grid point is enough to find out if the Jacobian is
+        # analytic.
+        point = self.region(self.ndim * (slice(0, 1),))
+        if point._voxel_jacobian(transforms, self.shape) is None:
+            whole = self.ndim * (slice(None),)
+            return [whole], lambda region: determinant(
+                self.jacobian(*transforms))
+
+        if chunk_shape is None:
+            chunk_shape = memory_chunk_shape(
+                self.shape, max_memory or self.jacobian_memory,
+                4 * self.ndim ** 2 * np.dtype(np.float64).itemsize)
+
+        def region_determinant(region):
+            return determinant(self.region(region)._voxel_jacobian(
+                transforms, self.shape))
+
+        return list(chunk_regions(self.shape, chunk_shape)), \
+            region_determinant
 
-    def jacobian_det(self, *transforms):
+    def jacobian_det(self, *transforms, **kwargs):
         """
         Calculate the Jacobian determinant for the points on the grid after the
-         transforms have been applied.
+         transforms have been applied. The determinant is computed in closed
+         form, one chunk of the grid at a time, so the full Jacobian is never
+         stored.
 
         Args:
             *transforms (list): A list of Transform objects.
+            chunk_shape (iterable): If given, the determinant is computed one
+                chunk of this shape at a time.
+            max_memory (int): If given (and chunk_shape is not), chunks are
+                chosen such that roughly at most this number of bytes is used
+                for a chunk. Default is Grid.jacobian_memory.
+            workers (int): The number of threads that process chunks in
+                parallel. Default is config.WORKERS.
         Returns:
             np.array: An array of the size of the grid with the Jacobian
                 determinant, (i.e. Na x ... x ND)
         """
-        jac = self.jacobian(*transforms)
-        jac = np.transpose(jac, list(range(2, jac.ndim)) + [0, 1])
+        regions, region_determinant = self._determinant_chunks(
+            transforms, kwargs.get('chunk_shape'), kwargs.get('max_memory'))
+        jacdet = np.empty(self.shape, dtype=self.dtype)
 
-        jacdet = np.linalg.det(jac)
+        def determinant_region(region):
+            jacdet[region] = region_determinant(region)
 
-        return jacdet.astype(DTYPE)
+        parallel_map(determinant_region, regions,
+                     workers=kwargs.get('workers'))
+        return jacdet
+
+    def jacobian_det_stats(self, *transforms, **kwargs):
+        """
+        Calculate summary statistics of the Jacobian determinant for the
+        points on the grid after the transforms have been applied, without
+        storing the determinant of the whole grid.
+
+        Args:
+            *transforms (list): A list of Transform objects.
+            bins (int or np.array): If given, a histogram of the determinant
+                with this number of bins, or with these bin edges, is
+                computed.
+            hist_range (tuple): The lower and upper edge of the histogram if
+                bins is a number. Default is (0, 2).
+            chunk_shape (iterable): If given, the determinant is computed one
+                chunk of this shape at a time.
+            max_memory (int): If given (and chunk_shape is not), chunks are
+                chosen such that roughly at most this number of bytes is used
+                for a chunk. Default is Grid.jacobian_memory.
+            workers (int): The number of threads that process chunks in
+                parallel. Default is config.WORKERS.
+        Returns:
+            dict: The minimum ('min') and maximum ('max') determinant, the
+                fraction of folded points with a determinant <= 0
+                ('folded'), and if bins is given, the histogram counts and
+                bin edges ('histogram').
+        """
+        bins = kwargs.get('bins')
+        if bins is not None:
+            bins = np.histogram_bin_edges(
+                [], bins=bins, range=kwargs.get('hist_range', (0, 2)))
+        regions, region_determinant = self._determinant_chunks(
+            transforms, kwargs.get('chunk_shape'), kwargs.get('max_memory'))
+
+        def region_stats(region):
+            jacdet = region_determinant(region)
+            counts = None
+            if bins is not None:
+                counts = np.histogram(jacdet, bins=bins)[0]
+            return jacdet.min(), jacdet.max(), \
+                np.count_nonzero(jacdet <= 0), counts
+
+        stats = parallel_map(region_stats, regions,
+                             workers=kwargs.get('workers'))
+        result = {
+            'min': min(x[0] for x in stats),
+            'max': max(x[1] for x in stats),
+            'folded': sum(x[2] for x in stats) / np.prod(self.shape),
+        }
+        if bins is not None:
+            result['histogram'] = (sum(x[3] for x in stats), bins)
+        return result
+
+    def has_folds(self, *transforms, **kwargs):
+        """
+        Checks if the transforms fold the grid, i.e. if the Jacobian
+        determinant is <= 0 anywhere. The check stops at the first chunk
+        that contains a fold.
+
+        Args:
+            *transforms (list): A list of Transform objects.
+            chunk_shape (iterable): If given, the determinant is computed one
+                chunk of this shape at a time.
+            max_memory (int): If given (and chunk_shape is not), chunks are
+                chosen such that roughly at most this number of bytes is used
+                for a chunk. Default is Grid.jacobian_memory.
+        Returns:
+            bool: Whether any point of the grid is folded.
+        """
+        regions, region_determinant = self._determinant_chunks(
+            transforms, kwargs.get('chunk_shape'), kwargs.get('max_memory'))
+        return any(np.any(region_determinant(region) <= 0)
+                   for region in regions)
+
+
+class TransformedGrid(Grid):
+    """A lazily transformed grid: a source grid and the chain of transforms
+    that is applied to it. The points are only computed when they are
+    accessed, and a region of the grid only computes the points in that
+    region, so the grid can be evaluated (and resampled) one tile at a time.
+    Consecutive affine transforms in the chain are fused.
+
+    Attributes:
+        source (Grid): The grid the transforms are applied to.
+        transforms (tuple): The chain of Transform objects.
+        self.grid (nd.array): The evaluated grid as an ndim x Ni x Nj x ... x
+            Nndim array. It is computed and kept on first access.
+        self.axes (list): Always None.
+        self.dtype (type): The data type of the grid's points.
+    """
+
+    def __init__(self, source, transforms):
+        """
+        Args:
+            source (Grid): The grid the transforms are applied to.
+            transforms (iterable): The chain of Transform objects.
+        """
+        self.source = source
+        self.transforms = tuple(transforms)
+        self.axes = None
+        self.dtype = source.dtype
+        self._grid = None
+        self._composed = None
+        if self.transforms:
+            self._composed = ComposedTransformation(*self.transforms,
+                                                    dtype=self.dtype)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_grid'] = None
+        return state
+
+    def __repr__(self):
+        return '{}({}D, {}, {} transforms)'.format(
+            self.__class__.__name__, self.ndim,
+            'x'.join([str(x) for x in self.shape]), len(self.transforms))
+
+    @property
+    def ndim(self):
+        return self.source.ndim
+
+    @property
+    def shape(self):
+        return self.source.shape
+
+    def points(self, region=None):
+        if self._grid is not None:
+            return super(TransformedGrid, self).points(region)
+        source = self.source if region is None else \
+            self.source.region(region)
+        if self._composed is None:
+            return source.points()
+        return source.transform(self._composed).grid
+
+    def region(self, region):
+        if self._grid is not None:
+            return super(TransformedGrid, self).region(region)
+        return TransformedGrid(self.source.region(region), self.transforms)
+
+    def astype(self, dtype):
+        if np.dtype(dtype) == np.dtype(self.dtype):
+            return self
+        return TransformedGrid(self.source.astype(dtype), self.transforms)
+
+    def scaled_to(self, size):
+        if len(size) != self.ndim:
+            raise ValueError(
+                'Number of dimensions in size ({}) and grid ({}), do not'
+                ' match'.format(
+                    len(size), self.ndim)
+            )
+        # Scaling is a linear transform at the end of the chain, where it is
+        # fused with a trailing affine transform.
+        matrix = np.zeros((self.ndim, self.ndim + 1))
+        matrix[:, :-1] = np.diag(size)
+        return TransformedGrid(self.source, self.transforms + (
+            LinearTransformation(matrix, dtype=self.dtype),))
+
+    def transform(self, *transforms, **kwargs):
+        if kwargs.get('lazy', False):
+            return TransformedGrid(self.source, self.transforms + transforms)
+        return self.source.transform(*(self.transforms + transforms))
+
+
+def determinant(matrices):
+    """
+    Computes the determinants of a stack of small matrices. For 1D, 2D and 3D
+    the determinant is computed in closed form, without moving the matrix
+    axes to the end like np.linalg.det requires.
+
+    Args:
+        matrices (np.array): An ndim x ndim x N1 x ... x Nk array of
+            matrices.
+    Returns:
+        np.array: The N1 x ... x Nk array of determinants.
+    """
+    m = matrices
+    ndim = len(m)
+    if ndim == 1:
+        return m[0, 0].copy()
+    if ndim == 2:
+        result = m[0, 0] * m[1, 1]
+        result -= m[0, 1] * m[1, 0]
+        return result
+    if ndim == 3:
+        minor = m[1, 1] * m[2, 2]
+        minor -= m[1, 2] * m[2, 1]
+        result = m[0, 0] * minor
+        np.multiply(m[1, 2], m[2, 0], out=minor)
+        minor -= m[1, 0] * m[2, 2]
+        result += m[0, 1] * minor
+        np.multiply(m[1, 0], m[2, 1], out=minor)
+        minor -= m[1, 1] * m[2, 0]
+        result += m[0, 2] * minor
+        return result
+    return np.linalg.det(np.moveaxis(m, (0, 1), (-2, -1)))
+
+
+def _upsample(values, knots, targets):
+    """
+    Interpolates values given at the knots of a regular grid linearly at
+    other indices, one axis at a time.
+
+    Args:
+        values (np.array): An ndim x K1 x ... x Kndim array of values at the
+            knots.
+        knots (list): For every axis, the increasing indices of the knots.
+        targets (list): For every axis, the indices to interpolate at.
+    Returns:
+        np.array: The ndim x T1 x ... x Tndim array of interpolated values.
+    """
+    for axis, (axis_knots, axis_targets) in enumerate(zip(knots, targets)):
+        if len(axis_knots) == 1:
+            values = np.take(values, np.zeros(len(axis_targets), np.intp),
+                             axis=axis + 1)
+            continue
+        left = np.clip(np.searchsorted(axis_knots, axis_targets,
+                                       side='right') - 1,
+                       0, len(axis_knots) - 2)
+        weight = (axis_targets - axis_knots[left]) / np.diff(axis_knots)[left]
+        shape = [1] * values.ndim
+        shape[axis + 1] = -1
+        weight = weight.astype(values.dtype).reshape(shape)
+        upper = np.take(values, left + 1, axis=axis + 1)
+        values = np.take(values, left, axis=axis + 1)
+        upper -= values
+        upper *= weight
+        values += upper
+    return values
+
+
+def chunk_regions(shape, chunk_shape):
+    """
+    Tiles an array domain with chunks.
+
+    Args:
+        shape (iterable): The shape of the domain.
+        chunk_shape (iterable): The shape of a chunk. Chunks at the edges of
+            the domain may be smaller.
+    Yields:
+        tuple: A tuple of slices for every chunk.
+    """
+    starts = [range(0, x, y) for x, y in zip(shape, chunk_shape)]
+    for corner in itertools.product(*starts):
+        yield tuple(slice(x, x + y) for x, y in zip(corner, chunk_shape))
+
+
+def memory_chunk_shape(shape, max_memory, bytes_per_point):
+    """
+    Finds the largest chunk shape that keeps the memory used for a chunk
+    under a limit. Chunks span as many complete trailing axes as possible.
+
+    Args:
+        shape (iterable): The shape of the domain.
+        max_memory (int): The maximum number of bytes used for a chunk.
+        bytes_per_point (int): The number of bytes needed per point.
+    Returns:
+        tuple: The chunk shape.
+    """
+    max_points = max(1, int(max_memory // bytes_per_point))
+    chunk_shape = list(shape)
+    for axis in range(len(shape)):
+        trailing = int(np.prod(shape[axis + 1:]))
+        if trailing <= max_points:
+            chunk_shape[axis] = max(1, min(shape[axis], max_points // trailing))
+            break
+        chunk_shape[axis] = 1
+    return tuple(chunk_shape)
+
+
+def parallel_chunk_shape(shape, workers):
+    """
+    Splits the first axis of a domain into a few chunks per worker, so that
+    the load is balanced over the workers.
+
+    Args:
+        shape (iterable): The shape of the domain.
+        workers (int): The number of workers.
+    Returns:
+        tuple: The chunk shape.
+    """
+    nchunks = 4 * workers if workers > 1 else 1
+    return (max(1, -(-shape[0] // nchunks)),) + tuple(shape[1:])
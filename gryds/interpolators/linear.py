@@ -9,8 +9,9 @@ from __future__ import division, print_function, absolute_import
 
 import numpy as np
 from ..config import DTYPE
-from .grid import Grid
+from .grid import Grid, TransformedGrid
 from .base import Interpolator
+from .plan import SamplingPlan
 
 
 class LinearInterpolator(Interpolator):
@@ -19,14 +20,16 @@ class LinearInterpolator(Interpolator):
     Attributes:
         self.image (np.ndarray): The wrapped ND image.
         self.grid (Grid): The image's default sampling grid.
+        self.dtype (type): The default data type of resampled images.
     """
-    def __init__(self, image, **kwargs):
+    def __init__(self, image, dtype=DTYPE, **kwargs):
         """
         Args:
             image (np.array): A 2D or 3D image array.
+            dtype (type): The default data type of resampled images.
         """
         super(LinearInterpolator, self).__init__(
-            image
+            image, dtype=dtype
         )
         if kwargs:
             print('WARNING: ignored options: {}'.format(kwargs))
@@ -56,17 +59,47 @@ class LinearInterpolator(Interpolator):
         """
         Reamples the image at a given grid.
 
+        A lazy TransformedGrid is evaluated and sampled one tile at a time.
+
         Args:
             grid (Grid): The new grid.
-            **kwargs (dict): ignored
+            **kwargs (dict): workers, out, and dtype for a lazy grid (see
+                Interpolator._resample_lazy()), ignored otherwise.
         Returns:
             np.array: The resampled image at the new grid.
         """
+        if isinstance(grid, TransformedGrid) and grid._grid is None:
+            return self._resample_lazy(grid, **kwargs)
         if kwargs:
             print('WARNING: ignored options: {}'.format(kwargs))
         g = grid.scaled_to(self.image.shape).grid
         return self._sample(*g)
 
+    def plan(self, *transforms, **kwargs):
+        """
+        Precomputes the interpolation indices and weights for transforming
+        images of this image's shape.
+
+        Args:
+            *transforms (list): A list of Transform objects.
+            **kwargs (dict): ignored
+        Returns:
+            SamplingPlan: A plan that transforms an image with apply().
+        """
+        if kwargs:
+            print('WARNING: ignored options: {}'.format(kwargs))
+        g = self.grid.transform(*transforms).scaled_to(self.image.shape).grid
+        plan = SamplingPlan(g, self.image.shape, order=1, mode='constant',
+                            dtype=self.dtype)
+
+        # This interpolator is zero for points outside of [0, N - 1) along
+        # any axis, whereas mode='constant' only zeroes points outside of
+        # [0, N - 1].
+        shape = np.array(self.image.shape).reshape((-1,) + (1,) * (g.ndim - 1))
+        plan.stencil.outside = np.any((g < 0) | (g >= shape - 1),
+                                      axis=0).ravel()
+        return plan
+
     def __sample2(self, X, Y):
         X0 = np.floor(X).astype('int')
         Y0 = np.floor(Y).astype('int')
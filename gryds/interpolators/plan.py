@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+#
+# Sampling plans: precomputed interpolation stencils that resample multiple
+# images of the same shape at the same transformed grid.
+
+
+from __future__ import division, print_function, absolute_import
+
+import numpy as np
+import scipy.ndimage as nd
+from ..config import DTYPE, working_dtype
+from ..stencil import BSplineStencil
+from .. import timing
+
+
+class SamplingPlan(object):
+    """The interpolation indices and weights for sampling images of a fixed
+    shape at fixed points, e.g. a transformed grid. Once built, applying the
+    plan to an image is a pure gather-multiply-add, so the same deformation
+    can be applied to an image, its label map, and its mask without
+    transforming the grid again.
+
+    Plans are usually created with the plan() method of an interpolator.
+
+    Attributes:
+        shape (tuple): The shape of the images the plan can be applied to.
+        output_shape (tuple): The shape of the resampled images.
+        order (int): The order of the B-spline.
+        mode (str): How edges of the image domain are treated.
+        cval (numeric): Constant value for mode='constant'.
+        dtype (type): The data type of the resampled images.
+        stencil (BSplineStencil): The interpolation indices and weights.
+    """
+
+    def __init__(self, points, shape, order=3, mode='constant', cval=0,
+                 dtype=DTYPE):
+        """
+        Args:
+            points (np.array): An ndim x N1 x ... x Nndim array of points in
+                voxel coordinates.
+            shape (iterable): The shape of the images that will be sampled.
+            order (int): The order of the B-spline.
+            mode (str): How edges of image domain should be treated. One of
+                BSplineStencil.supported_modes.
+            cval (numeric): Constant value for mode='constant'.
+            dtype (type): The data type of the resampled images. The weights
+                are stored in this precision, or in single precision for half
+                precision images.
+        Raises:
+            ValueError: If the mode is not supported.
+        """
+        points = np.asarray(points)
+        self.shape = tuple(shape)
+        self.output_shape = points.shape[1:]
+        self.order = order
+        self.mode = mode
+        self.cval = cval
+        self.dtype = dtype
+
+        # Compact indices halve the plan's memory use when possible.
+        index_dtype = np.int32 if np.prod(self.shape) < 2 ** 31 else np.intp
+        self.stencil = BSplineStencil(
+            points.reshape(len(points), -1), self.shape, order=order,
+            mode=mode, dtype=working_dtype(dtype), index_dtype=index_dtype)
+
+    def __repr__(self):
+        return '{}({}D, {} -> {}, order={})'.format(
+            self.__class__.__name__, len(self.shape),
+            'x'.join([str(x) for x in self.shape]),
+            'x'.join([str(x) for x in self.output_shape]), self.order)
+
+    def apply(self, image, out=None):
+        """
+        Resamples an image with the plan.
+
+        Args:
+            image (np.array): An image of the plan's shape.
+            out (np.array): An array of the plan's output shape the result is
+                written to. By default a new array is allocated.
+        Raises:
+            ValueError: If the image shape does not match the plan.
+        Returns:
+            np.array: The resampled image.
+        """
+        image = np.asarray(image)
+        if image.shape != self.shape:
+            raise ValueError(
+                'Image of shape {} does not match the plan\'s shape '
+                '{}.'.format(image.shape, self.shape))
+
+        coefficients = image.astype(working_dtype(image.dtype), copy=False)
+        if self.order > 1:
+            with timing.stage('prefilter', points=image.size,
+                              nbytes=image.size * 8):
+                coefficients = nd.spline_filter(
+                    coefficients, self.order, output=np.float64,
+                    mode=self.mode)
+        npoints = int(np.prod(self.output_shape))
+        with timing.stage('sample', points=npoints,
+                          nbytes=npoints * coefficients.itemsize):
+            values = self.stencil.apply(coefficients[None],
+                                        cval=self.cval)[0]
+
+        if out is None:
+            return values.reshape(self.output_shape).astype(self.dtype,
+                                                            copy=False)
+        out[...] = values.reshape(self.output_shape)
+        return out
@@ -0,0 +1,220 @@
+#! /usr/bin/env python
+#
+# Transform a batch of images in a pool of processes. The images and the
+# transformed images live in shared memory, so only the transformations are
+# sent to the worker processes.
+
+
+from __future__ import division, print_function, absolute_import
+
+import collections
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from ..config import DTYPE
+from .bspline import BSplineInterpolator
+
+
+# The state of a worker process, set by _init_worker().
+_worker = {}
+
+
+class _SharedArray(np.ndarray):
+    """A NumPy array in a block of shared memory. Like np.memmap, the array
+    and its views keep a reference to the block, so it stays mapped while
+    any of them exist."""
+
+    def __new__(cls, shape, dtype, name=None):
+        nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        if name is None:
+            memory = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            memory = shared_memory.SharedMemory(name=name)
+        array = np.ndarray.__new__(cls, shape, dtype=dtype,
+                                   buffer=memory.buf)
+        array._memory = memory
+        return array
+
+    def __array_finalize__(self, obj):
+        self._memory = getattr(obj, '_memory', None)
+
+    @property
+    def spec(self):
+        """The arguments that attach another process to the array."""
+        return self.shape, self.dtype.str, self._memory.name
+
+
+def _init_worker(input_spec, output_spec, interpolator, kwargs,
+                 cache_size=1):
+    """Attaches a worker process to the shared input and output images."""
+    _worker['input'] = _SharedArray(*input_spec)
+    _worker['output'] = _SharedArray(*output_spec)
+    _worker['interpolator'] = interpolator
+    _worker['kwargs'] = kwargs
+    _worker['cache_size'] = cache_size
+    _worker['interpolators'] = collections.OrderedDict()
+    _worker['version'] = None
+
+
+def _transform_image(task):
+    """Transforms one image of the batch into the shared output."""
+    i, chain, version, kwargs = task
+    if version != _worker['version']:
+        # The images were replaced, so cached coefficients are outdated.
+        _worker['interpolators'] = collections.OrderedDict()
+        _worker['version'] = version
+
+    # The interpolators of the most recently transformed images are kept,
+    # with their coefficients, so a worker holds at most cache_size
+    # coefficient volumes whichever images it is given.
+    interpolators = _worker['interpolators']
+    interpolator = interpolators.pop(i, None)
+    if interpolator is None:
+        while interpolators and \
+                len(interpolators) >= _worker['cache_size']:
+            interpolators.popitem(last=False)
+        interpolator = _worker['interpolator'](
+            _worker['input'][i], **_worker['kwargs'])
+    if _worker['cache_size'] > 0:
+        interpolators[i] = interpolator
+    interpolator.transform(*chain, workers=1, out=_worker['output'][i],
+                           **kwargs)
+
+
+class SharedBatchInterpolator(object):
+    """Transforms a batch of images of the same shape, each with its own
+    transformation, in a pool of worker processes. The images and the
+    transformed images are stored in shared memory: the worker processes read
+    and write them in place, and only the transformations are pickled.
+
+    The transformed batch that transform() returns is a view of the shared
+    memory, which is overwritten by the next call. Copy it to keep it.
+
+    Use the interpolator as a context manager, or call close() to stop the
+    processes and release the shared memory.
+
+    Attributes:
+        images (np.ndarray): The B x N1 x ... x Nndim image batch, in shared
+            memory.
+        interpolator (Interpolator): The interpolator class that is applied.
+        processes (int): The number of worker processes.
+        cache_size (int): The number of interpolators (with their
+            coefficients) every worker process keeps.
+        dtype (type): The data type of the transformed images.
+    """
+
+    def __init__(self, images, interpolator=BSplineInterpolator,
+                 processes=None, context=None, cache_size=1, **kwargs):
+        """
+        Args:
+            images (np.array): A B x N1 x ... x Nndim array of B images. The
+                images are copied to shared memory once.
+            interpolator (Interpolator): The interpolator that will be applied.
+            processes (int): The number of worker processes. Default is the
+                number of CPUs.
+            context (str): The multiprocessing start method, e.g. 'fork' or
+                'spawn'. Default is the platform's default.
+            cache_size (int): The number of interpolators, with their
+                prefiltered coefficients, every worker process keeps for the
+                images it transformed most recently. Default is 1, so every
+                worker holds at most one coefficient volume.
+            **kwargs (dict): Options for the wrapped Interpolator class.
+        """
+        images = np.asarray(images)
+        self.interpolator = interpolator
+        self.dtype = kwargs.get('dtype', DTYPE)
+        self._input = _SharedArray(images.shape, images.dtype)
+        self._input[...] = images
+        self._output = _SharedArray(images.shape, self.dtype)
+        self._version = 0
+        self.cache_size = cache_size
+
+        context = multiprocessing.get_context(context)
+        self._pool = context.Pool(
+            processes, initializer=_init_worker,
+            initargs=(self._input.spec, self._output.spec, interpolator,
+                      kwargs, cache_size))
+        self.processes = self._pool._processes
+
+    def __repr__(self):
+        return '{}({}D, {}, processes={})'.format(
+            self.__class__.__name__, len(self.shape) - 1, len(self),
+            self.processes)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def shape(self):
+        return self._input.shape
+
+    @property
+    def images(self):
+        return self._input
+
+    def update(self, images):
+        """
+        Replaces the images of the batch, e.g. with the next batch of a data
+        loader, without restarting the worker processes.
+
+        Args:
+            images (np.array): A B x N1 x ... x Nndim array of the batch's
+                shape.
+        Raises:
+            ValueError: If the shape of the images does not match the batch.
+        """
+        images = np.asarray(images)
+        if images.shape != self.shape:
+            raise ValueError(
+                'Images of shape {} do not match the batch\'s shape '
+                '{}.'.format(images.shape, self.shape))
+        self._input[...] = images
+        self._version += 1
+
+    def transform(self, transformations, **kwargs):
+        """
+        Transforms every image in the batch with its own transformation.
+
+        Args:
+            transformations (list): A list of B Transform objects, or of B
+                lists of Transform objects that are applied in sequence.
+            **kwargs (dict): Redirected to the wrapped Interpolator's
+                transform() method, except for workers, out, and dtype, which
+                are fixed by the batch.
+        Raises:
+            ValueError: If the number of transformations does not match the
+                number of images.
+        Returns:
+            np.array: The B x N1 x ... x Nndim batch of transformed images,
+                as a view of shared memory that the next call overwrites.
+        """
+        if len(transformations) != len(self):
+            raise ValueError(
+                'Number of transformations ({}) does not match the number of '
+                'images ({}).'.format(len(transformations), len(self)))
+        kwargs.pop('workers', None)
+        kwargs.pop('out', None)
+        kwargs.pop('dtype', None)
+        tasks = [(i, tuple(x) if isinstance(x, (list, tuple)) else (x,),
+                  self._version, kwargs)
+                 for i, x in enumerate(transformations)]
+        self._pool.map(_transform_image, tasks, chunksize=1)
+        return self._output
+
+    def close(self):
+        """Stops the worker processes and releases the shared memory. Arrays
+        that were returned by transform() remain valid, their memory is freed
+        when they are garbage collected."""
+        if self._pool is None:
+            return
+        self._pool.close()
+        self._pool.join()
+        self._pool = None
+        self._input._memory.unlink()
+        self._output._memory.unlink()
@@ -0,0 +1,57 @@
+#! /usr/bin/env python
+#
+# Thread pools for processing chunks of grids and point sets in parallel.
+# Most of the work (NumPy operations and scipy.ndimage interpolation) releases
+# the GIL, so threads can use multiple cores without copying data.
+
+
+from __future__ import division, print_function, absolute_import
+
+import threading
+from multiprocessing.pool import ThreadPool
+from . import config
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_state = threading.local()
+
+
+def _pool(workers):
+    """Returns a thread pool with the given number of workers, creating it
+    once."""
+    with _pools_lock:
+        if workers not in _pools:
+            _pools[workers] = ThreadPool(workers)
+        return _pools[workers]
+
+
+def _run_in_worker(function):
+    def wrapper(item):
+        _state.in_worker = True
+        try:
+            return function(item)
+        finally:
+            _state.in_worker = False
+    return wrapper
+
+
+def parallel_map(function, items, workers=None):
+    """
+    Applies a function to every item, on a thread pool if more than one
+    worker is requested. Calls made from within a worker run serially, so
+    nested parallelism does not oversubscribe (or deadlock) the pool.
+
+    Args:
+        function (callable): The function to apply.
+        items (iterable): The items.
+        workers (int): The number of threads. Default is config.WORKERS.
+    Returns:
+        list: The results, in the order of the items.
+    """
+    if workers is None:
+        workers = config.WORKERS
+    items = list(items)
+    if workers <= 1 or len(items) <= 1 or getattr(_state, 'in_worker', False):
+        return [function(x) for x in items]
+    return _pool(workers).map(_run_in_worker(function), items)
@@ -0,0 +1,360 @@
+#! /usr/bin/env python
+#
+# Random transformations for data augmentation. All parameters of a batch of
+# transformations are drawn in one vectorized call from a NumPy random
+# generator, so a seeded generator reproduces the same batch.
+
+
+from __future__ import division, print_function, absolute_import
+
+import numpy as np
+import scipy.ndimage as nd
+from .config import DTYPE
+from .stencil import BSplineStencil
+from .transformers.linear import LinearTransformation
+from .transformers.bspline import BSplineTransformation
+
+
+class Sampler(object):
+    """Base class for random transformation samplers.
+
+    Attributes:
+        ndim (int): The number of dimensions of the transformations.
+        rng (np.random.Generator): The random number generator.
+        dtype (type): The data type of the sampled transformations.
+    """
+
+    def __init__(self, ndim, rng=None, dtype=DTYPE):
+        """
+        Args:
+            ndim (int): The number of dimensions of the transformations.
+            rng (np.random.Generator): The random number generator, or a seed
+                for a new generator. Default is an unseeded generator.
+            dtype (type): The data type of the sampled transformations.
+        """
+        self.ndim = ndim
+        self.rng = np.random.default_rng(rng)
+        self.dtype = dtype
+
+    def __repr__(self):
+        return '{}({}D)'.format(self.__class__.__name__, self.ndim)
+
+    def __call__(self, n=None):
+        return self.sample(n)
+
+    def sample_parameters(self, n):
+        """
+        Draws the parameters of n transformations at once.
+
+        Args:
+            n (int): The number of parameter sets.
+        Returns:
+            np.array: An array with the n parameter sets along the first axis.
+        """
+        raise NotImplementedError()
+
+    def _transformation(self, parameters):
+        """Returns the transformation for one parameter set."""
+        raise NotImplementedError()
+
+    def sample(self, n=None):
+        """
+        Draws random transformations.
+
+        Args:
+            n (int): The number of transformations. Default is a single
+                transformation.
+        Returns:
+            Transformation or list: A transformation, or a list of n
+                transformations that can be passed to
+                BatchInterpolator.transform().
+        """
+        parameters = self.sample_parameters(1 if n is None else n)
+        transformations = [self._transformation(x) for x in parameters]
+        if n is None:
+            return transformations[0]
+        return transformations
+
+    def _uniform(self, n, limit, size):
+        """Draws an n x size array, uniform in [-limit, limit] per column."""
+        limit = np.broadcast_to(np.asarray(limit, dtype=np.float64), (size,))
+        return limit * self.rng.uniform(-1, 1, size=(n, size))
+
+
+class AffineSampler(Sampler):
+    """Sampler for random 2D or 3D affine transformations, with the same
+    parameterization as AffineTransformation:
+
+        R * G * S * (x - c) + c + t
+
+    Every parameter is drawn uniformly from a range around the identity.
+
+    Attributes:
+        ndim (int): The number of dimensions, 2 or 3.
+        angles (np.array): The maximum absolute rotation angles in radians.
+        scaling (np.array): The maximum absolute deviation of the scaling
+            factors from 1.
+        translation (np.array): The maximum absolute translation.
+        shear (np.array): The maximum absolute off-diagonal shear component.
+        center (np.array): The center of rotation, scaling, and shear, in
+            relative coordinates.
+        isotropic (bool): Whether one scaling factor is drawn for all axes.
+        rng (np.random.Generator): The random number generator.
+        dtype (type): The data type of the sampled transformations.
+    """
+
+    def __init__(self, ndim, angles=0, scaling=0, translation=0, shear=0,
+                 center=0.5, isotropic=False, rng=None, dtype=DTYPE):
+        """
+        Args:
+            ndim (int): The number of dimensions, 2 or 3.
+            angles (float or np.array): The maximum absolute rotation angle in
+                radians, for all angles or per angle (1 in 2D, 3 in 3D).
+            scaling (float or np.array): The maximum absolute deviation of the
+                scaling factors from 1, for all axes or per axis.
+            translation (float or np.array): The maximum absolute translation
+                in relative coordinates, for all axes or per axis.
+            shear (float): The maximum absolute off-diagonal component of the
+                shear matrix.
+            center (float or np.array): The center of rotation, scaling, and
+                shear in relative coordinates. Default is the image center.
+            isotropic (bool): If True, one scaling factor is drawn for all
+                axes.
+            rng (np.random.Generator): The random number generator, or a seed
+                for a new generator.
+            dtype (type): The data type of the sampled transformations.
+        Raises:
+            ValueError: If ndim is not 2 or 3.
+        """
+        if ndim not in (2, 3):
+            raise ValueError(
+                'Random affine transformations are only supported in 2D and '
+                '3D, not {}D.'.format(ndim))
+        super(AffineSampler, self).__init__(ndim, rng=rng, dtype=dtype)
+        n_angles = 1 if ndim == 2 else 3
+        self.angles = np.broadcast_to(np.asarray(angles, dtype=np.float64),
+                                      (n_angles,))
+        self.scaling = np.broadcast_to(np.asarray(scaling, dtype=np.float64),
+                                       (ndim,))
+        self.translation = np.broadcast_to(
+            np.asarray(translation, dtype=np.float64), (ndim,))
+        self.shear = np.float64(shear)
+        self.center = np.broadcast_to(np.asarray(center, dtype=np.float64),
+                                      (ndim,))
+        self.isotropic = isotropic
+
+    def sample_parameters(self, n):
+        """
+        Draws the augmented matrices of n affine transformations at once.
+
+        Args:
+            n (int): The number of transformations.
+        Returns:
+            np.array: An n x ndim x (ndim + 1) array of augmented matrices.
+        """
+        ndim = self.ndim
+        angles = self._uniform(n, self.angles, len(self.angles))
+        if self.isotropic:
+            scaling = 1 + self._uniform(n, self.scaling[0], 1).repeat(ndim, 1)
+        else:
+            scaling = 1 + self._uniform(n, self.scaling, ndim)
+        translation = self._uniform(n, self.translation, ndim)
+        shear = self._uniform(n, self.shear, ndim * ndim).reshape(
+            n, ndim, ndim)
+        shear[:, np.arange(ndim), np.arange(ndim)] = 1
+
+        # R * G * S, with S applied to the columns of R * G.
+        matrices = np.matmul(rotation_matrices(angles), shear)
+        matrices *= scaling[:, None, :]
+
+        # The center is subtracted before and added after the linear part.
+        offset = self.center + translation - np.matmul(
+            matrices, self.center[:, None])[..., 0]
+        return np.concatenate([matrices, offset[..., None]], axis=2)
+
+    def _transformation(self, parameters):
+        return LinearTransformation(parameters, dtype=self.dtype)
+
+
+class BSplineSampler(Sampler):
+    """Sampler for random B-spline transformations, with control point
+    displacements drawn uniformly from a range.
+
+    Attributes:
+        shape (tuple): The shape of the control point grid.
+        scale (np.array): The maximum absolute displacement per axis, in
+            relative coordinates.
+        order (int): The order of the B-spline transformations.
+        mode (str): The mode of the B-spline transformations.
+        no_fold (bool): Whether folding samples are scaled down.
+        rng (np.random.Generator): The random number generator.
+        dtype (type): The data type of the sampled transformations.
+    """
+
+    def __init__(self, shape, scale=None, order=3, mode='mirror',
+                 no_fold=False, rng=None, dtype=DTYPE):
+        """
+        Args:
+            shape (iterable): The shape of the control point grid, N1 x ... x
+                Nndim.
+            scale (float or np.array): The maximum absolute displacement in
+                relative coordinates, for all axes or per axis. Default is an
+                eighth of the control point spacing.
+            order (int): The order of the B-spline transformations.
+            mode (str): The mode of the B-spline transformations.
+            no_fold (bool): If True, every sample that may fold according to
+                BSplineTransformation.max_safe_scale() is scaled down until it
+                is guaranteed not to fold.
+            rng (np.random.Generator): The random number generator, or a seed
+                for a new generator.
+            dtype (type): The data type of the sampled transformations.
+        Raises:
+            ValueError: If no_fold is set for an order or mode the fold bound
+                does not support.
+        """
+        self.shape = tuple(shape)
+        super(BSplineSampler, self).__init__(len(self.shape), rng=rng,
+                                             dtype=dtype)
+        if scale is None:
+            scale = [0.5 / (4 * (x - 1)) for x in self.shape]
+        self.scale = np.broadcast_to(np.asarray(scale, dtype=np.float64),
+                                     (self.ndim,))
+        self.order = order
+        self.mode = mode
+        self.no_fold = no_fold
+        if no_fold and (
+                order < 1 or mode not in BSplineStencil.supported_modes):
+            raise ValueError(
+                'The fold bound does not support order {} and mode '
+                '\'{}\'.'.format(order, mode))
+
+    def __repr__(self):
+        return '{}({}D, {})'.format(self.__class__.__name__, self.ndim,
+                                    'x'.join([str(x) for x in self.shape]))
+
+    def sample_parameters(self, n):
+        """
+        Draws the control point displacements of n transformations at once.
+
+        Args:
+            n (int): The number of transformations.
+        Returns:
+            np.array: An n x ndim x N1 x ... x Nndim array of displacements.
+        """
+        size = (n, self.ndim) + self.shape
+        scale = self.scale.reshape((1, self.ndim) + (1,) * self.ndim)
+        return scale * self.rng.uniform(-1, 1, size=size)
+
+    def _transformation(self, parameters):
+        transformation = BSplineTransformation(
+            parameters, order=self.order, mode=self.mode, dtype=self.dtype)
+        if self.no_fold:
+            # Scale down to just within the safe range of the fold bound.
+            factor = 0.99 * transformation.max_safe_scale()
+            if factor < 1:
+                transformation = BSplineTransformation(
+                    factor * parameters, order=self.order, mode=self.mode,
+                    dtype=self.dtype)
+        return transformation
+
+
+class ElasticSampler(BSplineSampler):
+    """Sampler for random elastic deformations: dense random displacements
+    that are smoothed with a Gaussian filter, as B-spline transformations on
+    the grid of the displacements.
+
+    Attributes:
+        shape (tuple): The shape of the displacement grid.
+        alpha (np.array): The maximum absolute displacement per axis, in
+            relative coordinates.
+        sigma (np.array): The standard deviation of the Gaussian filter per
+            axis, in grid points.
+        order (int): The order of the B-spline transformations.
+        mode (str): The mode of the B-spline transformations.
+        no_fold (bool): Whether folding samples are scaled down.
+        rng (np.random.Generator): The random number generator.
+        dtype (type): The data type of the sampled transformations.
+    """
+
+    def __init__(self, shape, alpha, sigma, order=3, mode='mirror',
+                 no_fold=False, rng=None, dtype=DTYPE):
+        """
+        Args:
+            shape (iterable): The shape of the displacement grid, N1 x ... x
+                Nndim. Usually the image shape or a fraction of it.
+            alpha (float or np.array): The maximum absolute displacement of a
+                sample in relative coordinates, for all axes or per axis.
+            sigma (float or np.array): The standard deviation of the Gaussian
+                filter in grid points, for all axes or per axis.
+            order (int): The order of the B-spline transformations.
+            mode (str): The mode of the B-spline transformations.
+            no_fold (bool): If True, every sample that may fold according to
+                BSplineTransformation.max_safe_scale() is scaled down until it
+                is guaranteed not to fold.
+            rng (np.random.Generator): The random number generator, or a seed
+                for a new generator.
+            dtype (type): The data type of the sampled transformations.
+        """
+        super(ElasticSampler, self).__init__(
+            shape, scale=alpha, order=order, mode=mode, no_fold=no_fold,
+            rng=rng, dtype=dtype)
+        self.alpha = self.scale
+        self.sigma = np.broadcast_to(np.asarray(sigma, dtype=np.float64),
+                                     (self.ndim,))
+
+    def sample_parameters(self, n):
+        """
+        Draws the smoothed displacements of n transformations at once.
+
+        Args:
+            n (int): The number of transformations.
+        Returns:
+            np.array: An n x ndim x N1 x ... x Nndim array of displacements.
+        """
+        size = (n, self.ndim) + self.shape
+        noise = self.rng.uniform(-1, 1, size=size)
+
+        # Smooth the spatial axes of all samples and components in one call,
+        # then normalize every component to its maximum displacement.
+        smooth = nd.gaussian_filter(noise, sigma=(0, 0) + tuple(self.sigma),
+                                    mode='mirror')
+        spatial_axes = tuple(range(2, smooth.ndim))
+        peak = np.abs(smooth).max(axis=spatial_axes, keepdims=True)
+        scale = self.alpha.reshape((1, self.ndim) + (1,) * self.ndim)
+        return smooth * (scale / np.maximum(peak, np.finfo(peak.dtype).tiny))
+
+
+def rotation_matrices(angles):
+    """
+    Returns a stack of rotation matrices, in the convention of
+    rotation_matrix_2d() and rotation_matrix_3d().
+
+    Args:
+        angles (np.array): An n x 1 (2D) or n x 3 (3D) array of angles in
+            radians.
+    Raises:
+        ValueError: If the number of angles is not 1 or 3.
+    Returns:
+        np.array: An n x ndim x ndim array of rotation matrices.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    n, n_angles = angles.shape
+    cos, sin = np.cos(angles), np.sin(angles)
+    if n_angles == 1:
+        return np.stack([cos, -sin, sin, cos], axis=1).reshape(n, 2, 2)
+    if n_angles != 3:
+        raise ValueError(
+            'Number of angles ({}) not supported.'.format(n_angles))
+
+    def axis_rotations(axis):
+        matrices = np.zeros((n, 3, 3))
+        matrices[:, axis, axis] = 1
+        i, j = [x for x in range(3) if x != axis]
+        sign = -1 if axis == 1 else 1
+        matrices[:, i, i] = matrices[:, j, j] = cos[:, axis]
+        matrices[:, i, j] = -sign * sin[:, axis]
+        matrices[:, j, i] = sign * sin[:, axis]
+        return matrices
+
+    rx, ry, rz = [axis_rotations(axis) for axis in range(3)]
+    return np.matmul(np.matmul(rx, ry), rz)
@@ -0,0 +1,410 @@
+#! /usr/bin/env python
+#
+# Precomputed B-spline interpolation stencils, i.e. the indices and weights of
+# the coefficients that contribute to the interpolated value at a point.
+
+
+from __future__ import division, print_function, absolute_import
+
+import itertools
+import numpy as np
+from .config import DTYPE
+from .parallel import parallel_map
+
+
+def bspline_weights(offsets, order):
+    """
+    Evaluates the B-spline basis functions of a given order at fractional
+    offsets.
+
+    Args:
+        offsets (np.array): An N-shaped array of offsets of the points to the
+            first coefficient in the stencil, i.e. x - start.
+        order (int): The order of the B-spline.
+    Returns:
+        list: (order + 1) N-shaped arrays with the weights for every tap.
+    """
+    if order == 0:
+        return [np.ones_like(offsets)]
+    if order == 1:
+        return [1 - offsets, offsets - 0]
+    if order == 3:
+        t = offsets - 1
+        t2 = t * t
+        t3 = t2 * t
+        return [
+            (1 - t) ** 3 / 6,
+            (3 * t3 - 6 * t2 + 4) / 6,
+            (-3 * t3 + 3 * t2 + 3 * t + 1) / 6,
+            t3 / 6
+        ]
+
+    # General case: the centered B-spline of order n is given by
+    # 1 / n! sum_k (-1)^k (n + 1 choose k) (x + (n + 1) / 2 - k)_+^n
+    factorial = np.prod(np.arange(1, order + 1))
+    binomials = [np.prod(np.arange(order + 2 - k, order + 2)) //
+                 np.prod(np.arange(1, k + 1)) for k in range(order + 2)]
+    # The terms are large and alternate in sign, so the sum is computed in
+    # double precision to avoid cancellation.
+    weights = []
+    for tap in range(order + 1):
+        x = offsets.astype(np.float64) - tap + (order + 1) / 2.
+        weight = np.zeros_like(x)
+        for k in range(order + 2):
+            weight += (-1) ** k * binomials[k] * np.maximum(x - k, 0) ** order
+        weights.append((weight / factorial).astype(offsets.dtype))
+    return weights
+
+
+def bspline_derivative_weights(offsets, order):
+    """
+    Evaluates the derivatives of the B-spline basis functions of a given
+    order at fractional offsets.
+
+    Args:
+        offsets (np.array): An N-shaped array of offsets of the points to the
+            first coefficient in the stencil, i.e. x - start.
+        order (int): The order of the B-spline.
+    Returns:
+        list: (order + 1) N-shaped arrays with the derivative of the weight
+            of every tap with respect to the offset.
+    """
+    if order == 0:
+        return [np.zeros_like(offsets)]
+    if order == 1:
+        return [-np.ones_like(offsets), np.ones_like(offsets)]
+    if order == 3:
+        t = offsets - 1
+        t2 = t * t
+        return [
+            -(1 - t) ** 2 / 2,
+            (3 * t2 - 4 * t) / 2,
+            (-3 * t2 + 2 * t + 1) / 2,
+            t2 / 2
+        ]
+
+    # General case: the derivative of the sum in bspline_weights().
+    factorial = np.prod(np.arange(1, order))
+    binomials = [np.prod(np.arange(order + 2 - k, order + 2)) //
+                 np.prod(np.arange(1, k + 1)) for k in range(order + 2)]
+    weights = []
+    for tap in range(order + 1):
+        x = offsets.astype(np.float64) - tap + (order + 1) / 2.
+        weight = np.zeros_like(x)
+        for k in range(order + 2):
+            weight += (-1) ** k * binomials[k] * \
+                np.maximum(x - k, 0) ** (order - 1)
+        weights.append((weight / factorial).astype(offsets.dtype))
+    return weights
+
+
+def fold_indices(indices, size, mode):
+    """
+    Maps indices outside of [0, size) back into the array domain according to
+    the boundary mode.
+
+    Args:
+        indices (np.array): An array of integer indices.
+        size (int): The length of the axis.
+        mode (str): One of 'mirror', 'constant', 'reflect', 'grid-mirror', or
+            'grid-wrap'.
+    Returns:
+        np.array: The folded indices.
+    """
+    if size == 1:
+        return np.zeros_like(indices)
+    # Inside the array domain, mode='constant' interpolates like 'mirror'.
+    if mode in ('mirror', 'constant'):
+        period = 2 * size - 2
+        indices = np.abs(indices) % period
+        return np.where(indices >= size, period - indices, indices)
+    if mode in ('reflect', 'grid-mirror'):
+        period = 2 * size
+        indices = indices % period
+        return np.where(indices >= size, period - 1 - indices, indices)
+    if mode == 'grid-wrap':
+        return indices % size
+    raise ValueError('Mode {} is not supported by stencils.'.format(mode))
+
+
+def coefficient_table(coefficients, dtype=DTYPE):
+    """
+    Converts C arrays of B-spline coefficients to the M x C table layout
+    used by stencils, where M is the number of elements of each array. In
+    this layout every gather reads contiguous rows.
+
+    Args:
+        coefficients (np.array): A C x N1 x ... x Nndim array.
+        dtype (type): The data type of the table.
+    Returns:
+        np.array: The M x C table.
+    """
+    coefficients = np.asarray(coefficients)
+    return np.ascontiguousarray(
+        coefficients.reshape(len(coefficients), -1).T, dtype=dtype)
+
+
+def interpolate(table, shape, points, order=3, mode='mirror', cval=0,
+                dtype=DTYPE, workers=None, out=None):
+    """
+    Interpolates a coefficient table at points. Unlike a BSplineStencil, the
+    stencil is built and applied one chunk of points at a time, so memory use
+    does not grow with the number of points.
+
+    Args:
+        table (np.array): An M x C coefficient table (see
+            coefficient_table()).
+        shape (iterable): The shape of the coefficient arrays.
+        points (np.array): An ndim x N array of points in array index
+            coordinates.
+        order (int): The order of the B-spline.
+        mode (str): How edges of the array domain should be treated.
+        cval (numeric): Constant value for mode='constant'. A sequence of C
+            values sets a value for every coefficient array.
+        dtype (type): The data type of the weights and the computations.
+        workers (int): The number of threads that process chunks of points
+            in parallel. Default is config.WORKERS.
+        out (np.array): An N x C array the result is written to. It may have
+            a different data type than dtype. By default a new array of dtype
+            is allocated.
+    Returns:
+        np.array: An N x C array of interpolated values.
+    """
+    points = np.asarray(points)
+    if out is None:
+        out = np.empty((points.shape[1], table.shape[1]), dtype=dtype)
+
+    def interpolate_chunk(begin):
+        chunk = slice(begin, begin + BSplineStencil.chunk_size)
+        stencil = BSplineStencil(points[:, chunk], shape, order=order,
+                                 mode=mode, dtype=dtype)
+        if out.dtype == dtype and out.flags.c_contiguous:
+            stencil._apply_chunk(table, slice(None), out[chunk], cval)
+        else:
+            values = np.empty((stencil.npoints, table.shape[1]), dtype=dtype)
+            stencil._apply_chunk(table, slice(None), values, cval)
+            out[chunk] = values
+
+    parallel_map(interpolate_chunk,
+                 range(0, points.shape[1], BSplineStencil.chunk_size),
+                 workers=workers)
+    return out
+
+
+def interpolate_gradient(table, shape, points, order=3, mode='mirror',
+                         dtype=DTYPE, workers=None):
+    """
+    Evaluates the gradient of the B-splines of a coefficient table at
+    points, one chunk of points at a time.
+
+    Args:
+        table (np.array): An M x C coefficient table (see
+            coefficient_table()).
+        shape (iterable): The shape of the coefficient arrays.
+        points (np.array): An ndim x N array of points in array index
+            coordinates.
+        order (int): The order of the B-spline.
+        mode (str): How edges of the array domain should be treated. For
+            mode='constant', the gradient outside of the array domain is 0.
+        dtype (type): The data type of the weights and the computations.
+        workers (int): The number of threads that process chunks of points
+            in parallel. Default is config.WORKERS.
+    Returns:
+        np.array: A C x ndim x N array of the derivatives of every
+            coefficient array along every axis.
+    """
+    points = np.asarray(points)
+    ndim = len(shape)
+    out = np.empty((table.shape[1], ndim, points.shape[1]), dtype=dtype)
+
+    def interpolate_chunk(begin):
+        chunk = slice(begin, begin + BSplineStencil.chunk_size)
+        stencil = BSplineStencil(points[:, chunk], shape, order=order,
+                                 mode=mode, dtype=dtype, derivative=True)
+        values = np.empty((stencil.npoints, table.shape[1]), dtype=dtype)
+        for axis in range(ndim):
+            weights = list(stencil.weights)
+            weights[axis] = stencil.derivative_weights[axis]
+            stencil._apply_chunk(table, slice(None), values, 0, weights)
+            out[:, axis, chunk] = values.T
+
+    parallel_map(interpolate_chunk,
+                 range(0, points.shape[1], BSplineStencil.chunk_size),
+                 workers=workers)
+    return out
+
+
+class BSplineStencil(object):
+    """The indices and weights of the B-spline basis functions for a fixed
+    set of points in an array of a fixed shape. Computing these once allows
+    interpolating multiple arrays (e.g. every component of a displacement
+    field) at the same points with a single gather per tap.
+
+    Attributes:
+        shape (tuple): The shape of the interpolated arrays.
+        order (int): The order of the B-spline.
+        mode (str): How edges of the array domain are treated.
+        npoints (int): The number of points.
+        indices (list): For every axis an (order + 1) x N array of flat index
+            offsets into the array.
+        weights (list): For every axis an (order + 1) x N array of weights.
+        derivative_weights (list): For every axis an (order + 1) x N array of
+            the derivatives of the weights, if requested. None otherwise.
+        outside (np.array): For mode='constant', an N-shaped mask of the
+            points outside of the array domain, which get the constant value.
+            None for other modes.
+    """
+
+    supported_modes = ('mirror', 'constant', 'reflect', 'grid-mirror',
+                       'grid-wrap')
+    chunk_size = 2 ** 12
+
+    def __init__(self, points, shape, order=3, mode='mirror', dtype=DTYPE,
+                 index_dtype=np.intp, derivative=False):
+        """
+        Args:
+            points (np.array): An ndim x N array of points in array index
+                coordinates.
+            shape (iterable): The shape of the arrays that will be
+                interpolated.
+            order (int): The order of the B-spline.
+            mode (str): How edges of the array domain should be treated. One
+                of 'mirror', 'constant', 'reflect', 'grid-mirror', or
+                'grid-wrap'.
+            dtype (type): The data type of the weights.
+            index_dtype (type): The data type of the indices. Use np.int32
+                for a compact stencil of arrays with less than 2^31
+                elements.
+            derivative (bool): Whether the derivatives of the weights are
+                computed as well, for evaluating gradients.
+        Raises:
+            ValueError: If the mode is not supported, or if the points and
+                shape do not match.
+        """
+        if mode not in self.supported_modes:
+            raise ValueError(
+                'Mode {} is not supported by stencils.'.format(mode))
+        points = np.asarray(points)
+        if points.ndim != 2 or points.shape[0] != len(shape):
+            raise ValueError(
+                'Points should be expressed as an ({} x N) matrix.'.format(
+                    len(shape)))
+
+        self.shape = tuple(shape)
+        self.order = order
+        self.mode = mode
+        self.npoints = points.shape[1]
+
+        strides = np.cumprod((self.shape[1:] + (1,))[::-1])[::-1]
+        self.indices = []
+        self.weights = []
+        self.derivative_weights = [] if derivative else None
+        self.outside = None
+        if mode == 'constant':
+            self.outside = np.any(
+                (points < 0) |
+                (points > np.array(self.shape)[:, None] - 1), axis=0)
+        for axis_points, size, stride in zip(points, self.shape, strides):
+            if order % 2:
+                start = np.floor(axis_points)
+            else:
+                start = np.floor(axis_points + 0.5)
+            start -= order // 2
+            offsets = (axis_points - start).astype(dtype)
+            self.weights.append(np.array(
+                bspline_weights(offsets, order), dtype=dtype))
+            if derivative:
+                self.derivative_weights.append(np.array(
+                    bspline_derivative_weights(offsets, order), dtype=dtype))
+            start = start.astype(np.intp)
+            self.indices.append(np.array([
+                fold_indices(start + tap, size, mode) * stride
+                for tap in range(order + 1)], dtype=index_dtype))
+
+    def __repr__(self):
+        return '{}({}D, {}, order={})'.format(
+            self.__class__.__name__, len(self.shape),
+            'x'.join([str(x) for x in self.shape]), self.order)
+
+    def matrix(self, derivative=False):
+        """
+        Returns the stencil of a 1D point set as a dense N x M basis matrix,
+        where M is the length of the interpolated arrays.
+
+        Args:
+            derivative (bool): Whether the matrix evaluates the derivative
+                instead of the value. Requires a stencil that was created
+                with derivative=True.
+        Raises:
+            ValueError: If the stencil is not one-dimensional.
+        """
+        if len(self.shape) != 1:
+            raise ValueError('Only 1D stencils can be expressed as a matrix.')
+        weights = self.derivative_weights if derivative else self.weights
+        matrix = np.zeros((self.npoints, self.shape[0]),
+                          dtype=self.weights[0].dtype)
+        rows = np.arange(self.npoints)
+        for index, weight in zip(self.indices[0], weights[0]):
+            np.add.at(matrix, (rows, index), weight)
+        if self.outside is not None:
+            matrix[self.outside] = 0
+        return matrix
+
+    def apply(self, coefficients, cval=0, workers=None):
+        """
+        Interpolates arrays of B-spline coefficients at the stencil's points.
+
+        Args:
+            coefficients (np.array): A C x N1 x ... x Nndim array of C
+                coefficient arrays, e.g. prefiltered displacement components.
+            cval (numeric): Constant value for mode='constant'. A sequence of
+                C values sets a value for every coefficient array.
+            workers (int): The number of threads that process chunks of
+                points in parallel. Default is config.WORKERS.
+        Returns:
+            np.array: A C x N array of interpolated values.
+        """
+        coefficients = np.asarray(coefficients)
+        if coefficients.shape[1:] != self.shape:
+            raise ValueError(
+                'Coefficients of shape {} do not match stencil shape '
+                '{}.'.format(coefficients.shape[1:], self.shape))
+
+        dtype = self.weights[0].dtype
+        table = coefficient_table(coefficients, dtype=dtype)
+        result = np.empty((self.npoints, len(coefficients)), dtype=dtype)
+
+        def apply_chunk(begin):
+            chunk = slice(begin, begin + self.chunk_size)
+            self._apply_chunk(table, chunk, result[chunk], cval)
+
+        parallel_map(apply_chunk, range(0, self.npoints, self.chunk_size),
+                     workers=workers)
+        return result.T
+
+    def _apply_chunk(self, table, chunk, out, cval=0, weights=None):
+        if weights is None:
+            weights = self.weights
+        out[...] = 0
+        values = np.empty_like(out)
+        weight = np.empty(len(out), dtype=out.dtype)
+        taps = range(self.order + 1)
+        # The partial index and weight over all but the last axis are shared
+        # by the taps along the last axis.
+        for tap in itertools.product(taps, repeat=len(self.shape) - 1):
+            partial_index = self.indices[0][tap[0], chunk] if tap else 0
+            partial_weight = weights[0][tap[0], chunk] if tap else 1
+            for axis in range(1, len(tap)):
+                partial_index = partial_index + \
+                    self.indices[axis][tap[axis], chunk]
+                partial_weight = partial_weight * \
+                    weights[axis][tap[axis], chunk]
+            for last in taps:
+                index = partial_index + self.indices[-1][last, chunk]
+                np.multiply(partial_weight, weights[-1][last, chunk],
+                            out=weight)
+                np.take(table, index, axis=0, out=values)
+                values *= weight[:, None]
+                out += values
+        if self.outside is not None:
+            out[self.outside[chunk]] = cval
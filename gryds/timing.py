@@ -0,0 +1,194 @@
+#! /usr/bin/env python
+#
+# Timing hooks for the stages of the transformation pipeline
+
+
+from __future__ import division, print_function, absolute_import
+
+import collections
+import threading
+from timeit import default_timer
+
+
+# The stages that are timed. Stages can run inside other stages, e.g.
+# 'transform' inside 'grid_transform', so only the self times of different
+# stages add up. The number of bytes a stage allocates is an estimate from
+# the sizes of the arrays it creates. The stages are:
+#   'grid':               building the points of a regular grid.
+#   'grid_transform':     Grid.transform(), including the 'transform' stages.
+#   'transform':          Transformation.transform() on a set of points.
+#   'composed_transform': ComposedTransformation.transform(), including the
+#                         'transform' stages of its transformations.
+#   'scaled_to':          Grid.scaled_to(), scaling a grid to image voxels.
+#   'prefilter':          computing B-spline coefficients of an image.
+#   'map_coordinates':    sampling an image at points.
+#   'sample':             sampling an image with B-spline stencils, e.g. by a
+#                         SamplingPlan or all channels of an image at once.
+#   'affine_transform':   sampling an image along an affine transformation.
+#   'cast':               converting points or samples to another data type.
+
+StageRecord = collections.namedtuple(
+    'StageRecord', ['stage', 'seconds', 'self_seconds', 'points', 'nbytes',
+                    'recursive'])
+StageRecord.__doc__ = """The timing of one execution of a pipeline stage.
+
+Attributes:
+    stage (str): The name of the stage.
+    seconds (float): The wall time of the stage, including nested stages.
+    self_seconds (float): The wall time of the stage, excluding nested
+        stages. The self times of all records add up to the instrumented
+        time without counting any time twice.
+    points (int): The number of points the stage processed, or None.
+    nbytes (int): An estimate of the number of bytes the stage allocated,
+        from the sizes of the arrays it creates, or None.
+    recursive (bool): True if the stage ran inside another stage of the same
+        name, e.g. the forward 'transform' of an inverse transformation, so
+        its time is already included in the outer stage's seconds.
+"""
+
+# The callbacks that are called with a StageRecord after every stage. Stages
+# are only timed if there are callbacks.
+_callbacks = []
+
+# The stages that are running in each thread, innermost last.
+_local = threading.local()
+
+
+class _NullStage(object):
+    """The context of a stage while timing is disabled: it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """The context of a stage that is timed."""
+
+    __slots__ = ('name', 'points', 'nbytes', 'start', 'nested')
+
+    def __init__(self, name, points, nbytes):
+        self.name = name
+        self.points = points
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.nested = 0.
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *args):
+        seconds = default_timer() - self.start
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested += seconds
+        recursive = any(x.name == self.name for x in stack)
+        record = StageRecord(self.name, seconds, seconds - self.nested,
+                             self.points, self.nbytes, recursive)
+        for callback in list(_callbacks):
+            callback(record)
+        return False
+
+
+def stage(name, points=None, nbytes=None):
+    """
+    Returns a context manager that times a stage of the pipeline. While no
+    callbacks are registered, it is a shared object that does nothing.
+
+    Args:
+        name (str): The name of the stage.
+        points (int): The number of points the stage processes.
+        nbytes (int): An estimate of the number of bytes the stage
+            allocates.
+    Returns:
+        A context manager.
+    """
+    if not _callbacks:
+        return _NULL_STAGE
+    return _Stage(name, points, nbytes)
+
+
+def add_callback(callback):
+    """
+    Registers a function that is called with a StageRecord after every
+    stage of the pipeline, in the thread that ran the stage.
+
+    Args:
+        callback (callable): A function of one StageRecord.
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    """
+    Unregisters a function that was registered with add_callback().
+
+    Args:
+        callback (callable): The registered function.
+    Raises:
+        ValueError: If the function is not registered.
+    """
+    _callbacks.remove(callback)
+
+
+class Recorder(object):
+    """Records the stages of the pipeline while it is used as a context
+    manager, e.g.:
+
+    >>> with gryds.timing.Recorder() as recorder:
+    ...     interpolator.transform(bspline)
+    >>> recorder.summary()['map_coordinates']['seconds']
+
+    Attributes:
+        records (list): The StageRecords, in the order the stages finished.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __repr__(self):
+        return '{}({} records)'.format(self.__class__.__name__,
+                                       len(self.records))
+
+    def __enter__(self):
+        add_callback(self.records.append)
+        return self
+
+    def __exit__(self, *args):
+        remove_callback(self.records.append)
+        return False
+
+    def summary(self):
+        """
+        Sums the records per stage. A stage's 'seconds' include the stages
+        that ran inside it, so only the 'self_seconds' of different stages
+        add up to the total instrumented time. Recursive records are not
+        added to 'seconds', so no time is counted twice within a stage.
+
+        Returns:
+            dict: Per stage name, a dict with the number of executions
+                ('count'), and the sums of 'seconds', 'self_seconds',
+                'points', and (estimated) 'nbytes'.
+        """
+        summary = collections.OrderedDict()
+        for record in self.records:
+            totals = summary.setdefault(record.stage, {
+                'count': 0, 'seconds': 0., 'self_seconds': 0., 'points': 0,
+                'nbytes': 0})
+            totals['count'] += 1
+            if not record.recursive:
+                totals['seconds'] += record.seconds
+            totals['self_seconds'] += record.self_seconds
+            totals['points'] += record.points or 0
+            totals['nbytes'] += record.nbytes or 0
+        return summary
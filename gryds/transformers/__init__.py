@@ -9,7 +9,8 @@ from .composed import ComposedTransformation
 from .translation import TranslationTransformation
 from .linear import LinearTransformation
 from .affine import AffineTransformation
-from .bspline import BSplineTransformation
+from .bspline import BSplineTransformation, InverseBSplineTransformation
+from .displacement import DisplacementFieldTransformation
 from .base import Transformation
 
 try:
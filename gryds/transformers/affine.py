@@ -12,7 +12,7 @@
 from __future__ import division, print_function, absolute_import
 
 import numpy as np
-from ..config import DTYPE
+from ..config import DTYPE, working_dtype
 from .linear import LinearTransformation
 
 
@@ -26,10 +26,13 @@ class AffineTransformation(LinearTransformation):
         parameters (np.ndarray): An (ndim ) x (ndim + 1) array
             representing the augmented affine matrix, where ndim is either
             2 or 3.
+        dtype (type): The data type of the matrix and the default data type
+            of the transformed points.
     """
 
     def __init__(self, ndim, center=None, center_of=None, scaling=None,
-                 angles=None, translation=None, shear_matrix=None):
+                 angles=None, translation=None, shear_matrix=None,
+                 dtype=DTYPE):
         """
         Given a shear matrix G, a center c, a scaling s, angles a, and
         translation t computes on a point x:
@@ -47,6 +50,8 @@ class AffineTransformation(LinearTransformation):
             translation (np.array): The (ndim) array of translation.
             center (np.array): The (ndim) array of the center of rotation in
                 relative coordinates (i.e. in the [0, 1)^ndim domain.
+            dtype (type): The data type of the matrix and the default data
+                type of the transformed points.
         Raises:
             ValueError: If the number of angles is not 1 or 3.
             ValueError: If the number of elements in the shear_matrix, scaling,
@@ -56,15 +61,10 @@ class AffineTransformation(LinearTransformation):
             center = _center_of(center_of)
         matrix = _affine_matrix(
             ndim=ndim, center=center, scaling=scaling, angles=angles,
-            translation=translation, shear_matrix=shear_matrix
+            translation=translation, shear_matrix=shear_matrix,
+            dtype=working_dtype(dtype)
         )
-        super(AffineTransformation, self).__init__(matrix)
-
-    def _transform_points(self, points):
-        augmented_points = np.ones((self.ndim + 1, points.shape[1]))
-        augmented_points[:self.ndim] = points
-        transformed_points = np.dot(self.parameters, augmented_points)
-        return transformed_points[:self.ndim, :]
+        super(AffineTransformation, self).__init__(matrix, dtype=dtype)
 
 
 def _center_of(image):
@@ -73,7 +73,7 @@ def _center_of(image):
 
 
 def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
-                  angles=None, translation=None):
+                  angles=None, translation=None, dtype=DTYPE):
     """
     Args:
         shear_matrix (np.array): An (ndim x ndim) matrix with shear
@@ -84,6 +84,7 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
         translation (np.array): The (ndim) array of translation.
         center (np.array): The (ndim) array of the center of rotation in
             relative coordinates (i.e. in the [0, 1)^ndim domain.
+        dtype (type): The data type the matrix is computed in.
     Raises:
         ValueError: If the number of angles is not 1 or 3.
         ValueError: If the number of elements in the shear_matrix, scaling,
@@ -92,7 +93,7 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
         When shear_matrix contains a scaling components (i.e. determinant != 0).
     """
     if angles is not None:
-        angles = np.array(angles, dtype=DTYPE)
+        angles = np.array(angles, dtype=dtype)
         if len(angles) == 1 and ndim == 2:
             rotation_matrix = rotation_matrix_2d(*angles)
         elif len(angles) == 3 and ndim == 3:
@@ -105,7 +106,7 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
         rotation_matrix = np.eye(ndim)
 
     if shear_matrix is not None:
-        shear_matrix = np.array(shear_matrix, dtype=DTYPE)
+        shear_matrix = np.array(shear_matrix, dtype=dtype)
         if shear_matrix.shape != (ndim, ndim):
             raise ValueError(
                 'Number of dimensions in the shear matrix {} does not match '
@@ -119,7 +120,7 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
         shear_matrix = np.eye(ndim)
 
     if scaling is not None:
-        scaling = np.array(scaling, dtype=DTYPE)
+        scaling = np.array(scaling, dtype=dtype)
         if len(scaling) != ndim:
             raise ValueError(
                 'Number of dimensions in the scaling array {} does not match '
@@ -129,7 +130,7 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
     scaling_matrix = np.diag(scaling)
 
     if translation is not None:
-        translation = np.array(translation, dtype=DTYPE)
+        translation = np.array(translation, dtype=dtype)
         if len(translation) != ndim:
             raise ValueError(
                 'Number of dimensions in the translation array {} does not '
@@ -137,21 +138,21 @@ def _affine_matrix(ndim, center=None, shear_matrix=None, scaling=None,
     else:
         translation = np.zeros(ndim)
 
-    pre_translation = np.eye(ndim + 1, dtype=DTYPE)
+    pre_translation = np.eye(ndim + 1, dtype=dtype)
     if center is not None:
-        center = np.array(center, dtype=DTYPE)
+        center = np.array(center, dtype=dtype)
         translation += center
         pre_translation[:ndim, -1] = -center
 
-    transform_matrix = np.zeros((ndim, ndim + 1), dtype=DTYPE)
-    transform_matrix[:ndim, :ndim] = np.eye(ndim, dtype=DTYPE)
+    transform_matrix = np.zeros((ndim, ndim + 1), dtype=dtype)
+    transform_matrix[:ndim, :ndim] = np.eye(ndim, dtype=dtype)
     mat = np.dot(rotation_matrix, np.dot(shear_matrix, scaling_matrix))
 
     transform_matrix[:, :-1] = mat
     transform_matrix[:, -1] = translation
 
     matrix = np.dot(transform_matrix, pre_translation)
-    return matrix.astype(DTYPE)
+    return matrix.astype(dtype)
 
 
 def rotation_matrix_2d(theta):
@@ -7,6 +7,7 @@ from __future__ import division, print_function, absolute_import
 
 import numpy as np
 from ..config import DTYPE
+from .. import timing
 
 
 class Transformation(object):
@@ -25,16 +26,22 @@ class Transformation(object):
         ndim (int): The number of dimensions.
         parameters (iterable/array): Some array-like representation of the 
             transformation parameters, dependant on kind of transformation.
+        dtype (type): The default data type of the transformed points.
     """
 
-    def __init__(self, ndim, parameters):
+    # The name of the timing stage of transform(), see gryds.timing.
+    _timing_stage = 'transform'
+
+    def __init__(self, ndim, parameters, dtype=DTYPE):
         """
         Args:
             ndim (int): Number of dimensions of the transformation, used for
                 checking the dimensions of points to be transformed.
+            dtype (type): The default data type of the transformed points.
         """
         self.ndim = ndim
         self.parameters = parameters
+        self.dtype = dtype
 
     def __repr__(self):
         return '{}({}D)'.format(self.__class__.__name__, self.ndim)
@@ -57,44 +64,158 @@ class Transformation(object):
                 'Dimensions not compatible: {}D point cannot be transformed'
                 ' by {}D transformer.'.format(points.shape[0], self.ndim))
 
-    def _transform_points(self, points):
-        """Template for transformer function."""
+    def _transform_points(self, points, out=None):
+        """Template for transformer function. Implementations should not
+        modify the points, and write the result into out if it is given."""
         raise NotImplementedError
 
-    def transform(self, points, scale=None):
+    def transform(self, points, scale=None, out=None, dtype=None):
         """Calling the _transform_points function with dimension checks.
 
         Args:
             points (np.array): A (self.ndim x N) array of N points.
             scale (np.array): An array of self.ndim scaling factors.
+            out (np.array): A (self.ndim x N) array the result is written to.
+                By default a new array is allocated.
+            dtype (type): The data type the points are transformed in.
+                Default is the data type of out if it is given, and
+                self.dtype otherwise.
         Returns:
             (np.array): The (self.ndim x N) array of N transformed points.
         Raises:
             ValueError: If the points and self.ndim are not compatible.
         """
-        points = np.array(points, dtype=DTYPE)
+        if dtype is None:
+            dtype = self.dtype if out is None else out.dtype
+        points = np.asarray(points, dtype=dtype)
+        self._dimension_check(points)
+
+        with timing.stage(self._timing_stage,
+                          points=points.size // self.ndim,
+                          nbytes=0 if out is not None else points.nbytes):
+            if not scale:
+                scale = None
+            else:
+                scale = np.array(scale, dtype=dtype)[:, None]
+                points = points / scale
+
+            if out is None:
+                result = self._transform_points(points)
+            else:
+                result = self._transform_points(points, out=out)
+            result = np.asarray(result, dtype=dtype)
+
+            if scale is not None:
+                result *= scale
+            if out is not None and result is not out:
+                out[...] = result
+                result = out
+        return result
+
+    def _jacobian(self, points):
+        """Template for the analytic Jacobian. Implementations return None if
+        the transformation has no analytic Jacobian."""
+        return None
+
+    def jacobian(self, points, dtype=None):
+        """Calling the _jacobian function with dimension checks.
+
+        Args:
+            points (np.array): A (self.ndim x N) array of N points.
+            dtype (type): The data type of the Jacobian. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x self.ndim x N) array of Jacobian
+                matrices at the points, where element [i, j] is the
+                derivative of the i-th transformed coordinate with respect to
+                the j-th coordinate. None if the transformation has no
+                analytic Jacobian.
+        Raises:
+            ValueError: If the points and self.ndim are not compatible.
+        """
+        points = np.asarray(points, dtype=dtype or self.dtype)
+        self._dimension_check(points)
+        return self._jacobian(points)
+
+    def jacobian_axes(self, axes, dtype=None):
+        """Computes the Jacobian at all points of a regular grid, defined by
+        the coordinates along each of its axes. Subclasses can override this
+        function to exploit the grid's separable structure.
+
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type of the Jacobian. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x self.ndim x N1 x ... x Nndim) array
+                of Jacobian matrices, or None if the transformation has no
+                analytic Jacobian.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        grid = np.array(np.meshgrid(*axes, indexing='ij'), dtype=dtype)
+        result = self.jacobian(grid.reshape(self.ndim, -1), dtype=dtype)
+        if result is None:
+            return None
+        return result.reshape((self.ndim,) + grid.shape)
+
+    def inverse(self):
+        """Returns the inverse transformation, which maps transformed points
+        back to the original points.
 
-        if not scale:
-            scale = [1]
+        Returns:
+            (Transformation): The inverse transformation.
+        Raises:
+            NotImplementedError: If the transformation has no inverse.
+        """
+        raise NotImplementedError(
+            '{} has no inverse.'.format(self.__class__.__name__))
 
-        scale = np.array(scale, dtype=DTYPE)[:, None]
-        scaled_points = points / scale
+    def augmented_matrix(self):
+        """Returns the (self.ndim + 1) x (self.ndim + 1) augmented matrix of
+        the transformation in relative coordinates, if the transformation is
+        affine.
 
-        self._dimension_check(scaled_points)
-        result = self._transform_points(scaled_points).astype('float32') * scale
+        Returns:
+            (np.array): The augmented matrix, or None if the transformation
+                is not affine.
+        """
+        return None
+
+    def transform_axes(self, axes, dtype=None):
+        """Transforms all points of a regular grid, defined by the coordinates
+        along each of its axes. Subclasses can override this function to
+        exploit the grid's separable structure.
 
-        return result.astype(DTYPE)
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type the points are transformed in.
+                Default is self.dtype.
+        Returns:
+            (np.array): The (self.ndim x N1 x ... x Nndim) array of
+                transformed grid points.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        grid = np.array(np.meshgrid(*axes, indexing='ij'), dtype=dtype)
+        result = self.transform(grid.reshape(self.ndim, -1), dtype=dtype)
+        return result.reshape(grid.shape)
 
-    def __call__(self, points, scale=None):
+    def __call__(self, points, scale=None, out=None, dtype=None):
         """Calling the transformation as a function invokes the `transform`
         function.
 
         Args:
             points (np.array): A (self.ndim x N) array of N points.
             scale (np.array): An array of self.ndim scaling factors.
+            out (np.array): A (self.ndim x N) array the result is written to.
+                By default a new array is allocated.
+            dtype (type): The data type the points are transformed in.
         Returns:
             (np.array): The (self.ndim x N) array of N transformed points.
         Raises:
             ValueError: If the points and self.ndim are not compatible.
         """
-        return self.transform(points, scale)
+        return self.transform(points, scale, out=out, dtype=dtype)
@@ -7,7 +7,9 @@ from __future__ import division, print_function, absolute_import
 
 import numpy as np
 import scipy.ndimage as nd
-from ..config import DTYPE
+from ..config import DTYPE, working_dtype
+from ..stencil import BSplineStencil, coefficient_table, interpolate, \
+    interpolate_gradient
 from .base import Transformation
 from .affine import _center_of
 
@@ -22,9 +24,11 @@ class BSplineTransformation(Transformation):
         bspline_order (int): The order of the B-spline.
         mode (str): How edges of image domain should be treated when transformed.
         cval (numeric): Constant value for mode='constant'
+        dtype (type): The data type of the control point grid and the default
+            data type of the transformed points.
     """
 
-    def __init__(self, grid, order=3, mode='mirror', cval=0):
+    def __init__(self, grid, order=3, mode='mirror', cval=0, dtype=DTYPE):
         """
         Args:
             grid (np.array): An (ndim x N1 x N2 x ... Nndim) sized array of
@@ -38,21 +42,57 @@ class BSplineTransformation(Transformation):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            dtype (type): The data type of the control point grid and the
+                default data type of the transformed points. Use np.float16
+                to halve the memory used by large grids; they are still
+                interpolated in higher precision.
         Raises:
             ValueError: If grid.shape[0] is not equal to grid.ndim -1
         """
-        grid = np.array(grid, dtype=DTYPE)
+        grid = np.array(grid, dtype=dtype)
         if grid.shape[0] is not grid.ndim - 1:
             raise ValueError('First axis of grid should be equal to '
                              'transform\'s ndim {}.'.format(grid.ndim - 1))
         self.bspline_order = order
         self.mode = mode
         self.cval = cval
+        self._coefficients = None
+        self._table = None
         super(BSplineTransformation, self).__init__(
             ndim=len(grid),
-            parameters=grid
+            parameters=grid,
+            dtype=dtype
         )
 
+    def __getstate__(self):
+        # Only the control points are pickled, the cached coefficients are
+        # recomputed on demand.
+        state = self.__dict__.copy()
+        state['_coefficients'] = None
+        state['_table'] = None
+        return state
+
+    def clear_cache(self):
+        """Removes the cached B-spline coefficients. Call this method after
+        modifying the parameters in place."""
+        self._coefficients = None
+        self._table = None
+
+    def _spline_coefficients(self):
+        """Returns the prefiltered B-spline coefficients of every component of
+        the control point grid, computing them once."""
+        if self._coefficients is None:
+            parameters = self.parameters.astype(
+                working_dtype(self.parameters.dtype), copy=False)
+            if self.bspline_order > 1:
+                self._coefficients = np.array([
+                    nd.spline_filter(component, order=self.bspline_order,
+                                     mode=self.mode)
+                    for component in parameters])
+            else:
+                self._coefficients = parameters
+        return self._coefficients
+
     def __repr__(self):
         return '{}({}D, {})'.format(
             self.__class__.__name__,
@@ -60,25 +100,421 @@ class BSplineTransformation(Transformation):
             'x'.join([str(x) for x in self.parameters.shape[1:]])
         )
 
-    def _transform_points(self, points):
-        assert points.dtype == DTYPE
-        # Empty list for the interpolated B-spline grid's components.
-        displacement = []
+    def _transform_points(self, points, out=None):
+        if out is None:
+            out = np.empty(points.shape, dtype=points.dtype)
 
         # Points is in the [0, 1)^ndim domain. Here it is scaled to the
         # B-spline grid's size.
-        scaled_points = points * (
-            np.array(self.parameters.shape[1:], dtype=DTYPE) - 1)[:, None]
-
-        # Every component (e.g. Tx, Ty, Tz in 3D) of the B-spline grid is
-        # interpolated at the scaled point's positions.
-        for bspline_component in self.parameters:
-            displacement.append(
-                nd.map_coordinates(bspline_component, scaled_points,
-                                   order=self.bspline_order,
-                                   mode=self.mode,
-                                   cval=self.cval)
-            )
-        result = (points + np.array(displacement))
-        assert result.dtype == DTYPE
+        scaled_points = points * (np.array(
+            self.parameters.shape[1:],
+            dtype=working_dtype(points.dtype)) - 1)[:, None]
+
+        if self.mode in BSplineStencil.supported_modes:
+            # The B-spline basis weights and coefficient indices only depend
+            # on the points, so they are computed once for all components.
+            interpolate(self._coefficient_table(), self.parameters.shape[1:],
+                        scaled_points, order=self.bspline_order,
+                        mode=self.mode, cval=self.cval, dtype=np.float64,
+                        out=out.T)
+        else:
+            # Every component (e.g. Tx, Ty, Tz in 3D) of the B-spline grid is
+            # interpolated at the scaled point's positions.
+            parameters = self.parameters.astype(
+                working_dtype(self.parameters.dtype), copy=False)
+            for bspline_component, component_out in zip(parameters, out):
+                component_out[...] = nd.map_coordinates(
+                    bspline_component, scaled_points,
+                    output=working_dtype(out.dtype),
+                    order=self.bspline_order,
+                    mode=self.mode,
+                    cval=self.cval)
+
+        result = np.add(points, out, out=out)
+        assert result.dtype == points.dtype
+        return result
+
+    def _derivative_bound(self):
+        """
+        Bounds the derivatives of the displacement on the [0, 1]^ndim domain.
+        The derivative of a B-spline of order n is a B-spline of order n - 1
+        of the differences of neighbouring coefficients. Its basis functions
+        are non-negative and sum to one, so the largest coefficient
+        difference along an axis bounds the derivative along that axis.
+
+        Returns:
+            np.array: An ndim x ndim array B with |du_i / dx_j| <= B[i, j],
+                or None if the bound does not apply to the order or mode.
+        """
+        if self.bspline_order < 1 or \
+                self.mode not in BSplineStencil.supported_modes:
+            return None
+        coefficients = self._spline_coefficients()
+        bound = np.zeros((self.ndim, self.ndim))
+        for axis, size in enumerate(self.parameters.shape[1:]):
+            if size < 2:
+                continue
+            differences = np.abs(np.diff(coefficients, axis=axis + 1))
+            bound[:, axis] = differences.reshape(self.ndim, -1).max(axis=1)
+            if self.mode == 'grid-wrap':
+                wrapped = np.abs(np.take(coefficients, 0, axis=axis + 1) -
+                                 np.take(coefficients, -1, axis=axis + 1))
+                bound[:, axis] = np.maximum(
+                    bound[:, axis], wrapped.reshape(self.ndim, -1).max(axis=1))
+            # From control point units to relative coordinates.
+            bound[:, axis] *= size - 1
+        return bound
+
+    def max_safe_scale(self):
+        """
+        Returns a factor s such that scaling the displacements of the control
+        points by any factor smaller than s in magnitude is guaranteed not to
+        fold the [0, 1]^ndim domain. The check is a sufficient condition in
+        O(number of control points): if the Lipschitz constant of the
+        displacement is below 1, the transformation is injective and its
+        Jacobian determinant is positive everywhere.
+
+        Returns:
+            float: The safe scale factor, np.inf for a constant displacement,
+                or 0 if the bound does not apply to the order or mode.
+        """
+        bound = self._derivative_bound()
+        if bound is None:
+            return 0.
+        lipschitz = min(np.linalg.norm(bound, order)
+                        for order in (1, 2, np.inf))
+        if lipschitz == 0:
+            return np.inf
+        return 1. / lipschitz
+
+    def is_diffeomorphic_bound(self):
+        """
+        Checks the sufficient condition of max_safe_scale() for the
+        transformation as it is. A False result is inconclusive: the
+        transformation may still be free of folds, which can be checked with
+        Grid.has_folds().
+
+        Returns:
+            bool: True if the transformation is guaranteed not to fold.
+        """
+        return self.max_safe_scale() > 1
+
+    def inverse(self, tol=1e-6, max_iterations=20):
+        """
+        Returns the inverse transformation, which is evaluated numerically
+        for every point. See InverseBSplineTransformation.
+
+        Args:
+            tol (float): The maximum residual, in relative coordinates, at
+                which a point is considered converged.
+            max_iterations (int): The maximum number of iterations per point.
+        Returns:
+            (InverseBSplineTransformation): The inverse transformation.
+        """
+        return InverseBSplineTransformation(self, tol=tol,
+                                            max_iterations=max_iterations)
+
+    def _coefficient_table(self):
+        """Returns the coefficients in the table layout used by stencils."""
+        if self._table is None:
+            self._table = coefficient_table(self._spline_coefficients(),
+                                            dtype=np.float64)
+        return self._table
+
+    def _jacobian(self, points):
+        # The derivative of the displacement is the derivative of the B-spline
+        # basis applied to the coefficients, scaled from the control point
+        # grid back to relative coordinates.
+        if self.mode not in BSplineStencil.supported_modes:
+            return None
+        scaling = np.array(self.parameters.shape[1:], dtype=np.float64) - 1
+        gradient = interpolate_gradient(
+            self._coefficient_table(), self.parameters.shape[1:],
+            points * scaling[:, None], order=self.bspline_order,
+            mode=self.mode, dtype=np.float64)
+        gradient *= scaling[None, :, None]
+        gradient[range(self.ndim), range(self.ndim)] += 1
+        return gradient.astype(points.dtype)
+
+    def jacobian_axes(self, axes, dtype=None):
+        """Computes the Jacobian at all points of a regular grid. Like
+        transform_axes(), the derivatives are computed by contracting the
+        coefficient grid with one small (derivative) basis matrix per axis.
+
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type of the Jacobian. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x self.ndim x N1 x ... x Nndim) array
+                of Jacobian matrices, or None if the mode is not supported by
+                stencils.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        if self.mode not in BSplineStencil.supported_modes:
+            return None
+        if len(axes) != self.ndim:
+            raise ValueError(
+                'Dimensions not compatible: {}D grid cannot be transformed'
+                ' by {}D transformer.'.format(len(axes), self.ndim))
+
+        values = []
+        derivatives = []
+        for points, size in zip(axes, self.parameters.shape[1:]):
+            stencil = BSplineStencil(
+                np.array(points, dtype=np.float64)[None] * (size - 1),
+                (size,), order=self.bspline_order, mode=self.mode,
+                dtype=np.float64, derivative=True)
+            values.append(stencil.matrix())
+            derivatives.append(stencil.matrix(derivative=True) * (size - 1))
+
+        result = np.empty((self.ndim, self.ndim) +
+                          tuple(len(x) for x in axes), dtype=dtype)
+        for column in range(self.ndim):
+            # Contracting the first spatial axis every time cycles the axes,
+            # so after ndim contractions they are back in order.
+            derivative = self._spline_coefficients()
+            for axis in range(self.ndim):
+                matrix = derivatives[axis] if axis == column else values[axis]
+                derivative = np.tensordot(derivative, matrix, axes=([1], [1]))
+            result[:, column] = derivative
+            result[column, column] += 1
+        return result
+
+    def transform_axes(self, axes, dtype=None):
+        """Transforms all points of a regular grid. The displacement on a
+        regular grid is a tensor product of 1D B-spline basis functions, so
+        instead of interpolating at every point it is computed by contracting
+        the coefficient grid with one small basis matrix per axis.
+
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type of the transformed points. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x N1 x ... x Nndim) array of
+                transformed grid points.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        if self.mode not in BSplineStencil.supported_modes:
+            return super(BSplineTransformation, self).transform_axes(
+                axes, dtype=dtype)
+        if len(axes) != self.ndim:
+            raise ValueError(
+                'Dimensions not compatible: {}D grid cannot be transformed'
+                ' by {}D transformer.'.format(len(axes), self.ndim))
+
+        displacement = self._spline_coefficients()
+        inside = None
+        for axis, (points, size) in enumerate(
+                zip(axes, self.parameters.shape[1:])):
+            scaled_points = np.array(points, dtype=np.float64) * (size - 1)
+            stencil = BSplineStencil(scaled_points[None], (size,),
+                                     order=self.bspline_order, mode=self.mode,
+                                     dtype=np.float64)
+            displacement = np.moveaxis(
+                np.tensordot(displacement, stencil.matrix(),
+                             axes=([axis + 1], [1])),
+                -1, axis + 1)
+            if stencil.outside is not None:
+                shape = [1] * self.ndim
+                shape[axis] = -1
+                axis_inside = ~stencil.outside.reshape(shape)
+                inside = axis_inside if inside is None else \
+                    inside & axis_inside
+
+        # With mode='constant', points outside of the control point grid are
+        # displaced by cval.
+        if self.cval and inside is not None:
+            displacement = displacement + self.cval * (1 - inside)
+        result = displacement.astype(dtype)
+        for axis, points in enumerate(axes):
+            shape = [1] * self.ndim
+            shape[axis] = -1
+            result[axis] += np.array(points, dtype=dtype).reshape(shape)
         return result
+
+
+class InverseBSplineTransformation(Transformation):
+    """The inverse of a B-spline transformation T. Every point y is mapped to
+    the point x for which T(x) = y, solved with a simplified Newton method:
+
+        x <- x - J(y)^-1 (T(x) - y)
+
+    starting from x = y - J(y)^-1 u(y), where u is the displacement of T and
+    J its Jacobian. The Jacobian is inverted once per point, so every iteration
+    costs one evaluation of T. Points converge independently, and are removed
+    from the iteration as soon as their residual is below the tolerance.
+    Where the Jacobian is not available or (nearly) singular, a fixed-point
+    step x <- y - u(x) is taken instead. The iteration converges if T does
+    not fold (see BSplineTransformation.max_safe_scale()).
+
+    On a regular grid, u and J are computed with the separable contractions
+    of BSplineTransformation.transform_axes() and jacobian_axes().
+
+    Attributes:
+        ndim (int): The number of dimensions.
+        parameters (BSplineTransformation): The transformation T that is
+            inverted.
+        tol (float): The maximum residual, in relative coordinates, at which
+            a point is considered converged.
+        max_iterations (int): The maximum number of iterations per point.
+            Points that have not converged by then keep their last estimate.
+        dtype (type): The default data type of the transformed points.
+    """
+
+    def __init__(self, transformation, tol=1e-6, max_iterations=20):
+        """
+        Args:
+            transformation (BSplineTransformation): The transformation that is
+                inverted.
+            tol (float): The maximum residual, in relative coordinates, at
+                which a point is considered converged.
+            max_iterations (int): The maximum number of iterations per point.
+        """
+        self.tol = tol
+        self.max_iterations = max_iterations
+        super(InverseBSplineTransformation, self).__init__(
+            ndim=transformation.ndim,
+            parameters=transformation,
+            dtype=transformation.dtype
+        )
+
+    def inverse(self):
+        return self.parameters
+
+    def _solve(self, targets, transformed, jacobian):
+        """
+        Solves T(x) = y for every point y.
+
+        Args:
+            targets (np.array): An ndim x N array of the points y, in double
+                precision.
+            transformed (np.array): The ndim x N array T(y).
+            jacobian (np.array): The ndim x ndim x N array of Jacobians J(y),
+                or None.
+        Returns:
+            np.array: The ndim x N array of solutions x.
+        """
+        forward = self.parameters
+        # Warm start with the solution of the linearization around y,
+        # y - J(y)^-1 u(y), or with y - u(y) without a Jacobian.
+        displacement = np.subtract(transformed, targets, out=transformed)
+        inverse = None
+        if jacobian is not None:
+            inverse, regular = _invert_matrices(jacobian)
+            inverse[:, :, ~regular] = np.eye(self.ndim)[..., None]
+            displacement = np.einsum('ijn,jn->in', inverse, displacement)
+        solution = np.subtract(targets, displacement, out=displacement)
+
+        active = np.arange(targets.shape[1])
+        for _ in range(self.max_iterations):
+            estimate = solution[:, active]
+            residual = forward.transform(estimate, dtype=np.float64)
+            residual -= targets[:, active]
+            converged = np.abs(residual).max(axis=0) <= self.tol
+            if np.all(converged):
+                break
+            if np.any(converged):
+                active = active[~converged]
+                estimate = estimate[:, ~converged]
+                residual = residual[:, ~converged]
+
+            if inverse is None:
+                step = residual
+            else:
+                step = np.einsum('ijn,jn->in', inverse[:, :, active],
+                                 residual)
+            solution[:, active] = estimate - step
+        return solution
+
+    def _transform_points(self, points, out=None):
+        if out is None:
+            out = np.empty(points.shape, dtype=points.dtype)
+        targets = np.asarray(points, dtype=np.float64)
+        forward = self.parameters
+        out[...] = self._solve(
+            targets, forward.transform(targets, dtype=np.float64),
+            forward.jacobian(targets, dtype=np.float64))
+        return out
+
+    def transform_axes(self, axes, dtype=None):
+        """Inverts the transformation at all points of a regular grid,
+        starting from the displacement and Jacobian on the grid.
+
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type of the transformed points. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x N1 x ... x Nndim) array of
+                transformed grid points.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        forward = self.parameters
+        shape = (self.ndim,) + tuple(len(x) for x in axes)
+        targets = np.array(np.meshgrid(*axes, indexing='ij'),
+                           dtype=np.float64).reshape(self.ndim, -1)
+        transformed = forward.transform_axes(axes, dtype=np.float64)
+        jacobian = forward.jacobian_axes(axes, dtype=np.float64)
+        if jacobian is not None:
+            jacobian = jacobian.reshape(self.ndim, self.ndim, -1)
+        solution = self._solve(targets, transformed.reshape(self.ndim, -1),
+                               jacobian)
+        return solution.reshape(shape).astype(dtype)
+
+    def _jacobian(self, points):
+        # The Jacobian of the inverse is the inverse of T's Jacobian at the
+        # solution.
+        solution = self.transform(points, dtype=np.float64)
+        jacobian = self.parameters.jacobian(solution, dtype=np.float64)
+        if jacobian is None:
+            return None
+        return _invert_matrices(jacobian)[0].astype(points.dtype)
+
+
+def _invert_matrices(matrices, min_det=1e-6):
+    """
+    Inverts a stack of small matrices. For 1D, 2D and 3D the inverse is
+    computed in closed form from the adjugate.
+
+    Args:
+        matrices (np.array): An ndim x ndim x N array of matrices.
+        min_det (float): The minimum absolute determinant of a matrix that is
+            considered invertible.
+    Returns:
+        tuple: The ndim x ndim x N array of inverses, and an N array that is
+            True for the invertible matrices. The inverses of the other
+            matrices are undefined.
+    """
+    m = matrices
+    ndim = len(m)
+    if ndim > 3:
+        stacked = np.moveaxis(m, (0, 1), (-2, -1))
+        regular = np.abs(np.linalg.det(stacked)) > min_det
+        inverse = np.zeros_like(stacked)
+        inverse[regular] = np.linalg.inv(stacked[regular])
+        return np.moveaxis(inverse, (-2, -1), (0, 1)), regular
+
+    adjugate = np.empty_like(m)
+    if ndim == 1:
+        adjugate[0, 0] = 1
+    elif ndim == 2:
+        adjugate[0, 0], adjugate[1, 1] = m[1, 1], m[0, 0]
+        adjugate[0, 1], adjugate[1, 0] = -m[0, 1], -m[1, 0]
+    else:
+        for i in range(3):
+            for j in range(3):
+                a, b = (j + 1) % 3, (j + 2) % 3
+                c, d = (i + 1) % 3, (i + 2) % 3
+                adjugate[i, j] = m[a, c] * m[b, d] - m[a, d] * m[b, c]
+    det = np.einsum('kn,kn->n', m[0], adjugate[:, 0])
+    regular = np.abs(det) > min_det
+    adjugate /= np.where(regular, det, 1)
+    return adjugate, regular
@@ -9,6 +9,7 @@ from __future__ import division, print_function, absolute_import
 import numpy as np
 from ..config import DTYPE
 from .base import Transformation
+from .linear import LinearTransformation
 
 
 class ComposedTransformation(Transformation):
@@ -26,16 +27,30 @@ class ComposedTransformation(Transformation):
     >>> t12 = ComposedTransform(t1, t2)
     >>> x2 = t12.transform(x0)
 
+    Consecutive affine transformations (translations, linear and affine
+    transformations) are multiplied into a single matrix when the composition
+    is built, so they are applied to the points in one matrix product. Changes
+    to their parameters after composition are therefore not reflected.
+
     Attributes:
         ndim (int): The number of dimensions.
         parameters (np.ndarray): Left empty
         transformations (Iterable): A sequence of Transformation objects
+        fused_transformations (list): The transformations that are applied,
+            with consecutive affine transformations fused.
+        dtype (type): The default data type of the transformed points.
     """
 
-    def __init__(self, *transformations):
+    # The transformations in the composition record their own 'transform'
+    # stages, so the composition is timed as a separate stage.
+    _timing_stage = 'composed_transform'
+
+    def __init__(self, *transformations, **kwargs):
         """
         Args:
             transformations (iterable): A sequence (list, tuple) of transformations.
+            dtype (type): The default data type of the transformed points.
+                Default is the widest data type of the transformations.
         Raises:
             ValueError: If the number of dimenions the transformations operate
                 on are not the same.
@@ -51,14 +66,134 @@ class ComposedTransformation(Transformation):
                              ), ndims))
         self.ndim = ndims[0]
         self.transformations = transformations
+        self.dtype = kwargs.get('dtype') or np.result_type(
+            *[getattr(x, 'dtype', DTYPE) for x in transformations]).type
+        self.fused_transformations = _fuse_affine(transformations, self.dtype)
 
     def __repr__(self):
         return '{}({}D, {})'.format(self.__class__.__name__, self.ndim,
             '∘'.join([str(x) for x in self.transformations]))
 
-    def _transform_points(self, points):
-        points_copy = points.copy()
-        for transform in self.transformations:
-            points_copy = transform.transform(points_copy)
-        assert points_copy.dtype == DTYPE
-        return points_copy
+    def _transform_points(self, points, out=None):
+        if out is None:
+            out = np.empty(points.shape, dtype=points.dtype)
+
+        # Alternate between two buffers, such that the last transformation
+        # writes into out and no transformation reads from its own output.
+        buffers = [out, None]
+        steps = len(self.fused_transformations)
+        for i, transform in enumerate(self.fused_transformations):
+            target = (steps - 1 - i) % 2
+            if buffers[target] is None:
+                buffers[target] = np.empty(points.shape, dtype=out.dtype)
+            points = transform.transform(points, out=buffers[target])
+        assert points.dtype == out.dtype
+        return points
+
+    def transform_axes(self, axes, dtype=None):
+        if dtype is None:
+            dtype = self.dtype
+        points = self.fused_transformations[0].transform_axes(axes,
+                                                              dtype=dtype)
+        shape = points.shape
+        points = points.reshape(self.ndim, -1)
+        for transform in self.fused_transformations[1:]:
+            points = transform.transform(points, dtype=dtype)
+        return points.reshape(shape)
+
+    def _jacobian(self, points):
+        # Chain rule: the Jacobian of every transformation is evaluated at the
+        # points transformed by the previous transformations.
+        jacobian = None
+        last = len(self.fused_transformations) - 1
+        for i, transform in enumerate(self.fused_transformations):
+            step = transform.jacobian(points, dtype=points.dtype)
+            if step is None:
+                return None
+            jacobian = step if jacobian is None else \
+                _chain_jacobians(step, jacobian)
+            if i < last:
+                points = transform.transform(points, dtype=points.dtype)
+        return jacobian
+
+    def jacobian_axes(self, axes, dtype=None):
+        if dtype is None:
+            dtype = self.dtype
+        first = self.fused_transformations[0]
+        jacobian = first.jacobian_axes(axes, dtype=dtype)
+        if jacobian is None or len(self.fused_transformations) == 1:
+            return jacobian
+        shape = jacobian.shape
+        rest = ComposedTransformation(*self.fused_transformations[1:],
+                                      dtype=dtype)
+        points = first.transform_axes(axes, dtype=dtype)
+        step = rest.jacobian(points.reshape(self.ndim, -1), dtype=dtype)
+        if step is None:
+            return None
+        return _chain_jacobians(
+            step, jacobian.reshape(self.ndim, self.ndim, -1)).reshape(shape)
+
+    def inverse(self):
+        """Returns the inverse transformation: the inverses of the
+        transformations, applied in reverse order.
+
+        Returns:
+            (ComposedTransformation): The inverse transformation.
+        Raises:
+            NotImplementedError: If any transformation has no inverse.
+        """
+        return ComposedTransformation(
+            *[x.inverse() for x in reversed(self.transformations)],
+            dtype=self.dtype)
+
+    def augmented_matrix(self):
+        if len(self.fused_transformations) == 1:
+            return self.fused_transformations[0].augmented_matrix()
+        return None
+
+
+def _chain_jacobians(outer, inner):
+    """
+    Multiplies two stacks of Jacobian matrices point by point.
+
+    Args:
+        outer (np.array): An ndim x ndim x N array of the Jacobians of the
+            transformation that is applied last.
+        inner (np.array): An ndim x ndim x N array of the Jacobians of the
+            transformation that is applied first.
+    Returns:
+        np.array: The ndim x ndim x N array of Jacobians of the composition.
+    """
+    return np.einsum('ik...,kj...->ij...', outer, inner)
+
+
+def _fuse_affine(transformations, dtype=DTYPE):
+    """
+    Replaces runs of consecutive affine transformations by a single
+    LinearTransformation with the product of their augmented matrices.
+
+    Args:
+        transformations (iterable): A sequence of transformations, in the
+            order they are applied.
+        dtype (type): The data type of the fused transformations.
+    Returns:
+        list: The fused sequence of transformations.
+    """
+    fused = []
+    run = []
+    for transform in list(transformations) + [None]:
+        matrix = None if transform is None else transform.augmented_matrix()
+        if matrix is not None:
+            run.append((transform, matrix))
+            continue
+        if len(run) == 1:
+            fused.append(run[0][0])
+        elif run:
+            product = run[0][1]
+            for _, matrix in run[1:]:
+                product = np.dot(matrix, product)
+            fused.append(LinearTransformation(product[:-1], dtype=dtype))
+        run = []
+        if transform is not None:
+            fused.append(transform)
+    return fused
@@ -8,7 +8,7 @@ from __future__ import division, print_function, absolute_import
 import numpy as np
 import cupy as cp
 import cupyx.scipy.ndimage as nd
-from ..config import DTYPE
+from ..config import DTYPE, working_dtype
 from .base import Transformation
 from .bspline import BSplineTransformation
 
@@ -23,9 +23,11 @@ class BSplineTransformationCuda(BSplineTransformation):
         bspline_order (int): The order of the B-spline.
         mode (str): How edges of image domain should be treated when transformed.
         cval (numeric): Constant value for mode='constant'
+        dtype (type): The data type of the control point grid and the default
+            data type of the transformed points.
     """
 
-    def __init__(self, grid, order=1, mode='mirror', cval=0):
+    def __init__(self, grid, order=1, mode='mirror', cval=0, dtype=DTYPE):
         """
         Args:
             grid (np.array): An (ndim x N1 x N2 x ... Nndim) sized array of
@@ -39,6 +41,8 @@ class BSplineTransformationCuda(BSplineTransformation):
                 scipy.ndimage.interpolation.map_coordinates.html for more
                 information about modes.
             cval (numeric): Constant value for mode='constant'
+            dtype (type): The data type of the control point grid and the
+                default data type of the transformed points.
         Raises:
             ValueError: If grid.shape[0] is not equal to grid.ndim -1
         """
@@ -46,11 +50,11 @@ class BSplineTransformationCuda(BSplineTransformation):
             grid=grid,
             order=order,
             mode=mode,
-            cval=cval
+            cval=cval,
+            dtype=dtype
         )
 
-    def _transform_points(self, points):
-        assert points.dtype == DTYPE
+    def _transform_points(self, points, out=None):
         # Empty list for the interpolated B-spline grid's components.
         displacement = []
 
@@ -60,12 +64,15 @@ class BSplineTransformationCuda(BSplineTransformation):
 
         # Points is in the [0, 1)^ndim domain. Here it is scaled to the
         # B-spline grid's size.
-        scaled_points = points_gpu * (
-            np.array(self.parameters.shape[1:], dtype=DTYPE) - 1)[:, None]
+        scaled_points = points_gpu * (np.array(
+            self.parameters.shape[1:],
+            dtype=working_dtype(points.dtype)) - 1)[:, None]
 
         # Every component (e.g. Tx, Ty, Tz in 3D) of the B-spline grid is
         # interpolated at the scaled point's positions.
-        for bspline_component in self.parameters:
+        parameters = self.parameters.astype(
+            working_dtype(self.parameters.dtype), copy=False)
+        for bspline_component in parameters:
             displacement.append(
                 cp.asnumpy(
                     nd.map_coordinates(input=cp.array(bspline_component),
@@ -75,7 +82,16 @@ class BSplineTransformationCuda(BSplineTransformation):
                                    cval=self.cval)
                 )
             )
-        result = points + np.array(displacement).reshape(points.shape)
+        result = np.add(points, np.array(displacement).reshape(points.shape),
+                        out=out, dtype=points.dtype, casting='same_kind')
 
-        assert result.dtype == DTYPE
+        assert result.dtype == points.dtype
         return result
+
+    def transform_axes(self, axes, dtype=None):
+        # The separable evaluation of BSplineTransformation runs on the CPU,
+        # so grids are transformed point by point on the GPU instead.
+        return Transformation.transform_axes(self, axes, dtype=dtype)
+
+    def jacobian_axes(self, axes, dtype=None):
+        return Transformation.jacobian_axes(self, axes, dtype=dtype)
@@ -0,0 +1,158 @@
+#! /usr/bin/env python
+#
+# Transformation by a dense displacement field
+
+
+from __future__ import division, print_function, absolute_import
+
+import numpy as np
+import scipy.ndimage as nd
+from ..config import DTYPE, working_dtype
+from ..stencil import BSplineStencil, coefficient_table, interpolate, \
+    interpolate_gradient
+from .base import Transformation
+
+
+class DisplacementFieldTransformation(Transformation):
+    """Transformation by a dense displacement field, e.g. a chain of
+    transformations that was evaluated once with Grid.displacement(). The
+    field is sampled with linear interpolation, so applying it costs one
+    gather of all displacement components per point, however expensive the
+    chain it was computed from.
+
+    The field holds displacements in voxels of a grid of the field's shape:
+    the voxel i along an axis of size N has relative coordinate i / N, as in
+    Grid(shape).
+
+    Attributes:
+        ndim (int): The number of dimensions.
+        parameters (np.ndarray): The displacement field in voxels, as an
+            ndim x N1 x ... x Nndim array.
+        mode (str): How points outside the field are treated.
+        cval (numeric): Constant displacement for mode='constant'.
+        dtype (type): The data type of the field and the default data type
+            of the transformed points.
+    """
+
+    def __init__(self, field, mode='mirror', cval=0, dtype=DTYPE):
+        """
+        Args:
+            field (np.array): An (ndim x N1 x N2 x ... Nndim) sized array of
+                displacements in voxels.
+            mode (str): How points outside the field are treated. One of
+                'constant', 'nearest', 'mirror', 'reflect', 'wrap'. Default is
+                'mirror'.
+            cval (numeric): Constant displacement for mode='constant'.
+            dtype (type): The data type of the field and the default data
+                type of the transformed points. Half-precision fields are
+                stored in single precision.
+        Raises:
+            ValueError: If field.shape[0] is not equal to field.ndim - 1.
+        """
+        field = np.asarray(field)
+        if field.shape[0] != field.ndim - 1:
+            raise ValueError('First axis of field should be equal to '
+                             'transform\'s ndim {}.'.format(field.ndim - 1))
+        self.mode = mode
+        self.cval = cval
+
+        # The field is stored once, in the point-major table layout of the
+        # stencils, so all components of a point are gathered at once. The
+        # parameters are a view of the table.
+        self._table = coefficient_table(field, dtype=working_dtype(dtype))
+        super(DisplacementFieldTransformation, self).__init__(
+            ndim=len(field),
+            parameters=self._table.T.reshape(field.shape),
+            dtype=dtype
+        )
+
+    def __getstate__(self):
+        # The parameters are a view of the table, and are restored as such.
+        state = self.__dict__.copy()
+        state['parameters'] = self.parameters.shape
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.parameters = self._table.T.reshape(state['parameters'])
+
+    def __repr__(self):
+        return '{}({}D, {})'.format(
+            self.__class__.__name__,
+            self.ndim,
+            'x'.join([str(x) for x in self.parameters.shape[1:]])
+        )
+
+    @property
+    def shape(self):
+        return self.parameters.shape[1:]
+
+    def _transform_points(self, points, out=None):
+        if out is None:
+            out = np.empty(points.shape, dtype=points.dtype)
+
+        # Points in the [0, 1)^ndim domain are scaled to voxels of the field.
+        shape = np.array(self.shape, dtype=working_dtype(points.dtype))
+        scaled_points = points * shape[:, None]
+
+        if self.mode in BSplineStencil.supported_modes:
+            interpolate(self._table, self.shape, scaled_points, order=1,
+                        mode=self.mode, cval=self.cval,
+                        dtype=self._table.dtype, out=out.T)
+        else:
+            for component, component_out in zip(self.parameters, out):
+                component_out[...] = nd.map_coordinates(
+                    component, scaled_points,
+                    output=working_dtype(out.dtype), order=1,
+                    mode=self.mode, cval=self.cval)
+
+        # Displacements in voxels are scaled back to relative coordinates.
+        out /= shape.astype(out.dtype)[:, None]
+        result = np.add(points, out, out=out)
+        assert result.dtype == points.dtype
+        return result
+
+    def transform_axes(self, axes, dtype=None):
+        """Transforms all points of a regular grid. If the grid is the grid
+        the field was evaluated on, the displacements are added without
+        interpolation.
+
+        Args:
+            axes (list): A list of self.ndim 1D arrays with the coordinates
+                of the grid along each axis.
+            dtype (type): The data type of the transformed points. Default is
+                self.dtype.
+        Returns:
+            (np.array): The (self.ndim x N1 x ... x Nndim) array of
+                transformed grid points.
+        """
+        if dtype is None:
+            dtype = self.dtype
+        knots = [np.arange(size) / size for size in self.shape]
+        if len(axes) != self.ndim or not all(
+                len(x) == len(y) and np.array_equal(x, y)
+                for x, y in zip(axes, knots)):
+            return super(DisplacementFieldTransformation,
+                         self).transform_axes(axes, dtype=dtype)
+
+        result = np.empty(self.parameters.shape, dtype=dtype)
+        for axis, points in enumerate(axes):
+            shape = [1] * self.ndim
+            shape[axis] = -1
+            np.divide(self.parameters[axis], self.shape[axis],
+                      out=result[axis], casting='unsafe')
+            result[axis] += np.asarray(points, dtype=dtype).reshape(shape)
+        return result
+
+    def _jacobian(self, points):
+        if self.mode not in BSplineStencil.supported_modes:
+            return None
+        shape = np.array(self.shape, dtype=np.float64)
+        gradient = interpolate_gradient(
+            self._table, self.shape, points * shape[:, None], order=1,
+            mode=self.mode, dtype=self._table.dtype).astype(np.float64)
+        # The gradient in voxels per voxel, converted to relative
+        # coordinates.
+        gradient *= (shape[None, :] / shape[:, None])[..., None]
+        gradient[range(self.ndim), range(self.ndim)] += 1
+        return gradient.astype(points.dtype)
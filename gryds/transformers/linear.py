@@ -16,32 +16,63 @@ class LinearTransformation(Transformation):
     Attributes:
         ndim (int): The number of dimensions.
         parameters (np.ndarray): The (ndim) x (ndim + 1) transformation matrix.
+        dtype (type): The data type of the matrix and the default data type
+            of the transformed points.
     """
 
-    def __init__(self, matrix):
+    def __init__(self, matrix, dtype=DTYPE):
         """
         Args:
             matrix (np.array): An (ndim ) x (ndim + 1) array
                 representing the augmented affine matrix.
+            dtype (type): The data type of the matrix and the default data
+                type of the transformed points.
         Raises:
             ValueError: If the matrix is not shaped correctly.
         """
-        matrix = np.array(matrix, dtype=DTYPE)
+        matrix = np.array(matrix, dtype=dtype)
 
         if matrix.shape[0] != matrix.shape[1] - 1:
             raise ValueError(
                 'Incorrect matrix shape, should be (ndim) x (ndim + 1),'
                 'is {}.'.format(matrix.shape))
 
-        super(LinearTransformation, self).__init__(len(matrix), matrix)
+        super(LinearTransformation, self).__init__(len(matrix), matrix,
+                                                   dtype=dtype)
 
-    def _transform_points(self, points):
-        augmented_points = np.ones((self.ndim + 1, points.shape[1]),
-                                   dtype=DTYPE)
-        augmented_points[:self.ndim] = points
+    def _transform_points(self, points, out=None):
+        # np.dot can only write into C-contiguous arrays of the exact result
+        # type, so the matrix is cast to the precision of the points.
+        if out is None or not out.flags.c_contiguous or \
+                out.dtype != points.dtype:
+            out = np.empty(points.shape, dtype=points.dtype)
+        matrix = self.parameters.astype(points.dtype, copy=False)
 
-        transformed_points = np.dot(self.parameters, augmented_points)
-        result = transformed_points[:self.ndim, :]
+        # Apply the linear part and the translation separately, so no
+        # augmented copy of the points is needed.
+        result = np.dot(matrix[:, :-1], points, out=out)
+        result += matrix[:, -1:]
 
-        assert result.dtype == DTYPE
+        assert result.dtype == points.dtype
         return result
+
+    def _jacobian(self, points):
+        matrix = self.parameters[:, :-1, None].astype(points.dtype)
+        return np.broadcast_to(matrix, (self.ndim, self.ndim, points.shape[1]))
+
+    def inverse(self):
+        """Returns the inverse transformation, by inverting the augmented
+        matrix in double precision.
+
+        Returns:
+            (LinearTransformation): The inverse transformation.
+        Raises:
+            np.linalg.LinAlgError: If the matrix is singular.
+        """
+        matrix = np.linalg.inv(self.augmented_matrix().astype(np.float64))
+        return LinearTransformation(matrix[:-1], dtype=self.dtype)
+
+    def augmented_matrix(self):
+        matrix = np.eye(self.ndim + 1)
+        matrix[:self.ndim] = self.parameters
+        return matrix
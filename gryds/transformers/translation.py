@@ -16,21 +16,37 @@ class TranslationTransformation(Transformation):
     Attributes:
         ndim (int): The number of dimensions.
         parameters (np.ndarray): Translation vector.
+        dtype (type): The default data type of the transformed points.
     """
 
-    def __init__(self, translation):
+    def __init__(self, translation, dtype=DTYPE):
         """
         Args:
             translation (np.array): Translation vector.
+            dtype (type): The default data type of the transformed points.
         """
         super(TranslationTransformation, self).__init__(
             ndim=len(translation),
-            parameters=np.array(translation)
+            parameters=np.array(translation),
+            dtype=dtype
         )
 
     def __repr__(self):
         return '{}({}D, t={})'.format(self.__class__.__name__, self.ndim, self.parameters)
 
-    def _transform_points(self, points):
-        result = (points + self.parameters[:, None])
-        return result
+    def _transform_points(self, points, out=None):
+        if out is None:
+            out = np.empty(points.shape, dtype=points.dtype)
+        return np.add(points, self.parameters[:, None], out=out)
+
+    def _jacobian(self, points):
+        return np.broadcast_to(np.eye(self.ndim, dtype=points.dtype)[..., None],
+                               (self.ndim, self.ndim, points.shape[1]))
+
+    def inverse(self):
+        return TranslationTransformation(-self.parameters, dtype=self.dtype)
+
+    def augmented_matrix(self):
+        matrix = np.eye(self.ndim + 1)
+        matrix[:self.ndim, -1] = self.parameters
+        return matrix
@@ -4,6 +4,8 @@
 
 
 import numpy as np
+from .transformers.bspline import BSplineTransformation
+from .interpolators.grid import Grid
 
 
 def dvf_opts(dvf):
@@ -32,20 +34,49 @@ def dvf_show(dvf):
     }
 
 
-def max_no_fold(size):
-    """Find a B-spline grid with maximal range without folding."""
+def max_no_fold(size, order=3, mode='mirror', check_shape=None, shrink=0.9,
+                rng=None):
+    """Find a B-spline grid with maximal range without folding.
+
+    A uniformly distributed grid is drawn, and checked with the sufficient
+    condition of BSplineTransformation.is_diffeomorphic_bound(). Only if that
+    is inconclusive, the Jacobian determinant is checked on a dense grid, and
+    the grid is scaled down until it does not fold.
+
+    Args:
+        size (iterable): The size of the B-spline grid, ndim x N1 x ... x Nndim.
+        order (int): The order of the B-spline transformation.
+        mode (str): The mode of the B-spline transformation.
+        check_shape (iterable): The shape of the dense grid for the fold
+            check. Default is 4 points per control point spacing.
+        shrink (float): The factor the grid is scaled by while it folds.
+        rng (np.random.Generator): The random number generator. Default is
+            the global NumPy random state.
+    Returns:
+        np.array: The B-spline grid.
+    """
     scale = [0.5 * 1. / (4 * (x - 1)) for x in size[1:]]
-    return unif(scale, size)
+    grid = unif(scale, size, rng=rng)
+    if check_shape is None:
+        check_shape = [4 * (x - 1) + 1 for x in size[1:]]
+    dense_grid = Grid(check_shape)
+
+    trf = BSplineTransformation(grid, order=order, mode=mode)
+    while not trf.is_diffeomorphic_bound() and dense_grid.has_folds(trf):
+        grid = grid * shrink
+        trf = BSplineTransformation(grid, order=order, mode=mode)
+    return grid
 
 
-def unif(scale, size):
+def unif(scale, size, rng=None):
     """Returns a uniformly distributed grid of given size
-    and displacement scale"""
+    and displacement scale, drawn from rng or the global NumPy random state.
+    """
 
-    size = np.array([size]).flatten()
-    # return scale * 2 * (np.random.rand(*size) - 0.5)
-    return np.array([
-        x * y for x, y in zip(scale, 2 * (np.random.rand(*size) - 0.5))])
+    size = tuple(np.array([size]).flatten())
+    random = np.random.rand(*size) if rng is None else rng.random(size)
+    scale = np.reshape(scale, (-1,) + (1,) * (len(size) - 1))
+    return scale * (2 * (random - 0.5))
 
 
 def phantom_image(size, spacing=4, thickness=1, offset=0):
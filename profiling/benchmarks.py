@@ -0,0 +1,311 @@
+#! /usr/bin/env python
+#
+# Headless benchmark suite. Times the transformation and interpolation
+# pipeline for a set of cases, writes the results as JSON, and compares them
+# with a stored baseline.
+#
+# Usage:
+#   python benchmarks.py [--output results.json] [--baseline baseline.json]
+#                        [--filter PATTERN] [--repeat N] [--tolerance T]
+#
+# The exit status is 1 if any benchmark is slower than the baseline by more
+# than the tolerance, so the suite can fail a CI job.
+
+
+from __future__ import division, print_function, absolute_import
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import timeit
+
+import numpy as np
+import scipy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+import gryds
+from gryds import config
+
+
+# Image shapes per number of dimensions.
+SHAPES = {
+    2: (256, 256),
+    3: (64, 64, 64),
+}
+
+# B-spline control grid shape per number of dimensions.
+CONTROL_SHAPES = {
+    2: (8, 8),
+    3: (6, 6, 6),
+}
+
+ORDERS = (0, 1, 3)
+
+CHAINS = ('affine', 'bspline', 'composed')
+
+
+class Benchmark(object):
+    """A timed case. setup() is called before every repeat and is not timed;
+    it returns the callable that is timed, so caches (e.g. prefiltered
+    coefficients) do not carry over between repeats.
+
+    Attributes:
+        name (str): The unique name of the benchmark.
+        params (dict): The parameters of the case, recorded in the results.
+    """
+
+    def __init__(self, name, setup, **params):
+        self.name = name
+        self.setup = setup
+        self.params = params
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.name)
+
+    def run(self, repeat=5, warmup=1):
+        """
+        Times the benchmark.
+
+        Args:
+            repeat (int): The number of timed runs.
+            warmup (int): The number of untimed runs before the timed runs.
+        Returns:
+            dict: The parameters and the minimum, median, mean, and standard
+                deviation of the run times in seconds.
+        """
+        for _ in range(warmup):
+            self.setup()()
+        times = []
+        for _ in range(repeat):
+            function = self.setup()
+            start = timeit.default_timer()
+            function()
+            times.append(timeit.default_timer() - start)
+        return {
+            'params': self.params,
+            'repeat': repeat,
+            'min': float(np.min(times)),
+            'median': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'std': float(np.std(times)),
+        }
+
+
+def _chain(name, ndim, rng):
+    """Returns a list of transformations of the named kind."""
+    affine = gryds.AffineTransformation(
+        ndim=ndim, angles=[0.1] * (1 if ndim == 2 else 3),
+        scaling=[1.05] * ndim, center=[0.5] * ndim)
+    bspline = gryds.BSplineTransformation(
+        rng.uniform(-0.02, 0.02, (ndim,) + CONTROL_SHAPES[ndim]))
+    if name == 'affine':
+        return [affine]
+    if name == 'bspline':
+        return [bspline]
+    return [affine, bspline, gryds.TranslationTransformation([0.01] * ndim)]
+
+
+def _interpolation(ndim, order, chain, seed):
+    def setup():
+        rng = np.random.RandomState(seed)
+        image = rng.rand(*SHAPES[ndim]).astype(config.DTYPE)
+        transforms = _chain(chain, ndim, rng)
+        interpolator = gryds.BSplineInterpolator(image, order=order)
+        return lambda: interpolator.transform(*transforms)
+    return setup
+
+
+def _multichannel(chain, seed):
+    def setup():
+        rng = np.random.RandomState(seed)
+        image = rng.rand(*SHAPES[2] + (3,)).astype(config.DTYPE)
+        transforms = _chain(chain, 2, rng)
+        interpolator = gryds.MultiChannelInterpolator(image, order=3)
+        return lambda: interpolator.transform(*transforms)
+    return setup
+
+
+def _jacobian(ndim, seed):
+    def setup():
+        rng = np.random.RandomState(seed)
+        transform = _chain('bspline', ndim, rng)[0]
+        points = gryds.Grid(SHAPES[ndim]).grid.reshape(ndim, -1)
+        return lambda: transform.jacobian(points)
+    return setup
+
+
+def _jacobian_det(ndim, chain, seed):
+    def setup():
+        rng = np.random.RandomState(seed)
+        transforms = _chain(chain, ndim, rng)
+        grid = gryds.Grid(SHAPES[ndim])
+        return lambda: grid.jacobian_det(*transforms)
+    return setup
+
+
+def benchmarks(seed=0):
+    """
+    Returns all benchmarks of the suite.
+
+    Args:
+        seed (int): The seed of the random images and transformations.
+    Returns:
+        list: A list of Benchmark objects.
+    """
+    cases = []
+    for ndim in sorted(SHAPES):
+        shape = 'x'.join(str(x) for x in SHAPES[ndim])
+        for chain in CHAINS:
+            for order in ORDERS:
+                cases.append(Benchmark(
+                    'transform.{}d.{}.order{}'.format(ndim, chain, order),
+                    _interpolation(ndim, order, chain, seed),
+                    ndim=ndim, shape=shape, chain=chain, order=order))
+        cases.append(Benchmark(
+            'jacobian.{}d.bspline'.format(ndim), _jacobian(ndim, seed),
+            ndim=ndim, shape=shape, chain='bspline'))
+        for chain in ('bspline', 'composed'):
+            cases.append(Benchmark(
+                'jacobian_det.{}d.{}'.format(ndim, chain),
+                _jacobian_det(ndim, chain, seed),
+                ndim=ndim, shape=shape, chain=chain))
+    for chain in ('affine', 'bspline'):
+        cases.append(Benchmark(
+            'multichannel.2d.{}.order3'.format(chain),
+            _multichannel(chain, seed),
+            ndim=2, shape='x'.join(str(x) for x in SHAPES[2] + (3,)),
+            chain=chain, order=3))
+    return cases
+
+
+def environment():
+    """Returns a description of the machine and library versions."""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count() if hasattr(os, 'cpu_count') else None,
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'dtype': np.dtype(config.DTYPE).name,
+        'workers': config.WORKERS,
+    }
+
+
+def run(patterns=None, repeat=5, warmup=1, seed=0, verbose=False):
+    """
+    Runs the benchmarks.
+
+    Args:
+        patterns (list): If given, only benchmarks whose names match any of
+            these shell-style patterns are run.
+        repeat (int): The number of timed runs per benchmark.
+        warmup (int): The number of untimed runs per benchmark.
+        seed (int): The seed of the random images and transformations.
+        verbose (bool): If True, every result is printed.
+    Returns:
+        dict: The results, with the environment and a dict of results per
+            benchmark name.
+    """
+    results = {}
+    for benchmark in benchmarks(seed):
+        if patterns and not any(fnmatch.fnmatch(benchmark.name, x)
+                                for x in patterns):
+            continue
+        results[benchmark.name] = benchmark.run(repeat=repeat, warmup=warmup)
+        if verbose:
+            print('{:<40} {:10.4f} s'.format(
+                benchmark.name, results[benchmark.name]['median']))
+    return {'environment': environment(), 'benchmarks': results}
+
+
+def compare(results, baseline, tolerance=0.2, statistic='median'):
+    """
+    Compares results with a baseline.
+
+    Args:
+        results (dict): Results of run().
+        baseline (dict): Results of run(), e.g. loaded from a stored file.
+        tolerance (float): The relative slowdown that is still accepted.
+        statistic (str): The statistic that is compared, e.g. 'median' or
+            'min'.
+    Returns:
+        dict: Per benchmark that is in both results, the ratio of the
+            result to the baseline, and whether it is a regression.
+    """
+    comparison = {}
+    for name, result in sorted(results['benchmarks'].items()):
+        if name not in baseline['benchmarks']:
+            continue
+        reference = baseline['benchmarks'][name][statistic]
+        ratio = result[statistic] / reference if reference > 0 else 1.
+        comparison[name] = {
+            'baseline': reference,
+            'result': result[statistic],
+            'ratio': ratio,
+            'regression': ratio > 1 + tolerance,
+        }
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Runs the gryds benchmark suite.')
+    parser.add_argument('--output', help='File the results are written to.')
+    parser.add_argument('--baseline',
+                        help='Results the new results are compared with.')
+    parser.add_argument('--filter', action='append', dest='patterns',
+                        help='Only run benchmarks matching this pattern, e.g. '
+                             '"transform.3d.*". Can be repeated.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs per benchmark.')
+    parser.add_argument('--warmup', type=int, default=1,
+                        help='Number of untimed runs per benchmark.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Accepted relative slowdown.')
+    parser.add_argument('--statistic', default='median',
+                        choices=['min', 'median', 'mean'],
+                        help='Statistic compared with the baseline.')
+    parser.add_argument('--list', action='store_true',
+                        help='List the benchmarks and exit.')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for benchmark in benchmarks():
+            print(benchmark.name)
+        return 0
+
+    results = run(args.patterns, repeat=args.repeat, warmup=args.warmup,
+                  verbose=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    comparison = compare(results, baseline, tolerance=args.tolerance,
+                         statistic=args.statistic)
+    print()
+    print('{:<40} {:>10} {:>10} {:>7}'.format(
+        'benchmark', 'baseline', 'result', 'ratio'))
+    for name, x in sorted(comparison.items()):
+        print('{:<40} {:10.4f} {:10.4f} {:7.2f}{}'.format(
+            name, x['baseline'], x['result'], x['ratio'],
+            '  REGRESSION' if x['regression'] else ''))
+    regressions = [x for x in comparison.values() if x['regression']]
+    if regressions:
+        print('\n{} of {} benchmarks are more than {:.0%} slower than the '
+              'baseline.'.format(len(regressions), len(comparison),
+                                 args.tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -133,3 +133,18 @@ class TestRotation(TestCase):
     def test_repr(self):
         self.assertEqual(str(gryds.AffineTransformation(2, angles=[0.4])), 'AffineTransformation(2D)')
 
+    def test_inverse(self):
+        trf = gryds.AffineTransformation(
+            ndim=3, angles=[0.1, -0.2, 0.3], scaling=[1.1, 0.9, 1.2],
+            translation=[0.1, 0, -0.1], center=[0.5, 0.5, 0.5])
+        points = np.random.rand(3, 10)
+        inverse = trf.inverse()
+        self.assertIsInstance(inverse, gryds.LinearTransformation)
+        np.testing.assert_almost_equal(
+            inverse.transform(trf.transform(points)), points, decimal=6)
+        np.testing.assert_almost_equal(
+            np.dot(inverse.augmented_matrix(), trf.augmented_matrix()),
+            np.eye(4), decimal=6)
+
+        with self.assertRaises(np.linalg.LinAlgError):
+            gryds.AffineTransformation(ndim=2, scaling=[1, 0]).inverse()
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+import tracemalloc
+from unittest import TestCase
+import numpy as np
+import gryds
+DTYPE = gryds.DTYPE
+
+
+def peak_memory(function):
+    """Returns the result of a function and the peak number of bytes that
+    were allocated while calling it."""
+    tracemalloc.start()
+    try:
+        result = function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+class TestAllocations(TestCase):
+    """Tests that transforming into preallocated buffers does not allocate
+    temporary arrays of the size of the points."""
+
+    def setUp(self):
+        self.points = np.random.rand(3, 64 ** 3).astype(DTYPE)
+        self.out = np.empty_like(self.points)
+
+    def test_linear_out(self):
+        trf = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3],
+                                         translation=[0.1, 0, 0])
+        result, peak = peak_memory(
+            lambda: trf.transform(self.points, out=self.out))
+        self.assertIs(result, self.out)
+        self.assertLess(peak, self.points.nbytes / 4)
+        np.testing.assert_almost_equal(result, trf.transform(self.points),
+                                       decimal=6)
+
+    def test_translation_out(self):
+        trf = gryds.TranslationTransformation([0.1, 0.2, 0.3])
+        result, peak = peak_memory(
+            lambda: trf.transform(self.points, out=self.out))
+        self.assertIs(result, self.out)
+        self.assertLess(peak, self.points.nbytes / 4)
+        np.testing.assert_equal(result, trf.transform(self.points))
+
+    def test_composed_out(self):
+        trf = gryds.ComposedTransformation(
+            gryds.TranslationTransformation([0.1, 0.2, 0.3]),
+            gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) / 10),
+            gryds.TranslationTransformation([0.1, 0.2, 0.3]),
+        )
+        result, peak = peak_memory(
+            lambda: trf.transform(self.points, out=self.out))
+        self.assertIs(result, self.out)
+        # One intermediate buffer for the chain of three transformations,
+        # the points scaled to the B-spline grid, and a chunk of stencils.
+        self.assertLess(peak, 3 * self.points.nbytes)
+        np.testing.assert_almost_equal(result, trf.transform(self.points),
+                                       decimal=6)
+
+    def test_interpolator_out(self):
+        image = np.random.rand(64, 64, 64).astype(DTYPE)
+        intp = gryds.Interpolator(image)
+        trf = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) / 10)
+        intp.transform(trf)  # Computes and caches the coefficients.
+        out = np.empty_like(image)
+        result, peak = peak_memory(lambda: intp.transform(trf, out=out))
+        self.assertIs(result, out)
+        # The transformed and rescaled grid, and the displacements of the
+        # B-spline transformation in double precision.
+        self.assertLess(peak, 4 * self.points.nbytes)
+        np.testing.assert_equal(result, intp.transform(trf))
@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import gryds
+DTYPE = gryds.DTYPE
+
+
+class TestBatchInterpolator(TestCase):
+
+    def test_batch_matches_single_images(self):
+        np.random.seed(0)
+        images = np.random.rand(4, 10, 12).astype(DTYPE)
+        transformations = [
+            gryds.AffineTransformation(ndim=2, angles=[0.1]),
+            [gryds.TranslationTransformation([0.1, 0]),
+             gryds.AffineTransformation(ndim=2, scaling=[1.1, 0.9])],
+            gryds.BSplineTransformation(np.random.rand(2, 3, 3) * 0.1),
+            [gryds.BSplineTransformation(np.random.rand(2, 3, 3) * 0.1),
+             gryds.TranslationTransformation([0.1, 0])],
+        ]
+        intp = gryds.BatchInterpolator(images, mode='mirror')
+        for workers in [1, 2]:
+            new_images = intp.transform(transformations, workers=workers)
+            self.assertEqual(new_images.shape, images.shape)
+            for image, transformation, new_image in zip(
+                    images, transformations, new_images):
+                if not isinstance(transformation, list):
+                    transformation = [transformation]
+                expected = gryds.Interpolator(image, mode='mirror').transform(
+                    *transformation)
+                np.testing.assert_almost_equal(new_image, expected, decimal=6)
+
+    def test_batch_linear_interpolator(self):
+        images = np.random.rand(2, 5, 5).astype(DTYPE)
+        trf = gryds.AffineTransformation(ndim=2, angles=[0.1])
+        intp = gryds.BatchInterpolator(images, gryds.LinearInterpolator)
+        np.testing.assert_almost_equal(
+            intp.transform([trf, trf])[1],
+            gryds.LinearInterpolator(images[1]).transform(trf))
+
+    def test_wrong_number_of_transformations(self):
+        intp = gryds.BatchInterpolator(np.random.rand(2, 5, 5))
+        trf = gryds.TranslationTransformation([0.1, 0])
+        self.assertRaises(ValueError, intp.transform, [trf])
+
+    def test_repr(self):
+        self.assertEqual(
+            str(gryds.BatchInterpolator(np.random.rand(3, 20, 20))),
+            'BatchInterpolator(2D, 3)')
@@ -0,0 +1,43 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', 'profiling'))
+
+import json
+from unittest import TestCase
+import benchmarks
+
+
+class TestBenchmarks(TestCase):
+
+    def test_names_are_unique(self):
+        names = [x.name for x in benchmarks.benchmarks()]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_run_and_compare(self):
+        results = benchmarks.run(['jacobian_det.2d.bspline'], repeat=2,
+                                 warmup=0)
+        self.assertEqual(list(results['benchmarks']),
+                         ['jacobian_det.2d.bspline'])
+        result = results['benchmarks']['jacobian_det.2d.bspline']
+        self.assertEqual(result['repeat'], 2)
+        self.assertLessEqual(result['min'], result['median'])
+        self.assertEqual(result['params']['ndim'], 2)
+        json.dumps(results)
+
+        comparison = benchmarks.compare(results, results)
+        self.assertAlmostEqual(
+            comparison['jacobian_det.2d.bspline']['ratio'], 1)
+        self.assertFalse(comparison['jacobian_det.2d.bspline']['regression'])
+
+        baseline = json.loads(json.dumps(results))
+        baseline['benchmarks']['jacobian_det.2d.bspline']['median'] /= 2
+        comparison = benchmarks.compare(results, baseline, tolerance=0.5)
+        self.assertTrue(comparison['jacobian_det.2d.bspline']['regression'])
+
+    def test_main(self):
+        self.assertEqual(benchmarks.main(['--list']), 0)
@@ -19,6 +19,26 @@ else:
     class TestBSplineCudaTransformation(TestCase):
         """Tests BSpline transformations, and associated effect on grids and Jacobians"""
 
+        def test_grid_transform_on_gpu(self):
+            trf = gryds.BSplineTransformationCuda(
+                np.random.rand(2, 4, 4) / 20)
+            calls = []
+            transform_points = trf._transform_points
+
+            def spy(points, out=None):
+                calls.append(points.shape)
+                return transform_points(points, out=out)
+
+            trf._transform_points = spy
+            grid = gryds.Grid((10, 20))
+            new_grid = grid.transform(trf)
+            self.assertEqual(calls, [(2, 200)])
+            np.testing.assert_almost_equal(
+                new_grid.grid,
+                gryds.BSplineTransformation(
+                    trf.parameters, order=1).transform_axes(grid.axes),
+                decimal=5)
+
         def test_translation_bspline_2d(self):
             bspline_grid = np.ones((2, 2, 2))
             trf = gryds.BSplineTransformationCuda(bspline_grid)
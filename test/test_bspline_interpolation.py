@@ -5,8 +5,11 @@ import os
 
 sys.path.append(os.path.abspath('../gryds'))
 
+import shutil
+import tempfile
 from unittest import TestCase
 import numpy as np
+import scipy.ndimage
 import gryds
 DTYPE = gryds.DTYPE
 
@@ -48,3 +51,145 @@ class TestBSplineInterpolator(TestCase):
 
     def test_repr(self):
         self.assertEqual(str(gryds.BSplineTransformation(np.random.rand(2, 5, 7))), 'BSplineTransformation(2D, 5x7)')
+
+    def test_cached_coefficients_match_prefilter(self):
+        np.random.seed(0)
+        image = np.random.rand(12, 10).astype(DTYPE)
+        points = np.random.rand(2, 50) * 14 - 2
+        for mode in ['constant', 'nearest', 'mirror', 'reflect', 'wrap',
+                     'grid-constant']:
+            intp = gryds.BSplineInterpolator(image, mode=mode, cval=0.5)
+            expected = scipy.ndimage.map_coordinates(
+                image, points, order=3, mode=mode, cval=0.5)
+            np.testing.assert_almost_equal(
+                intp.sample(points), expected, decimal=5)
+
+    def test_coefficient_cache(self):
+        image = np.random.rand(8, 8).astype(DTYPE)
+        intp = gryds.BSplineInterpolator(image)
+        intp.sample(np.random.rand(2, 5))
+        intp.sample(np.random.rand(2, 5))
+        self.assertEqual(len(intp._coefficients), 1)
+        intp.sample(np.random.rand(2, 5), mode='mirror')
+        self.assertEqual(len(intp._coefficients), 2)
+        intp.clear_cache()
+        self.assertEqual(len(intp._coefficients), 0)
+
+    def test_low_orders_are_not_cached(self):
+        labels = np.random.randint(0, 5, (8, 9)).astype(np.uint8)
+        points = np.random.rand(2, 20) * 8
+        for image in [labels, labels.astype(np.float16)]:
+            for order in [0, 1]:
+                intp = gryds.BSplineInterpolator(image, order=order)
+                expected = scipy.ndimage.map_coordinates(
+                    labels.astype(np.float64), points, order=order,
+                    mode='constant')
+                np.testing.assert_almost_equal(
+                    intp.sample(points, dtype=np.float64), expected)
+                intp.transform(gryds.TranslationTransformation([0.1, 0]))
+                self.assertEqual(intp._coefficients, {})
+
+    def test_affine_fast_path_matches_grid_path(self):
+        np.random.seed(0)
+        image = np.random.rand(12, 10, 8).astype(DTYPE)
+        trf1 = gryds.AffineTransformation(
+            ndim=3, angles=[0.1, 0.2, -0.1], scaling=[1.1, 0.9, 1],
+            center=[0.5, 0.5, 0.5])
+        trf2 = gryds.TranslationTransformation([0.01, -0.03, 0.02])
+        for mode in ['constant', 'nearest', 'mirror']:
+            intp = gryds.BSplineInterpolator(image, mode=mode)
+            fast = intp.transform(trf1, trf2)
+            intp._affine_fast_path = False
+            slow = intp.transform(trf1, trf2)
+            np.testing.assert_almost_equal(fast, slow, decimal=4)
+
+    def test_chunked_transform(self):
+        np.random.seed(0)
+        image = np.random.rand(12, 10, 8).astype(DTYPE)
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.1)
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, -0.1])
+        intp = gryds.BSplineInterpolator(image)
+        expected = intp.transform(bspline, affine)
+        np.testing.assert_almost_equal(
+            intp.transform(bspline, affine, chunk_shape=(5, 4, 8)),
+            expected, decimal=6)
+        np.testing.assert_almost_equal(
+            intp.transform(bspline, affine, max_memory=10000),
+            expected, decimal=6)
+
+    def test_lazy_resample(self):
+        image = np.random.rand(30, 40, 20).astype(DTYPE)
+        intp = gryds.Interpolator(image, mode='mirror')
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3],
+                                            center=[0.5, 0.5, 0.5])
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 5, 5, 5) / 30)
+        for chain in [(affine,), (bspline, affine)]:
+            expected = intp.transform(*chain)
+            lazy = intp.grid.transform(*chain, lazy=True)
+            for workers in [1, 3]:
+                intp.lazy_memory = 2 ** 16  # Many tiles.
+                np.testing.assert_almost_equal(
+                    intp.resample(lazy, workers=workers), expected,
+                    decimal=5)
+            # The lazy grid is not evaluated as a whole.
+            self.assertIsNone(lazy._grid)
+
+        out = np.empty(image.shape, dtype=np.float64)
+        result = intp.resample(lazy, order=1, out=out)
+        self.assertIs(result, out)
+        np.testing.assert_almost_equal(
+            result, intp.transform(*chain, order=1), decimal=5)
+
+    def test_dtype(self):
+        np.random.seed(0)
+        image = np.random.rand(12, 10, 8).astype(DTYPE)
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.1)
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, -0.1])
+        expected = gryds.BSplineInterpolator(image).transform(bspline, affine)
+        for dtype, decimal in [(np.float16, 2), (np.float64, 5)]:
+            intp = gryds.BSplineInterpolator(image, dtype=dtype)
+            for transforms in [(bspline, affine), (affine,)]:
+                new_image = intp.transform(*transforms)
+                self.assertEqual(new_image.dtype, dtype)
+                chunked_image = intp.transform(*transforms, chunk_shape=(5, 5, 5))
+                self.assertEqual(chunked_image.dtype, dtype)
+            np.testing.assert_almost_equal(new_image.astype(DTYPE),
+                                           intp.transform(affine, dtype=DTYPE),
+                                           decimal=decimal)
+            np.testing.assert_almost_equal(
+                intp.transform(bspline, affine).astype(DTYPE), expected,
+                decimal=decimal)
+
+    def test_memmap(self):
+        np.random.seed(0)
+        image = np.random.rand(40, 36, 32).astype(DTYPE)
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) / 10)
+        directory = tempfile.mkdtemp()
+        try:
+            np.save(os.path.join(directory, 'image.npy'), image)
+            mapped = np.load(os.path.join(directory, 'image.npy'),
+                             mmap_mode='r')
+            out = np.lib.format.open_memmap(
+                os.path.join(directory, 'out.npy'), mode='w+', dtype=DTYPE,
+                shape=image.shape)
+            for mode in ['constant', 'mirror', 'nearest', 'wrap']:
+                for order in [0, 1, 3, 5]:
+                    expected = gryds.BSplineInterpolator(
+                        image, mode=mode, order=order).transform(bspline)
+                    intp = gryds.BSplineInterpolator(mapped, mode=mode,
+                                                     order=order)
+                    result = intp.transform(bspline, chunk_shape=(8, 36, 32))
+                    np.testing.assert_almost_equal(result, expected,
+                                                   decimal=5)
+                    self.assertEqual(intp._coefficients, {})
+
+            # Tiles are written to a memory-mapped output.
+            result = gryds.BSplineInterpolator(mapped).transform(
+                bspline, out=out, max_memory=2 ** 16)
+            self.assertIs(result, out)
+            np.testing.assert_almost_equal(
+                out, gryds.BSplineInterpolator(image).transform(bspline),
+                decimal=5)
+            del mapped, out, result
+        finally:
+            shutil.rmtree(directory)
@@ -7,6 +7,7 @@ sys.path.append(os.path.abspath('../gryds'))
 
 from unittest import TestCase
 import numpy as np
+import scipy.ndimage
 import gryds
 DTYPE = gryds.DTYPE
 
@@ -67,8 +68,11 @@ class TestBSplineTransformation(TestCase):
 
         # The jacobian of this transformation should NOT be 1 everywhere, i.e.
         # scaling should have happened, and the new volume should be smaller
-        # as the top left has been folded in
-        self.assertTrue(np.all(grid.jacobian_det(trf) < np.array(1, DTYPE)))
+        # as the top left has been folded in. On the mirrored edge at i = 0
+        # the derivative of the displacement is exactly 0.
+        jacobian_det = grid.jacobian_det(trf)
+        self.assertTrue(np.all(jacobian_det[1:] < np.array(1, DTYPE)))
+        np.testing.assert_almost_equal(jacobian_det[0], np.array(1, DTYPE))
 
     def test_bspline_2d_folding(self):
         bspline_grid = np.array([
@@ -85,3 +89,138 @@ class TestBSplineTransformation(TestCase):
     def test_bspline_wrong_grid_size(self):
         bspline_grid = np.random.rand(3, 10, 10)
         self.assertRaises(ValueError, gryds.BSplineTransformation, bspline_grid)
+
+    def test_bspline_3d_matches_map_coordinates(self):
+        np.random.seed(0)
+        bspline_grid = np.random.rand(3, 4, 5, 6) * 0.1
+        points = np.random.rand(3, 100).astype(DTYPE)
+        for mode in ['mirror', 'reflect', 'constant', 'nearest']:
+            trf = gryds.BSplineTransformation(bspline_grid, mode=mode)
+            scaled_points = points * np.array([3, 4, 5], dtype=DTYPE)[:, None]
+            expected = points + np.array([
+                scipy.ndimage.map_coordinates(x, scaled_points, mode=mode)
+                for x in bspline_grid])
+            np.testing.assert_almost_equal(
+                trf.transform(points), expected, decimal=6)
+
+    def test_bspline_regular_grid_matches_points(self):
+        np.random.seed(0)
+        bspline_grid = np.random.rand(3, 4, 5, 6) * 0.1
+        trf = gryds.BSplineTransformation(bspline_grid)
+        grid = gryds.Grid((7, 8, 9))
+        expected = trf.transform(grid.grid.reshape(3, -1)).reshape(
+            grid.grid.shape)
+        np.testing.assert_almost_equal(
+            grid.transform(trf).grid, expected, decimal=6)
+
+        composed = gryds.ComposedTransformation(
+            trf, gryds.TranslationTransformation([0.1, 0, 0]))
+        np.testing.assert_almost_equal(
+            grid.transform(composed).grid[0], expected[0] + 0.1, decimal=6)
+
+    def test_bspline_dtype(self):
+        np.random.seed(0)
+        bspline_grid = np.random.rand(3, 4, 5, 6) * 0.1
+        points = np.random.rand(3, 100)
+        expected = gryds.BSplineTransformation(
+            bspline_grid, dtype=np.float64).transform(points)
+        self.assertEqual(expected.dtype, np.float64)
+
+        trf = gryds.BSplineTransformation(bspline_grid, dtype=np.float16)
+        self.assertEqual(trf.parameters.dtype, np.float16)
+        self.assertEqual(trf.transform(points).dtype, np.float16)
+        transformed = trf.transform(points, dtype=np.float64)
+        self.assertEqual(transformed.dtype, np.float64)
+        np.testing.assert_almost_equal(transformed, expected, decimal=3)
+
+    def test_bspline_jacobian_matches_finite_differences(self):
+        np.random.seed(0)
+        bspline_grid = np.random.rand(3, 4, 5, 6) * 0.1
+        points = np.random.rand(3, 50) * 0.8 + 0.1
+        step = 1e-6
+        for mode in ['mirror', 'constant', 'reflect']:
+            trf = gryds.BSplineTransformation(bspline_grid, mode=mode,
+                                              dtype=np.float64)
+            jacobian = trf.jacobian(points)
+            for j in range(3):
+                offset = np.zeros((3, 1))
+                offset[j] = step
+                expected = (trf.transform(points + offset) -
+                            trf.transform(points - offset)) / (2 * step)
+                np.testing.assert_almost_equal(jacobian[:, j], expected,
+                                               decimal=6)
+
+        trf = gryds.BSplineTransformation(bspline_grid, mode='nearest')
+        self.assertIsNone(trf.jacobian(points))
+
+    def test_bspline_jacobian_regular_grid(self):
+        np.random.seed(0)
+        bspline_grid = np.random.rand(3, 4, 5, 6) * 0.1
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3])
+        grid = gryds.Grid((7, 8, 9))
+        for transforms in [(gryds.BSplineTransformation(bspline_grid),),
+                           (gryds.BSplineTransformation(bspline_grid), affine),
+                           (affine, gryds.BSplineTransformation(bspline_grid))]:
+            dense_grid = gryds.Grid(grid=grid.grid)
+            np.testing.assert_almost_equal(
+                grid.jacobian(*transforms), dense_grid.jacobian(*transforms),
+                decimal=5)
+
+    def test_bspline_max_safe_scale(self):
+        np.random.seed(0)
+        grid = gryds.Grid((41, 41))
+        for mode in ['mirror', 'constant', 'reflect', 'grid-wrap']:
+            bspline_grid = np.random.randn(2, 5, 5)
+            trf = gryds.BSplineTransformation(bspline_grid, mode=mode)
+            scale = trf.max_safe_scale()
+            self.assertGreater(scale, 0)
+            self.assertFalse(trf.is_diffeomorphic_bound())
+            safe_trf = gryds.BSplineTransformation(
+                bspline_grid * 0.99 * scale, mode=mode)
+            self.assertTrue(safe_trf.is_diffeomorphic_bound())
+            self.assertGreater(grid.jacobian_det(safe_trf).min(), 0)
+
+        folding_trf = gryds.BSplineTransformation(np.array([
+            [[0.51, 0.51], [-0.5, -0.5]], [[0, 0], [0, 0]]]), order=1)
+        self.assertFalse(folding_trf.is_diffeomorphic_bound())
+        self.assertEqual(gryds.BSplineTransformation(
+            np.ones((2, 3, 3)), order=1).max_safe_scale(), np.inf)
+        self.assertEqual(gryds.BSplineTransformation(
+            np.ones((2, 3, 3)), mode='nearest').max_safe_scale(), 0)
+
+    def test_bspline_inverse(self):
+        np.random.seed(0)
+        trf = gryds.BSplineTransformation(
+            np.random.rand(3, 5, 5, 5) / 20 - 1 / 40, dtype=np.float64)
+        inverse = trf.inverse(tol=1e-8)
+        self.assertIs(inverse.inverse(), trf)
+
+        points = np.random.rand(3, 1000)
+        np.testing.assert_almost_equal(
+            trf.transform(inverse.transform(points)), points, decimal=8)
+        np.testing.assert_almost_equal(
+            inverse.transform(trf.transform(points)), points, decimal=7)
+
+        # The regular grid path starts from the separable displacement and
+        # Jacobian, and converges to the same points.
+        grid = gryds.Grid((8, 9, 10), dtype=np.float64)
+        np.testing.assert_almost_equal(
+            grid.transform(inverse).grid.reshape(3, -1),
+            inverse.transform(grid.grid.reshape(3, -1)), decimal=8)
+
+        # The Jacobian of the inverse inverts the Jacobian of T.
+        jacobian = inverse.jacobian(points)
+        forward = trf.jacobian(inverse.transform(points))
+        np.testing.assert_almost_equal(
+            np.einsum('ikn,kjn->ijn', jacobian, forward),
+            np.broadcast_to(np.eye(3)[..., None], jacobian.shape), decimal=6)
+
+    def test_bspline_inverse_fixed_point(self):
+        # Without an analytic Jacobian for mode='nearest', the inverse falls
+        # back to fixed-point iteration.
+        np.random.seed(0)
+        trf = gryds.BSplineTransformation(np.random.rand(2, 5, 5) / 40,
+                                          mode='nearest', dtype=np.float64)
+        points = np.random.rand(2, 100)
+        np.testing.assert_almost_equal(
+            trf.transform(trf.inverse().transform(points)), points, decimal=6)
@@ -87,3 +87,60 @@ class TestComposition(TestCase):
 
     def test_no_transformations_supplied(self):
         self.assertRaises(ValueError, gryds.ComposedTransformation)
+
+    def test_affine_fusion(self):
+        np.random.seed(0)
+        points = np.random.rand(3, 50).astype(DTYPE)
+        trf1 = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3])
+        trf2 = gryds.TranslationTransformation([0.1, 0, -0.2])
+        trf3 = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.1)
+        trf4 = gryds.AffineTransformation(ndim=3, scaling=[1.1, 0.9, 1.2])
+        trf5 = gryds.LinearTransformation(np.eye(3, 4) * 0.5)
+
+        trf = gryds.ComposedTransformation(trf1, trf2, trf3, trf4, trf5)
+        self.assertEqual(len(trf.fused_transformations), 3)
+        self.assertIs(trf.fused_transformations[1], trf3)
+        self.assertIsNone(trf.augmented_matrix())
+
+        expected = points
+        for t in [trf1, trf2, trf3, trf4, trf5]:
+            expected = t.transform(expected)
+        np.testing.assert_almost_equal(trf.transform(points), expected,
+                                       decimal=6)
+
+        affine = gryds.ComposedTransformation(trf1, trf2)
+        self.assertEqual(len(affine.fused_transformations), 1)
+        np.testing.assert_almost_equal(
+            affine.augmented_matrix(),
+            np.dot(trf2.augmented_matrix(), trf1.augmented_matrix()),
+            decimal=6)
+
+    def test_jacobian_chain_rule(self):
+        np.random.seed(0)
+        trf1 = gryds.AffineTransformation(ndim=2, angles=[0.3],
+                                          scaling=[1.2, 0.9])
+        trf2 = gryds.BSplineTransformation(np.random.rand(2, 5, 5) * 0.1,
+                                           dtype=np.float64)
+        composed = gryds.ComposedTransformation(trf1, trf2, trf1)
+        points = np.random.rand(2, 20)
+        expected = np.einsum(
+            'ikn,kjn->ijn', trf1.jacobian(trf2.transform(trf1.transform(
+                points))), np.einsum('ikn,kjn->ijn',
+                                     trf2.jacobian(trf1.transform(points)),
+                                     trf1.jacobian(points)))
+        np.testing.assert_almost_equal(composed.jacobian(points), expected,
+                                       decimal=5)
+
+    def test_inverse(self):
+        trf = gryds.ComposedTransformation(
+            gryds.AffineTransformation(ndim=2, angles=[0.2], scaling=[1.1, 1]),
+            gryds.BSplineTransformation(np.random.rand(2, 5, 5) * 0.05,
+                                        dtype=np.float64),
+            gryds.TranslationTransformation([0.1, 0.2]),
+        )
+        points = np.random.rand(2, 50)
+        inverse = trf.inverse()
+        self.assertEqual(len(inverse.transformations), 3)
+        np.testing.assert_almost_equal(
+            inverse.transform(trf.transform(points, dtype=np.float64),
+                              dtype=np.float64), points, decimal=5)
@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+import pickle
+from unittest import TestCase
+import numpy as np
+import gryds
+DTYPE = gryds.DTYPE
+
+
+class TestDisplacementFieldTransformation(TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.chain = [
+            gryds.BSplineTransformation(np.random.rand(2, 5, 5) / 20 - 0.025),
+            gryds.AffineTransformation(ndim=2, angles=[0.1],
+                                       center=[0.5, 0.5]),
+        ]
+
+    def test_grid_displacement(self):
+        grid = gryds.Grid((10, 12))
+        field = grid.displacement(*self.chain)
+        self.assertEqual(field.shape, (2, 10, 12))
+        expected = (grid.transform(*self.chain).grid - grid.grid) * \
+            np.array([10, 12])[:, None, None]
+        np.testing.assert_almost_equal(field, expected, decimal=5)
+
+        # Irregular grids give the same displacements.
+        irregular = gryds.Grid(grid=grid.grid)
+        np.testing.assert_almost_equal(irregular.displacement(*self.chain),
+                                       field, decimal=5)
+
+    def test_matches_chain_on_grid(self):
+        image = np.random.rand(20, 24).astype(DTYPE)
+        field = gryds.Grid(image.shape).displacement(*self.chain)
+        trf = gryds.DisplacementFieldTransformation(field)
+        intp = gryds.Interpolator(image)
+        np.testing.assert_almost_equal(intp.transform(trf),
+                                       intp.transform(*self.chain),
+                                       decimal=5)
+
+        # Off the grid, the field is interpolated linearly.
+        points = np.random.rand(2, 100) * 0.9
+        composed = gryds.ComposedTransformation(*self.chain)
+        error = np.abs(trf.transform(points) - composed.transform(points))
+        self.assertLess(error.max() * 24, 0.05)
+        np.testing.assert_almost_equal(
+            trf.transform_axes([np.arange(20) / 20., np.arange(24) / 24.]),
+            trf.transform(gryds.Grid((20, 24)).grid.reshape(2, -1)).reshape(
+                2, 20, 24), decimal=6)
+
+    def test_linear_interpolation(self):
+        field = np.zeros((1, 4))
+        field[0, 2] = 2
+        trf = gryds.DisplacementFieldTransformation(field, dtype=np.float64)
+        # Halfway between voxels 1 and 2, i.e. at 1.5 / 4.
+        np.testing.assert_almost_equal(trf.transform([[1.5 / 4]]),
+                                       [[1.5 / 4 + 1. / 4]])
+        np.testing.assert_almost_equal(trf.jacobian([[1.5 / 4]]),
+                                       [[[1 + 2]]])
+
+    def test_modes(self):
+        field = np.random.rand(2, 6, 7)
+        points = np.random.rand(2, 50) * 1.2 - 0.1
+        for mode in ['mirror', 'nearest', 'constant', 'reflect']:
+            trf = gryds.DisplacementFieldTransformation(field, mode=mode,
+                                                        dtype=np.float64)
+            expected = np.array([
+                gryds.Interpolator(x, mode=mode, order=1,
+                                   dtype=np.float64).sample(
+                    points * np.array([[6], [7]])) for x in field])
+            np.testing.assert_almost_equal(
+                trf.transform(points),
+                points + expected / np.array([[6], [7]]))
+
+    def test_jacobian_det(self):
+        grid = gryds.Grid((16, 16))
+        trf = gryds.DisplacementFieldTransformation(
+            grid.displacement(*self.chain))
+        # At the knots, the derivative of the linear interpolation is the
+        # forward difference, which is mirrored at the last knot.
+        np.testing.assert_almost_equal(
+            grid.jacobian_det(trf)[:-1, :-1],
+            grid.jacobian_det(*self.chain)[:-1, :-1], decimal=1)
+
+    def test_pickle(self):
+        trf = gryds.DisplacementFieldTransformation(np.random.rand(2, 5, 6))
+        copy = pickle.loads(pickle.dumps(trf))
+        np.testing.assert_equal(copy.parameters, trf.parameters)
+        points = np.random.rand(2, 10)
+        np.testing.assert_equal(copy.transform(points), trf.transform(points))
+
+    def test_repr(self):
+        trf = gryds.DisplacementFieldTransformation(np.zeros((2, 5, 6)))
+        self.assertEqual(str(trf), 'DisplacementFieldTransformation(2D, 5x6)')
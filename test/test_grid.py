@@ -82,3 +82,201 @@ class TestGrid(TestCase):
 
     def test_no_grid_no_shape(self):
         self.assertRaises(ValueError, gryds.Grid)
+
+    def test_regular_grid_is_lazy(self):
+        intp = gryds.Interpolator(np.zeros((10, 20)))
+        self.assertIsNone(intp.grid._grid)
+        self.assertEqual(intp.grid.shape, (10, 20))
+        self.assertEqual(intp.grid.ndim, 2)
+
+        scaled_grid = intp.grid.scaled_to((3, 4))
+        self.assertIsNone(scaled_grid._grid)
+        dense_grid = gryds.Grid(grid=gryds.Grid((10, 20)).grid)
+        np.testing.assert_equal(
+            scaled_grid.grid, dense_grid.scaled_to((3, 4)).grid)
+
+    def test_grid_points_region(self):
+        a_grid = gryds.Grid((10, 20, 5))
+        region = (slice(2, 4), slice(None), slice(1, 5, 2))
+        points = a_grid.points(region)
+        self.assertEqual(points.shape, (3, 2, 20, 2))
+        self.assertIsNone(a_grid._grid)
+        np.testing.assert_equal(points, a_grid.grid[(slice(None),) + region])
+        np.testing.assert_equal(a_grid.points(region), points)
+
+    def test_grid_axes_init(self):
+        a_grid = gryds.Grid(axes=[np.arange(3), np.arange(4) / 2.])
+        self.assertEqual(str(a_grid), 'Grid(2D, 3x4)')
+        self.assertEqual(a_grid.grid[1, 0, 3], np.array(1.5, dtype=DTYPE))
+
+    def test_grid_too_many_definitions(self):
+        self.assertRaises(ValueError, gryds.Grid, (2, 2), np.zeros((2, 2, 2)))
+
+    def test_grid_region(self):
+        a_grid = gryds.Grid((10, 20))
+        region = (slice(2, 5), slice(10, 20))
+        sub_grid = a_grid.region(region)
+        self.assertIsNone(sub_grid._grid)
+        np.testing.assert_equal(sub_grid.grid,
+                                a_grid.grid[(slice(None),) + region])
+        dense_grid = gryds.Grid(grid=a_grid.grid)
+        np.testing.assert_equal(dense_grid.region(region).grid, sub_grid.grid)
+
+    def test_chunk_regions(self):
+        regions = list(gryds.interpolators.grid.chunk_regions((5, 4), (2, 4)))
+        self.assertEqual(regions, [
+            (slice(0, 2), slice(0, 4)),
+            (slice(2, 4), slice(0, 4)),
+            (slice(4, 6), slice(0, 4))])
+
+    def test_memory_chunk_shape(self):
+        chunk_shape = gryds.interpolators.grid.memory_chunk_shape
+        self.assertEqual(chunk_shape((10, 20, 30), 6000, 10), (1, 20, 30))
+        self.assertEqual(chunk_shape((10, 20, 30), 600, 10), (1, 2, 30))
+        self.assertEqual(chunk_shape((10, 20, 30), 10 ** 9, 10), (10, 20, 30))
+        self.assertEqual(chunk_shape((10, 20, 30), 1, 10), (1, 1, 1))
+
+    def test_grid_dtype(self):
+        a_grid = gryds.Grid((10, 20), dtype=np.float64)
+        self.assertEqual(a_grid.grid.dtype, np.float64)
+        trf = gryds.TranslationTransformation([0.1, 0.2])
+        self.assertEqual(a_grid.transform(trf).grid.dtype, np.float64)
+        self.assertEqual(a_grid.scaled_to((10, 20)).grid.dtype, np.float64)
+        half_grid = gryds.Grid((10, 20), dtype=np.float64).astype(np.float16)
+        self.assertIsNone(half_grid._grid)
+        self.assertEqual(half_grid.transform(trf).grid.dtype, np.float16)
+        self.assertEqual(half_grid.grid.nbytes * 4, a_grid.grid.nbytes)
+
+    def test_determinant(self):
+        np.random.seed(0)
+        for ndim in [1, 2, 3, 4]:
+            matrices = np.random.rand(ndim, ndim, 5, 6)
+            np.testing.assert_almost_equal(
+                gryds.interpolators.grid.determinant(matrices),
+                np.linalg.det(np.transpose(matrices, (2, 3, 0, 1))))
+
+    def test_jacobian_det_chunks(self):
+        np.random.seed(0)
+        trf = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.3)
+        a_grid = gryds.Grid((10, 12, 14))
+        jacobian = np.transpose(a_grid.jacobian(trf), (2, 3, 4, 0, 1))
+        expected = np.linalg.det(jacobian)
+        np.testing.assert_almost_equal(a_grid.jacobian_det(trf), expected,
+                                       decimal=5)
+        np.testing.assert_almost_equal(
+            a_grid.jacobian_det(trf, chunk_shape=(3, 5, 14), workers=2),
+            expected, decimal=5)
+
+        stats = a_grid.jacobian_det_stats(trf, bins=4, hist_range=(-1, 3),
+                                          max_memory=10000)
+        self.assertAlmostEqual(stats['min'], expected.min(), places=5)
+        self.assertAlmostEqual(stats['max'], expected.max(), places=5)
+        self.assertAlmostEqual(stats['folded'], np.mean(expected <= 0))
+        counts, edges = stats['histogram']
+        np.testing.assert_equal(edges, [-1, 0, 1, 2, 3])
+        np.testing.assert_equal(counts, np.histogram(expected, edges)[0])
+        self.assertEqual(a_grid.has_folds(trf, max_memory=10000),
+                         bool(np.any(expected <= 0)))
+
+    def test_jacobian_det_finite_differences(self):
+        trf = gryds.BSplineTransformation(
+            np.array([[[0.51, 0.51], [-0.5, -0.5]], [[0, 0], [0, 0]]]),
+            order=1, mode='nearest')
+        a_grid = gryds.Grid((100, 20))
+        self.assertTrue(a_grid.has_folds(trf))
+        self.assertEqual(a_grid.jacobian_det_stats(trf)['folded'], 1)
+
+    def test_transform_coarse(self):
+        np.random.seed(0)
+        grid = gryds.Grid((33, 40, 18))
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3])
+        new_grid, error = grid.transform_coarse(affine, factor=4)
+        # Linear interpolation of an affine transformation is exact.
+        self.assertLess(error, 1e-4)
+        np.testing.assert_almost_equal(new_grid.grid,
+                                       grid.transform(affine).grid, decimal=5)
+
+        bspline = gryds.BSplineTransformation(
+            np.random.rand(3, 6, 6, 6) / 20 - 0.025)
+        exact = grid.transform(affine, bspline).grid
+        for factor in [2, (4, 8, 3), 8]:
+            new_grid, error = grid.transform_coarse(affine, bspline,
+                                                    factor=factor)
+            self.assertEqual(new_grid.shape, grid.shape)
+            actual = np.abs(new_grid.grid - exact) * \
+                np.array(grid.shape)[:, None, None, None]
+            self.assertGreater(error, 0)
+            self.assertLess(actual.max(), 1.5 * error)
+
+        new_grid, error = grid.transform_coarse(affine, bspline, tol=0.1)
+        self.assertLessEqual(error, 0.1)
+        _, coarse_error = grid.transform_coarse(affine, bspline, factor=16)
+        self.assertGreater(coarse_error, 0.1)
+
+    def test_transform_coarse_anisotropic(self):
+        grid = gryds.Grid((64, 64))
+        bspline = gryds.BSplineTransformation(
+            np.random.rand(2, 6, 6) / 10 - 0.05)
+        exact = grid.transform(bspline).grid
+        for factor in [(1, 8), (8, 1)]:
+            new_grid, error = grid.transform_coarse(bspline, factor=factor)
+            actual = (np.abs(new_grid.grid - exact) * 64).max()
+            self.assertGreater(error, 0)
+            self.assertLess(actual, 1.5 * error)
+
+    def test_transform_coarse_thin_axis(self):
+        grid = gryds.Grid((2, 64, 64))
+        bspline = gryds.BSplineTransformation(
+            np.random.rand(3, 4, 6, 6) / 10 - 0.05)
+        exact = grid.transform(bspline).grid
+        scaling = np.array(grid.shape)[:, None, None, None]
+        new_grid, error = grid.transform_coarse(bspline, factor=16)
+        actual = (np.abs(new_grid.grid - exact) * scaling).max()
+        self.assertGreater(error, 0.01)
+        self.assertLess(actual, 1.5 * error)
+
+        new_grid, error = grid.transform_coarse(bspline, tol=0.01)
+        self.assertLessEqual(error, 0.01)
+        actual = (np.abs(new_grid.grid - exact) * scaling).max()
+        self.assertLessEqual(actual, 0.01)
+
+    def test_transform_coarse_errors(self):
+        trf = gryds.TranslationTransformation([0.1, 0.1])
+        with self.assertRaises(ValueError):
+            gryds.Grid((10, 10)).transform_coarse(trf)
+        with self.assertRaises(ValueError):
+            gryds.Grid(grid=np.random.rand(2, 10, 10)).transform_coarse(
+                trf, factor=2)
+
+    def test_transformed_grid(self):
+        grid = gryds.Grid((12, 10, 8))
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, 0.3],
+                                            center=[0.5, 0.5, 0.5])
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) / 20)
+        lazy = grid.transform(affine, bspline, lazy=True)
+        self.assertIsInstance(lazy, gryds.TransformedGrid)
+        self.assertIsNone(lazy._grid)
+        self.assertEqual(lazy.shape, (12, 10, 8))
+        self.assertEqual(lazy.ndim, 3)
+        self.assertEqual(repr(lazy), 'TransformedGrid(3D, 12x10x8, 2 transforms)')
+
+        eager = grid.transform(affine, bspline)
+        region = (slice(2, 9), slice(None), slice(3, 5))
+        np.testing.assert_almost_equal(lazy.points(region),
+                                       eager.points(region), decimal=6)
+        np.testing.assert_almost_equal(lazy.region(region).grid,
+                                       eager.region(region).grid, decimal=6)
+        np.testing.assert_almost_equal(lazy.scaled_to([12, 10, 8]).grid,
+                                       eager.scaled_to([12, 10, 8]).grid,
+                                       decimal=5)
+        self.assertEqual(lazy.astype(np.float64).grid.dtype, np.float64)
+
+        # Chaining keeps the grid lazy until it is applied eagerly.
+        chained = grid.transform(affine, lazy=True).transform(bspline,
+                                                              lazy=True)
+        self.assertIsNone(chained._grid)
+        np.testing.assert_almost_equal(chained.grid, eager.grid, decimal=6)
+        np.testing.assert_almost_equal(
+            grid.transform(affine, lazy=True).transform(bspline).grid,
+            eager.grid, decimal=6)
+        np.testing.assert_equal(grid.transform(lazy=True).grid, grid.grid)
@@ -122,3 +122,13 @@ class TestLinearInterpolator(TestCase):
         grid = gryds.Grid(image.shape)
         gryds.LinearInterpolator(image).resample(grid, some_kwarg=42)
 
+
+    def test_lazy_resample(self):
+        image = np.random.rand(30, 40).astype(DTYPE)
+        intp = gryds.LinearInterpolator(image)
+        intp.lazy_memory = 2 ** 12  # Many tiles.
+        trf = gryds.BSplineTransformation(np.random.rand(2, 4, 4) / 20)
+        lazy = intp.grid.transform(trf, lazy=True)
+        np.testing.assert_almost_equal(intp.resample(lazy, workers=2),
+                                       intp.transform(trf))
+        self.assertIsNone(lazy._grid)
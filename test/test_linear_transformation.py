@@ -46,3 +46,15 @@ class TestLinear(TestCase):
         matrix = np.zeros((3, 30))
         self.assertRaises(ValueError, gryds.LinearTransformation, matrix)
         
+
+    def test_dtype(self):
+        matrix = np.array([[2, 0, 0.1], [0, 1, 0]])
+        points = np.random.rand(2, 10)
+        trf = gryds.LinearTransformation(matrix, dtype=np.float64)
+        self.assertEqual(trf.parameters.dtype, np.float64)
+        transformed = trf.transform(points)
+        self.assertEqual(transformed.dtype, np.float64)
+        np.testing.assert_equal(transformed,
+                                np.dot(matrix[:, :-1], points) + matrix[:, -1:])
+        self.assertEqual(trf.transform(points, dtype=np.float16).dtype,
+                         np.float16)
@@ -125,3 +125,55 @@ class TestMultiChannelInterpolator(TestCase):
         self.assertEqual(
             str(gryds.MultiChannelInterpolator(np.random.rand(3, 20, 20))),
             'MultiChannelInterpolator(2D, channels_last)')
+
+    def test_single_pass_matches_per_channel(self):
+        np.random.seed(0)
+        image = np.random.rand(8, 9, 7, 3).astype(DTYPE)
+        trf = gryds.BSplineTransformation(np.random.rand(3, 3, 3, 3) * 0.1)
+        for mode in ['constant', 'mirror', 'nearest']:
+            for data_format in ['channels_last', 'channels_first']:
+                channels = image if data_format == 'channels_last' else \
+                    np.moveaxis(image, -1, 0)
+                intp = gryds.MultiChannelInterpolator(
+                    channels, data_format=data_format, mode=mode,
+                    cval=[0.1, 0.2, 0.3])
+                new_image = intp.transform(trf)
+                if data_format == 'channels_first':
+                    new_image = np.moveaxis(new_image, 0, -1)
+                for i in range(3):
+                    expected = gryds.BSplineInterpolator(
+                        image[..., i], mode=mode, cval=0.1 * (i + 1)
+                    ).transform(trf)
+                    np.testing.assert_almost_equal(
+                        new_image[..., i], expected, decimal=5)
+
+    def test_single_pass_double_precision(self):
+        np.random.seed(0)
+        image = np.random.rand(3, 20, 24)
+        trf = gryds.BSplineTransformation(np.random.rand(2, 4, 4) / 20)
+        intp = gryds.MultiChannelInterpolator(
+            image, data_format='channels_first', mode='mirror',
+            dtype=np.float64)
+        new_image = intp.transform(trf)
+        self.assertTrue(new_image.flags.c_contiguous)
+        self.assertEqual(new_image.dtype, np.float64)
+        for i in range(3):
+            expected = gryds.BSplineInterpolator(
+                image[i], mode='mirror', dtype=np.float64).transform(trf)
+            np.testing.assert_almost_equal(new_image[i], expected,
+                                           decimal=12)
+
+    def test_lazy_resample(self):
+        image = np.random.rand(30, 40, 3).astype(DTYPE)
+        trf = gryds.BSplineTransformation(np.random.rand(2, 4, 4) / 20)
+        for data_format in ['channels_last', 'channels_first']:
+            channels = image if data_format == 'channels_last' else \
+                np.moveaxis(image, -1, 0)
+            intp = gryds.MultiChannelInterpolator(channels,
+                                                  data_format=data_format)
+            intp.lazy_memory = 2 ** 12  # Many tiles.
+            lazy = intp.grid.transform(trf, lazy=True)
+            np.testing.assert_almost_equal(
+                intp.resample(lazy, workers=2, order=1),
+                intp.transform(trf, order=1))
+            self.assertIsNone(lazy._grid)
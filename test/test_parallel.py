@@ -0,0 +1,57 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import gryds
+from gryds.parallel import parallel_map
+DTYPE = gryds.DTYPE
+
+
+class TestParallel(TestCase):
+    """Tests multi-threaded transformations against single-threaded ones."""
+
+    def test_parallel_map(self):
+        self.assertEqual(parallel_map(lambda x: x ** 2, range(10), workers=3),
+                         [x ** 2 for x in range(10)])
+
+    def test_nested_parallel_map(self):
+        def inner(x):
+            return sum(parallel_map(lambda y: x * y, range(4), workers=2))
+        self.assertEqual(parallel_map(inner, range(5), workers=2),
+                         [6 * x for x in range(5)])
+
+    def test_parallel_bspline_interpolator(self):
+        np.random.seed(0)
+        image = np.random.rand(20, 10, 8).astype(DTYPE)
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.1)
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0.2, -0.1])
+        intp = gryds.BSplineInterpolator(image)
+        for transforms in [(bspline, affine), (affine,)]:
+            expected = intp.transform(*transforms, workers=1)
+            np.testing.assert_almost_equal(
+                intp.transform(*transforms, workers=3), expected, decimal=6)
+
+    def test_parallel_linear_interpolator(self):
+        image = np.random.rand(20, 10).astype(DTYPE)
+        affine = gryds.AffineTransformation(ndim=2, angles=[0.1])
+        intp = gryds.LinearInterpolator(image)
+        np.testing.assert_almost_equal(
+            intp.transform(affine, workers=2), intp.transform(affine),
+            decimal=6)
+
+    def test_parallel_bspline_transformation(self):
+        np.random.seed(0)
+        points = np.random.rand(3, 200000).astype(DTYPE)
+        trf = gryds.BSplineTransformation(np.random.rand(3, 4, 4, 4) * 0.1)
+        expected = trf.transform(points)
+        gryds.config.WORKERS = 3
+        try:
+            result = trf.transform(points)
+        finally:
+            gryds.config.WORKERS = 1
+        np.testing.assert_equal(result, expected)
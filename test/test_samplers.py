@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import gryds
+from gryds.samplers import rotation_matrices
+from gryds.transformers.affine import rotation_matrix_2d, rotation_matrix_3d
+DTYPE = gryds.DTYPE
+
+
+class TestSamplers(TestCase):
+
+    def test_rotation_matrices(self):
+        angles = np.random.rand(4, 3)
+        np.testing.assert_almost_equal(
+            rotation_matrices(angles),
+            [rotation_matrix_3d(*x) for x in angles])
+        np.testing.assert_almost_equal(
+            rotation_matrices(angles[:, :1]),
+            [rotation_matrix_2d(*x) for x in angles[:, :1]])
+
+    def test_affine_sampler_seeded(self):
+        a = gryds.AffineSampler(3, angles=0.2, translation=0.1, rng=42)
+        b = gryds.AffineSampler(3, angles=0.2, translation=0.1,
+                                rng=np.random.default_rng(42))
+        np.testing.assert_equal(a.sample_parameters(5),
+                                b.sample_parameters(5))
+
+    def test_affine_sampler_matches_affine_transformation(self):
+        sampler = gryds.AffineSampler(2, angles=0.3, scaling=0.2,
+                                      translation=0.1, center=[0.4, 0.6],
+                                      rng=0)
+        # Draw the same parameters in the order of sample_parameters().
+        rng = np.random.default_rng(0)
+        angles = 0.3 * rng.uniform(-1, 1, size=(3, 1))
+        scaling = 1 + 0.2 * rng.uniform(-1, 1, size=(3, 2))
+        translation = 0.1 * rng.uniform(-1, 1, size=(3, 2))
+
+        trfs = sampler.sample(3)
+        self.assertEqual(len(trfs), 3)
+        for i, trf in enumerate(trfs):
+            expected = gryds.AffineTransformation(
+                ndim=2, angles=angles[i], scaling=scaling[i],
+                translation=translation[i], center=[0.4, 0.6])
+            np.testing.assert_almost_equal(trf.parameters,
+                                           expected.parameters, decimal=6)
+
+    def test_affine_sampler_ranges(self):
+        sampler = gryds.AffineSampler(3, scaling=0.1, isotropic=True, rng=1)
+        matrices = sampler.sample_parameters(100)
+        scaling = matrices[:, [0, 1, 2], [0, 1, 2]]
+        np.testing.assert_equal(scaling, scaling[:, :1].repeat(3, 1))
+        self.assertTrue(np.all(np.abs(scaling - 1) <= 0.1))
+        # Scaling about the center keeps the center in place.
+        np.testing.assert_almost_equal(
+            np.matmul(matrices, [0.5, 0.5, 0.5, 1]), 0.5)
+
+    def test_affine_sampler_single(self):
+        trf = gryds.AffineSampler(2, angles=0.1, rng=0)()
+        self.assertIsInstance(trf, gryds.LinearTransformation)
+        self.assertEqual(trf.parameters.dtype, DTYPE)
+
+    def test_affine_sampler_ndim(self):
+        with self.assertRaises(ValueError):
+            gryds.AffineSampler(4)
+
+    def test_bspline_sampler(self):
+        sampler = gryds.BSplineSampler((5, 6), scale=[0.1, 0.05], rng=3)
+        parameters = sampler.sample_parameters(10)
+        self.assertEqual(parameters.shape, (10, 2, 5, 6))
+        self.assertTrue(np.all(np.abs(parameters[:, 0]) <= 0.1))
+        self.assertTrue(np.all(np.abs(parameters[:, 1]) <= 0.05))
+        np.testing.assert_equal(
+            parameters,
+            gryds.BSplineSampler((5, 6), scale=[0.1, 0.05],
+                                 rng=3).sample_parameters(10))
+
+    def test_bspline_sampler_no_fold(self):
+        sampler = gryds.BSplineSampler((4, 4, 4), scale=0.5, no_fold=True,
+                                       rng=0)
+        for trf in sampler.sample(3):
+            self.assertTrue(trf.is_diffeomorphic_bound())
+            self.assertFalse(gryds.Grid((12, 12, 12)).has_folds(trf))
+
+        with self.assertRaises(ValueError):
+            gryds.BSplineSampler((4, 4), no_fold=True, mode='wrap')
+
+    def test_elastic_sampler(self):
+        sampler = gryds.ElasticSampler((32, 32), alpha=0.05, sigma=4, rng=0)
+        trfs = sampler.sample(2)
+        self.assertEqual(len(trfs), 2)
+        for trf in trfs:
+            self.assertIsInstance(trf, gryds.BSplineTransformation)
+            np.testing.assert_almost_equal(
+                np.abs(trf.parameters).max(axis=(1, 2)), 0.05)
+            # Smoothing leaves little difference between neighbours.
+            self.assertLess(
+                np.abs(np.diff(trf.parameters, axis=1)).max(), 0.02)
+
+    def test_batch_transform(self):
+        images = np.random.rand(4, 16, 16).astype(DTYPE)
+        batch = gryds.BatchInterpolator(images)
+        trfs = gryds.AffineSampler(2, angles=0.2, rng=0).sample(4)
+        result = batch.transform(trfs)
+        for image, trf, new_image in zip(images, trfs, result):
+            np.testing.assert_almost_equal(
+                new_image, gryds.Interpolator(image).transform(trf),
+                decimal=5)
+
+    def test_unif_rng(self):
+        a = gryds.utils.unif([1, 0.1], (2, 3, 4),
+                             rng=np.random.default_rng(0))
+        b = gryds.utils.unif([1, 0.1], (2, 3, 4),
+                             rng=np.random.default_rng(0))
+        np.testing.assert_equal(a, b)
+        self.assertEqual(a.shape, (2, 3, 4))
+        self.assertTrue(np.all(np.abs(a[1]) <= 0.1))
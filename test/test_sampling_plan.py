@@ -0,0 +1,62 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import gryds
+DTYPE = gryds.DTYPE
+
+
+class TestSamplingPlan(TestCase):
+
+    def test_bspline_plan(self):
+        np.random.seed(0)
+        images = np.random.rand(3, 10, 9, 8).astype(DTYPE)
+        bspline = gryds.BSplineTransformation(np.random.rand(3, 3, 3, 3) * 0.1)
+        affine = gryds.AffineTransformation(ndim=3, angles=[0.1, 0, 0.2])
+        for order in [1, 3]:
+            for mode in ['constant', 'mirror']:
+                intp = gryds.BSplineInterpolator(images[0], order=order,
+                                                 mode=mode)
+                plan = intp.plan(bspline, affine)
+                self.assertEqual(plan.stencil.indices[0].dtype, np.int32)
+                for image in images:
+                    expected = gryds.BSplineInterpolator(
+                        image, order=order, mode=mode).transform(
+                            bspline, affine)
+                    np.testing.assert_almost_equal(
+                        plan.apply(image), expected, decimal=5)
+
+    def test_linear_plan(self):
+        np.random.seed(0)
+        image = np.random.rand(10, 9).astype(DTYPE)
+        affine = gryds.AffineTransformation(ndim=2, angles=[0.1],
+                                            translation=[0.05, 0])
+        intp = gryds.LinearInterpolator(image)
+        plan = intp.plan(affine)
+        np.testing.assert_almost_equal(
+            plan.apply(image), intp.transform(affine), decimal=5)
+        other_image = np.random.rand(10, 9).astype(DTYPE)
+        np.testing.assert_almost_equal(
+            plan.apply(other_image),
+            gryds.LinearInterpolator(other_image).transform(affine),
+            decimal=5)
+
+    def test_plan_out(self):
+        image = np.random.rand(5, 6).astype(DTYPE)
+        plan = gryds.Interpolator(image).plan(
+            gryds.TranslationTransformation([0.1, 0.1]))
+        out = np.empty((5, 6), dtype=DTYPE)
+        self.assertIs(plan.apply(image, out=out), out)
+
+    def test_plan_shape_error(self):
+        plan = gryds.Interpolator(np.zeros((5, 6))).plan()
+        self.assertRaises(ValueError, plan.apply, np.zeros((6, 5)))
+
+    def test_repr(self):
+        plan = gryds.Interpolator(np.zeros((5, 6))).plan()
+        self.assertEqual(str(plan), 'SamplingPlan(2D, 5x6 -> 5x6, order=3)')
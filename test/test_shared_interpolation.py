@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+import pickle
+from unittest import TestCase
+import numpy as np
+import gryds
+from gryds.interpolators import shared
+DTYPE = gryds.DTYPE
+
+
+class TestSharedBatchInterpolator(TestCase):
+
+    def setUp(self):
+        self.images = np.random.rand(3, 20, 24).astype(DTYPE)
+        self.transformations = [
+            gryds.AffineTransformation(ndim=2, angles=[0.1]),
+            gryds.BSplineTransformation(np.random.rand(2, 4, 4) / 20),
+            [gryds.TranslationTransformation([0.1, 0]),
+             gryds.BSplineTransformation(np.random.rand(2, 4, 4) / 20)],
+        ]
+
+    def test_matches_batch_interpolator(self):
+        expected = gryds.BatchInterpolator(self.images).transform(
+            self.transformations)
+        with gryds.SharedBatchInterpolator(self.images,
+                                           processes=2) as batch:
+            result = batch.transform(self.transformations)
+            self.assertEqual(result.dtype, DTYPE)
+            np.testing.assert_equal(result, expected)
+
+            # New images replace the cached coefficients in the workers.
+            batch.update(self.images[::-1])
+            expected = gryds.BatchInterpolator(
+                self.images[::-1].copy()).transform(self.transformations)
+            result = batch.transform(self.transformations)
+            np.testing.assert_equal(result, expected)
+
+        # The result stays valid after the shared memory is released.
+        np.testing.assert_equal(result, expected)
+
+    def test_interpolator_options(self):
+        expected = gryds.BatchInterpolator(
+            self.images, mode='mirror', dtype=np.float64).transform(
+            self.transformations, order=1)
+        with gryds.SharedBatchInterpolator(self.images, processes=1,
+                                           mode='mirror',
+                                           dtype=np.float64) as batch:
+            result = batch.transform(self.transformations, order=1)
+            self.assertEqual(result.dtype, np.float64)
+            np.testing.assert_equal(result, expected)
+
+    def test_worker_cache_is_bounded(self):
+        with gryds.SharedBatchInterpolator(self.images, processes=1,
+                                           cache_size=2) as batch:
+            expected = batch.transform(self.transformations).copy()
+            # Run the worker's task in this process to inspect its cache.
+            shared._init_worker(batch._input.spec, batch._output.spec,
+                                batch.interpolator, {}, batch.cache_size)
+            try:
+                for _ in range(2):
+                    for i, trf in enumerate(self.transformations):
+                        chain = tuple(trf) if isinstance(trf, list) else \
+                            (trf,)
+                        shared._transform_image((i, chain, 0, {}))
+                        self.assertLessEqual(
+                            len(shared._worker['interpolators']), 2)
+                self.assertEqual(list(shared._worker['interpolators']),
+                                 [1, 2])
+                np.testing.assert_equal(batch._output, expected)
+            finally:
+                shared._worker.clear()
+
+    def test_errors(self):
+        with gryds.SharedBatchInterpolator(self.images,
+                                           processes=1) as batch:
+            with self.assertRaises(ValueError):
+                batch.transform(self.transformations[:2])
+            with self.assertRaises(ValueError):
+                batch.update(self.images[:2])
+
+    def test_pickle_without_caches(self):
+        image = self.images[0]
+        intp = gryds.Interpolator(image)
+        intp.grid.grid  # Materializes the dense grid.
+        trf = self.transformations[1]
+        intp.transform(trf)  # Caches coefficients.
+        self.assertLess(len(pickle.dumps(intp)), 2 * image.nbytes)
+        self.assertLess(len(pickle.dumps(trf)), trf.parameters.nbytes + 1000)
+
+        copy = pickle.loads(pickle.dumps(intp))
+        np.testing.assert_equal(copy.transform(trf), intp.transform(trf))
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import scipy.ndimage
+import gryds
+from gryds.stencil import BSplineStencil
+DTYPE = gryds.DTYPE
+
+
+class TestBSplineStencil(TestCase):
+    """Tests stencils against scipy's map_coordinates."""
+
+    def test_stencil_matches_map_coordinates(self):
+        np.random.seed(0)
+        shape = (7, 5, 6)
+        arrays = np.random.rand(3, *shape)
+        points = np.random.rand(3, 200) * 10 - 2
+        for mode in BSplineStencil.supported_modes:
+            for order in range(6):
+                if order > 1:
+                    coefficients = np.array([
+                        scipy.ndimage.spline_filter(x, order, mode=mode)
+                        for x in arrays])
+                else:
+                    coefficients = arrays
+                stencil = BSplineStencil(points, shape, order=order,
+                                         mode=mode, dtype=np.float64)
+                expected = np.array([
+                    scipy.ndimage.map_coordinates(x, points, order=order,
+                                                  mode=mode)
+                    for x in arrays])
+                np.testing.assert_almost_equal(
+                    stencil.apply(coefficients), expected, decimal=8)
+
+    def test_high_orders_single_precision(self):
+        np.random.seed(0)
+        shape = (7, 5, 6)
+        arrays = np.random.rand(2, *shape)
+        points = np.random.rand(3, 500) * 10 - 2
+        for order in [4, 5]:
+            coefficients = np.array([
+                scipy.ndimage.spline_filter(x, order, mode='mirror')
+                for x in arrays])
+            stencil = BSplineStencil(points, shape, order=order,
+                                     mode='mirror', dtype=np.float32)
+            expected = np.array([
+                scipy.ndimage.map_coordinates(x, points, order=order,
+                                              mode='mirror')
+                for x in arrays])
+            np.testing.assert_almost_equal(
+                stencil.apply(coefficients), expected, decimal=5)
+
+    def test_singleton_axis(self):
+        arrays = np.random.rand(2, 1, 6)
+        points = np.random.rand(2, 20) * 5
+        stencil = BSplineStencil(points, (1, 6), order=1, dtype=np.float64)
+        expected = np.array([
+            scipy.ndimage.map_coordinates(x, points, order=1, mode='mirror')
+            for x in arrays])
+        np.testing.assert_almost_equal(stencil.apply(arrays), expected)
+
+    def test_unsupported_mode(self):
+        self.assertRaises(ValueError, BSplineStencil, np.zeros((2, 3)),
+                          (4, 4), mode='nearest')
+
+    def test_wrong_coefficient_shape(self):
+        stencil = BSplineStencil(np.zeros((2, 3)), (4, 4))
+        self.assertRaises(ValueError, stencil.apply, np.zeros((2, 4, 5)))
+
+    def test_repr(self):
+        self.assertEqual(str(BSplineStencil(np.zeros((2, 3)), (4, 5))),
+                         'BSplineStencil(2D, 4x5, order=3)')
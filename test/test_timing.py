@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+
+import sys
+import os
+
+sys.path.append(os.path.abspath('../gryds'))
+
+from unittest import TestCase
+import numpy as np
+import gryds
+from gryds import timing
+DTYPE = gryds.DTYPE
+
+
+class TestTiming(TestCase):
+
+    def setUp(self):
+        self.image = np.random.rand(20, 24).astype(DTYPE)
+        self.bspline = gryds.BSplineTransformation(
+            np.random.rand(2, 4, 4) / 20)
+
+    def test_disabled(self):
+        self.assertIs(timing.stage('transform'), timing.stage('scaled_to'))
+
+    def test_recorder(self):
+        intp = gryds.Interpolator(self.image)
+        with timing.Recorder() as recorder:
+            intp.transform(self.bspline, gryds.TranslationTransformation(
+                [0.1, 0]), dtype=np.float16)
+        summary = recorder.summary()
+        for stage in ['grid_transform', 'transform', 'scaled_to',
+                      'prefilter', 'map_coordinates', 'cast']:
+            self.assertIn(stage, summary)
+        self.assertEqual(summary['map_coordinates']['points'],
+                         self.image.size)
+        self.assertEqual(summary['scaled_to']['nbytes'],
+                         2 * self.image.size * 4)
+
+        # Nested stages are not counted twice in the self times.
+        grid_transform = summary['grid_transform']
+        self.assertLess(grid_transform['self_seconds'],
+                        grid_transform['seconds'])
+        self.assertAlmostEqual(
+            grid_transform['seconds'] - grid_transform['self_seconds'],
+            summary['transform']['seconds'])
+
+        # Stages are not recorded after the recorder is closed.
+        count = len(recorder.records)
+        intp.transform(self.bspline)
+        self.assertEqual(len(recorder.records), count)
+
+    def test_callback(self):
+        records = []
+        timing.add_callback(records.append)
+        try:
+            gryds.Interpolator(self.image).transform(
+                gryds.AffineTransformation(ndim=2, angles=[0.1]),
+                workers=2)
+        finally:
+            timing.remove_callback(records.append)
+        stages = [x.stage for x in records]
+        self.assertGreater(stages.count('affine_transform'), 1)
+        self.assertEqual(sum(x.points for x in records
+                             if x.stage == 'affine_transform'),
+                         self.image.size)
+        for record in records:
+            self.assertGreaterEqual(record.seconds, record.self_seconds)
+        with self.assertRaises(ValueError):
+            timing.remove_callback(records.append)
+
+    def test_nested_transforms(self):
+        points = np.random.rand(2, 100).astype(DTYPE)
+        composed = gryds.ComposedTransformation(
+            self.bspline, gryds.TranslationTransformation([0.1, 0]))
+        with timing.Recorder() as recorder:
+            composed.transform(points)
+        summary = recorder.summary()
+        self.assertEqual(summary['composed_transform']['count'], 1)
+        self.assertEqual(summary['transform']['count'], 2)
+        self.assertLessEqual(summary['transform']['seconds'],
+                             summary['composed_transform']['seconds'])
+
+        # The forward transforms of an inverse run inside its own stage, and
+        # are not counted twice.
+        inverse = self.bspline.inverse()
+        with timing.Recorder() as recorder:
+            inverse.transform(points)
+        outer = [x for x in recorder.records if not x.recursive]
+        self.assertEqual(len(outer), 1)
+        self.assertGreater(len(recorder.records), 1)
+        summary = recorder.summary()
+        self.assertEqual(summary['transform']['seconds'], outer[0].seconds)
+        self.assertAlmostEqual(
+            summary['transform']['self_seconds'], outer[0].seconds)
+
+    def test_plan_and_multichannel(self):
+        image = np.random.rand(20, 24, 3).astype(DTYPE)
+        with timing.Recorder() as recorder:
+            gryds.MultiChannelInterpolator(image).transform(self.bspline)
+            gryds.Interpolator(self.image).plan(self.bspline).apply(
+                self.image)
+        summary = recorder.summary()
+        self.assertEqual(summary['sample']['count'], 2)
+        self.assertEqual(summary['prefilter']['count'], 2)
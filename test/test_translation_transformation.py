@@ -52,3 +52,10 @@ class TestTranslation(TestCase):
 
     def test_repr(self):
         self.assertEqual(str(gryds.TranslationTransformation([3, 4])), 'TranslationTransformation(2D, t=[3 4])')
+
+    def test_inverse(self):
+        trf = gryds.TranslationTransformation([0.1, -0.2, 0.3])
+        points = np.random.rand(3, 10).astype(DTYPE)
+        np.testing.assert_almost_equal(
+            trf.inverse().transform(trf.transform(points)), points)
+        self.assertIsInstance(trf.inverse(), gryds.TranslationTransformation)
@@ -46,6 +46,13 @@ class TestUtils(TestCase):
             np.all(random_grid >= -.000628141)
         )
 
+    def test_max_no_fold_does_not_fold(self):
+        np.random.seed(0)
+        for size in [(2, 4, 5), (3, 4, 4, 4)]:
+            random_grid = gryds.utils.max_no_fold(size)
+            trf = gryds.BSplineTransformation(random_grid)
+            self.assertFalse(gryds.Grid((20, 20, 20)[:size[0]]).has_folds(trf))
+
 
     def test_phantom(self):
         phantom = gryds.utils.phantom_image((3, 10), spacing=4)